@@ -5,16 +5,31 @@ Excel转置处理Web应用
 支持上传Excel文件，按照要求转置表格，处理完后可以下载
 """
 
-from flask import Flask, request, render_template, send_file, jsonify, flash, redirect, url_for
-import pandas as pd
-import openpyxl
+from flask import Flask, request, render_template, send_file, jsonify, Response, stream_with_context
+import json
 import os
-import tempfile
+import time
 import uuid
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from urllib.parse import quote
+from markupsafe import escape
+from werkzeug.exceptions import HTTPException
 import traceback
 
+import batch_upload
+import brand_summary
+import chunked_upload
+import janitor
+import job_process
+import jobs
+import metrics
+import output_bundle
+import preflight
+import result_cache
+import scheduler
+import transpose_engine
+import warehouse
+
 app = Flask(__name__)
 app.secret_key = 'excel_transpose_secret_key_2025'
 
@@ -22,6 +37,12 @@ app.secret_key = 'excel_transpose_secret_key_2025'
 UPLOAD_FOLDER = 'uploads'
 OUTPUT_FOLDER = 'outputs'
 ALLOWED_EXTENSIONS = {'xlsx', 'xls'}
+# 下载响应的缓存时间（秒），过期后客户端用ETag重新验证
+DOWNLOAD_MAX_AGE = 24 * 3600
+# 预览允许请求的最大数据行数
+PREVIEW_MAX_ROWS = 500
+# 普通上传的请求体上限，与分块上传的文件大小上限相同（MAX_UPLOAD_MB）
+app.config['MAX_CONTENT_LENGTH'] = chunked_upload.MAX_UPLOAD_BYTES
 
 # 确保目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -31,215 +52,291 @@ def allowed_file(filename):
     """检查文件扩展名是否允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def transpose_source_data_sheet(ws):
-    """转置信源数据分析工作表"""
-    print("处理信源数据分析工作表...")
-    
-    # 识别合并单元格中的品牌
-    brand_columns = {}
-    merged_ranges = list(ws.merged_cells.ranges)
-    
-    for merged_range in merged_ranges:
-        top_left_cell = ws[merged_range.min_row][merged_range.min_col-1]
-        brand_name = top_left_cell.value
-        if brand_name and isinstance(brand_name, str) and brand_name.strip():
-            brand_columns[brand_name] = {
-                'start_col': merged_range.min_col,
-                'end_col': merged_range.max_col
-            }
-    
-    # 提取数据
-    data_rows = []
-    data_start_row = 3  # 数据从第3行开始
-    
-    for row_idx in range(data_start_row, ws.max_row + 1):
-        # 获取基础信息
-        keyword = ws.cell(row=row_idx, column=1).value
-        ai_platform = ws.cell(row=row_idx, column=2).value
-        source_platform = ws.cell(row=row_idx, column=3).value
-        total_articles = ws.cell(row=row_idx, column=4).value
-        
-        if keyword is None or keyword == '':
-            continue
-        
-        # 为每个品牌提取数据
-        for brand_name, col_info in brand_columns.items():
-            start_col = col_info['start_col']
-            end_col = col_info['end_col']
-            
-            # 检查该品牌是否有有效数据
-            has_data = False
-            for col_idx in range(start_col, end_col + 1):
-                if col_idx <= ws.max_column:
-                    cell_value = ws.cell(row=row_idx, column=col_idx).value
-                    if cell_value is not None and cell_value != '' and cell_value != 0:
-                        has_data = True
-                        break
-            
-            # 只有当品牌有数据时才添加行
-            if has_data:
-                row_data = {
-                    '关键词名称': keyword,
-                    'AI平台': ai_platform,
-                    '信源平台名称': source_platform,
-                    '选用信源文章总数': total_articles,
-                    '品牌': brand_name.split('(')[0],  # 提取品牌名称
-                    '品牌类型': '客户' if '客户' in brand_name else '竞品'
-                }
-                
-                # 添加该品牌对应的数据列
-                for col_idx in range(start_col, end_col + 1):
-                    if col_idx <= ws.max_column:
-                        cell_value = ws.cell(row=row_idx, column=col_idx).value
-                        if col_idx == start_col:
-                            row_data['选用信源文章占比'] = cell_value
-                        elif col_idx == start_col + 1:
-                            row_data['选用信源文章数'] = cell_value
-                
-                data_rows.append(row_data)
-    
-    return pd.DataFrame(data_rows)
+def record_sheet_metrics(layout, seconds, output_rows, success):
+    """转置引擎的回调：记录单个工作表的耗时、行数和成败"""
+    if success:
+        metrics.SHEET_DURATION_SECONDS.observe(seconds, layout=layout)
+        metrics.SHEET_OUTPUT_ROWS.observe(output_rows, layout=layout)
+    metrics.SHEETS_TOTAL.inc(layout=layout, status='success' if success else 'failure')
 
-def transpose_keyword_data_sheet(ws):
-    """转置关键词数据分析工作表"""
-    print("处理关键词数据分析工作表...")
-    
-    # 识别合并单元格中的品牌
-    brand_columns = {}
-    merged_ranges = list(ws.merged_cells.ranges)
+def request_filters(data):
+    """从表单或JSON中取出筛选条件：brands、keywords、platforms、metrics，逗号分隔"""
+    return transpose_engine.parse_filters(
+        *(data.get(field) for field in transpose_engine.FILTER_FIELDS))
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """请求体超过 MAX_CONTENT_LENGTH 时返回JSON，页面可以直接显示错误信息"""
+    return jsonify({'error': f'文件超过 {chunked_upload.MAX_UPLOAD_BYTES // 1024 // 1024} MB 的上限',
+                    'max_size': chunked_upload.MAX_UPLOAD_BYTES}), 413
+
+@app.route('/')
+def index():
+    """主页"""
+    return render_template('index.html')
+
+def transpose_uploaded_file(input_path, filename, unique_id, filters=None, mode='auto',
+                            should_cancel=None, report_date=None):
+    """
+    对已保存的上传文件执行转置，普通上传和分块上传共用
+    filters 为筛选条件，只输出选中的品牌、关键词、AI平台和指标；mode 为预检选择的写出方式
+    转置在子进程中执行，should_cancel 返回True或超出运行时间/CPU上限时终止，
+    并删除写了一半的输出文件（抛出 job_process.JobAborted）
+    设置了 WAREHOUSE_PATH 时转置结果同时写入数据仓库，report_date 缺省时取文件名中的日期
+
+    返回:
+    tuple: (响应JSON字典, HTTP状态码)
+    """
+    metrics.UPLOAD_SIZE_BYTES.observe(os.path.getsize(input_path))
     
-    for merged_range in merged_ranges:
-        top_left_cell = ws[merged_range.min_row][merged_range.min_col-1]
-        brand_name = top_left_cell.value
-        if brand_name and isinstance(brand_name, str) and brand_name.strip():
-            brand_columns[brand_name] = {
-                'start_col': merged_range.min_col,
-                'end_col': merged_range.max_col
-            }
+    # 生成输出文件名
+    base_name = os.path.splitext(filename)[0]
+    current_date = datetime.now().strftime("%Y%m%d")
+    output_filename = f"{base_name}_{current_date}_完整转置完成.xlsx"
+    output_path = os.path.join(OUTPUT_FOLDER, f"{unique_id}_{output_filename}")
+    summary_path = brand_summary.summary_path_for(output_path)
+    cache_dir = result_cache.job_cache_dir(unique_id)
+    sinks = None
+    if warehouse.WAREHOUSE_PATH:
+        sinks = [warehouse.WarehouseSink(report_date or warehouse.report_date_from_name(filename), filename)]
     
-    # 提取数据
-    data_rows = []
-    data_start_row = 3  # 数据从第3行开始
+    # 处理转置
+    metrics.JOBS_IN_PROGRESS.inc()
+    start_time = time.perf_counter()
+    results = None
+    try:
+        results, sheet_events = job_process.run_transpose(
+            input_path, output_path, filters, mode, should_cancel=should_cancel, cache_dir=cache_dir,
+            sinks=sinks)
+        for event in sheet_events:
+            record_sheet_metrics(*event)
+    except job_process.JobAborted as e:
+        metrics.JOBS_TOTAL.inc(status=e.reason)
+        raise
+    finally:
+        metrics.JOBS_IN_PROGRESS.dec()
+        metrics.JOB_DURATION_SECONDS.observe(time.perf_counter() - start_time)
+        # 清理上传文件和未完成的输出文件
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        if results is None:
+            for path in (output_path, summary_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            result_cache.remove_cache(cache_dir)
+    metrics.JOBS_TOTAL.inc(status='success' if results is not None else 'failure')
     
-    for row_idx in range(data_start_row, ws.max_row + 1):
-        # 获取基础信息
-        keyword = ws.cell(row=row_idx, column=1).value
-        ai_platform = ws.cell(row=row_idx, column=2).value
-        
-        if keyword is None or keyword == '':
-            continue
-        
-        # 为每个品牌提取数据
-        for brand_name, col_info in brand_columns.items():
-            start_col = col_info['start_col']
-            end_col = col_info['end_col']
-            
-            # 检查该品牌是否有有效数据
-            has_data = False
-            for col_idx in range(start_col, end_col + 1):
-                if col_idx <= ws.max_column:
-                    cell_value = ws.cell(row=row_idx, column=col_idx).value
-                    if cell_value is not None and cell_value != '' and cell_value != 0:
-                        has_data = True
-                        break
-            
-            # 只有当品牌有数据时才添加行
-            if has_data:
-                row_data = {
-                    '关键词名称': keyword,
-                    'AI平台名称': ai_platform,
-                    '品牌': brand_name.split('(')[0],  # 提取品牌名称
-                    '品牌类型': '客户' if '客户' in brand_name else '竞品'
-                }
-                
-                # 添加该品牌对应的数据列
-                for col_idx in range(start_col, end_col + 1):
-                    if col_idx <= ws.max_column:
-                        cell_value = ws.cell(row=row_idx, column=col_idx).value
-                        if col_idx == start_col:
-                            row_data['可见概率'] = cell_value
-                        elif col_idx == start_col + 1:
-                            row_data['推荐概率'] = cell_value
-                        elif col_idx == start_col + 2:
-                            row_data['信源平台占比'] = cell_value
-                        elif col_idx == start_col + 3:
-                            row_data['信源文章占比'] = cell_value
-                        elif col_idx == start_col + 4:
-                            row_data['Top1占比'] = cell_value
-                        elif col_idx == start_col + 5:
-                            row_data['Top前3占比'] = cell_value
-                        elif col_idx == start_col + 6:
-                            row_data['Top前5占比'] = cell_value
-                        elif col_idx == start_col + 7:
-                            row_data['Top前10占比'] = cell_value
-                
-                data_rows.append(row_data)
+    if results is None:
+        return {'error': '转置处理失败'}, 500
     
-    return pd.DataFrame(data_rows)
+    return {
+        'success': True,
+        'message': '转置处理完成',
+        'download_url': f'/download/{unique_id}_{output_filename}',
+        'results_url': f'/results/{unique_id}' if os.path.isdir(cache_dir) else None,
+        'summary_url': (f'/download/{os.path.basename(summary_path)}'
+                        if os.path.exists(summary_path) else None),
+        'results': results
+    }, 200
+
+def client_id():
+    """
+    区分用户，用于按用户公平调度
+    页面为每个浏览器生成 X-Client-Id；经过frp等代理时remote_addr相同，其次使用X-Forwarded-For
+    """
+    value = request.headers.get('X-Client-Id', '').strip()
+    if value and len(value) <= 64:
+        return value
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    return forwarded.split(',')[0].strip() or request.remote_addr or 'anonymous'
+
+def run_transpose_job(job):
+    """调度器领取任务后在后台执行转置，结果写入任务记录"""
+    job_id = job['job_id']
+    filters = transpose_engine.parse_filters(
+        *((job.get('filters') or {}).get(field) for field in transpose_engine.FILTER_FIELDS))
+
+    def should_cancel():
+        try:
+            return bool(jobs.get_job(UPLOAD_FOLDER, job_id).get('cancel_requested'))
+        except jobs.JobError:
+            # 任务记录已被清理
+            return True
 
-def process_excel_transpose(input_file_path, output_file_path):
-    """处理Excel转置"""
     try:
-        # 读取原始文件
-        wb_original = openpyxl.load_workbook(input_file_path, data_only=True)
-        print(f"原始文件工作表: {wb_original.sheetnames}")
-        
-        results = {}
-        
-        # 处理信源数据分析工作表
-        if "信源数据分析" in wb_original.sheetnames:
-            ws_original = wb_original["信源数据分析"]
-            df_transposed = transpose_source_data_sheet(ws_original)
-            results["信源数据分析"] = df_transposed
-        
-        # 处理关键词数据分析工作表
-        if "关键词数据分析" in wb_original.sheetnames:
-            ws_original = wb_original["关键词数据分析"]
-            df_transposed = transpose_keyword_data_sheet(ws_original)
-            results["关键词数据分析"] = df_transposed
-        
-        # 使用pandas保存所有工作表
-        with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
-            # 保存转置后的信源数据分析
-            if "信源数据分析" in results and results["信源数据分析"] is not None:
-                results["信源数据分析"].to_excel(writer, sheet_name='信源数据分析', index=False)
-                print(f"信源数据分析转置完成: {results['信源数据分析'].shape}")
-            
-            # 保存转置后的关键词数据分析
-            if "关键词数据分析" in results and results["关键词数据分析"] is not None:
-                results["关键词数据分析"].to_excel(writer, sheet_name='关键词数据分析', index=False)
-                print(f"关键词数据分析转置完成: {results['关键词数据分析'].shape}")
-            
-            # 其他工作表直接复制
-            for sheet_name in wb_original.sheetnames:
-                if sheet_name not in ["信源数据分析", "关键词数据分析"]:
-                    ws_original = wb_original[sheet_name]
-                    # 读取原工作表数据
-                    data = []
-                    for row in ws_original.iter_rows(values_only=True):
-                        data.append(row)
-                    
-                    # 创建DataFrame并保存
-                    df = pd.DataFrame(data)
-                    df.to_excel(writer, sheet_name=sheet_name, index=False, header=False)
-                    print(f"复制工作表: {sheet_name}")
-        
-        return results
-        
+        payload, status = transpose_uploaded_file(
+            job['input_path'], job['filename'], job_id, filters, job['mode'], should_cancel,
+            job.get('report_date'))
+        job_status = jobs.STATUS_DONE if status == 200 else jobs.STATUS_FAILED
+    except job_process.JobAborted as e:
+        print(f"任务 {job_id} 已终止: {str(e)}")
+        payload = {'error': str(e), 'reason': e.reason}
+        job_status = (jobs.STATUS_CANCELLED if e.reason == job_process.REASON_CANCELLED
+                      else jobs.STATUS_FAILED)
     except Exception as e:
-        print(f"处理过程中出现错误: {str(e)}")
         traceback.print_exc()
+        payload, job_status = {'error': f'处理过程中出现错误: {str(e)}'}, jobs.STATUS_FAILED
+    try:
+        scheduler.finish_job(UPLOAD_FOLDER, job_id, job_status, result=payload)
+    except jobs.JobError:
+        pass
+
+def start_job_scheduler():
+    """启动本进程的任务调度线程，gunicorn每个工作进程fork后各启动一个"""
+    scheduler.start(UPLOAD_FOLDER, run_transpose_job)
+
+def request_report_date(data):
+    """表单或JSON中的报告日期 report_date（YYYY-MM-DD），用于写入数据仓库；缺省为None，格式错误抛出 ValueError"""
+    value = (data.get('report_date') or '').strip()
+    return warehouse.normalize_date(value) if value else None
+
+def submit_transpose_job(input_path, filename, unique_id, filters=None, user=None, report_date=None):
+    """
+    预检上传文件并提交到调度队列，立即返回任务ID、规模估计和排队位置
+
+    返回:
+    tuple: (响应JSON字典, HTTP状态码)
+    """
+    try:
+        estimate = preflight.preflight(input_path)
+    except Exception as e:
+        print(f"预检失败: {str(e)}")
+        os.remove(input_path)
+        return {'error': '无法读取文件，请确认是有效的Excel文件'}, 400
+    if estimate['rejected']:
+        os.remove(input_path)
+        metrics.JOBS_TOTAL.inc(status='rejected')
+        return {'error': estimate['reason'], 'estimate': estimate}, 413
+
+    jobs.create_job(
+        UPLOAD_FOLDER, unique_id, filename, estimate=estimate, user=user, input_path=input_path,
+        mode=estimate['mode'], report_date=report_date,
+        filters={field: sorted(values) for field, values in (filters or {}).items()})
+    start_job_scheduler()
+    scheduler.notify()
+    return {
+        'success': True,
+        'job_id': unique_id,
+        'status_url': f'/jobs/{unique_id}',
+        'estimate': estimate,
+        'queue_position': scheduler.queue_position(UPLOAD_FOLDER, unique_id),
+    }, 202
+
+def save_uploaded_file(file):
+    """
+    保存表单上传的文件，文件名前加唯一ID
+
+    返回:
+    tuple: (保存路径, 原始文件名, 唯一ID)
+    """
+    unique_id = str(uuid.uuid4())
+    filename = chunked_upload.safe_filename(file.filename, unique_id[:8])
+    input_path = os.path.join(UPLOAD_FOLDER, f"{unique_id}_{filename}")
+    file.save(input_path)
+    return input_path, filename, unique_id
+
+def find_preview_upload(preview_id):
+    """
+    查找预览时保存的上传文件，不存在（无效ID或已被自动清理）时返回None
+
+    返回:
+    tuple: (保存路径, 原始文件名, 规范化的预览ID)
+    """
+    try:
+        preview_id = str(uuid.UUID(preview_id))
+    except (TypeError, ValueError):
         return None
+    prefix = f"{preview_id}_"
+    for name in os.listdir(UPLOAD_FOLDER):
+        path = os.path.join(UPLOAD_FOLDER, name)
+        if name.startswith(prefix) and os.path.isfile(path):
+            return path, name[len(prefix):], preview_id
+    return None
 
-@app.route('/')
-def index():
-    """主页"""
-    return render_template('index.html')
+def preview_tables(results):
+    """把预览结果转换为可JSON序列化的 {工作表: {columns, data}}，日期转为ISO格式字符串"""
+    tables = {}
+    for sheet_name, df in results.items():
+        table = json.loads(df.to_json(orient='split', index=False, date_format='iso', force_ascii=False))
+        tables[sheet_name] = {'columns': table['columns'], 'data': table['data']}
+    return tables
+
+@app.route('/preview', methods=['POST'])
+def preview_file():
+    """
+    转置预览：只读取每个工作表的表头和前 rows 行数据（默认 transpose_engine.PREVIEW_ROWS），
+    返回转置后的长表和完整任务的预检估计；?format=html 时返回HTML表格片段
+    上传的文件保留在服务器上，随后用 preview_id 提交完整转置，无需再次上传
+    """
+    try:
+        rows = min(int(request.form.get('rows', transpose_engine.PREVIEW_ROWS)), PREVIEW_MAX_ROWS)
+    except ValueError:
+        return jsonify({'error': '预览行数必须是整数'}), 400
+    if rows < 1:
+        return jsonify({'error': '预览行数必须大于0'}), 400
+
+    file = request.files.get('file')
+    if file is not None and file.filename:
+        if not allowed_file(file.filename):
+            return jsonify({'error': '不支持的文件格式，请上传.xlsx或.xls文件'}), 400
+        input_path, filename, preview_id = save_uploaded_file(file)
+    else:
+        preview_id = request.form.get('preview_id', '')
+        found = find_preview_upload(preview_id)
+        if found is None:
+            return jsonify({'error': '没有选择文件或预览文件已过期，请重新选择'}), 400
+        input_path, filename, preview_id = found
+
+    try:
+        start_time = time.perf_counter()
+        results = transpose_engine.preview_workbook(
+            input_path, rows, filters=request_filters(request.form))
+        estimate = preflight.preflight(input_path)
+        elapsed = time.perf_counter() - start_time
+    except Exception as e:
+        print(f"预览失败: {str(e)}")
+        traceback.print_exc()
+        return jsonify({'error': '无法读取文件，请确认是有效的Excel文件'}), 400
+
+    if request.args.get('format') == 'html':
+        html = ''.join(
+            f'<h5>{escape(sheet_name)}</h5>'
+            + df.to_html(index=False, na_rep='', classes='table table-sm table-striped')
+            for sheet_name, df in results.items())
+        return Response(html, content_type='text/html; charset=utf-8')
+    return jsonify({
+        'success': True,
+        'preview_id': preview_id,
+        'filename': filename,
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'sheets': preview_tables(results),
+        'estimate': estimate,
+    })
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """上传文件处理"""
+    """上传文件处理；表单中带 preview_id 时直接转置预览时已上传的文件"""
     try:
+        try:
+            report_date = request_report_date(request.form)
+        except ValueError:
+            return jsonify({'error': '报告日期格式应为 YYYY-MM-DD'}), 400
+
+        if 'file' not in request.files and request.form.get('preview_id'):
+            found = find_preview_upload(request.form['preview_id'])
+            if found is None:
+                return jsonify({'error': '预览文件已过期，请重新上传'}), 404
+            input_path, filename, preview_id = found
+            try:
+                jobs.get_job(UPLOAD_FOLDER, preview_id)
+                return jsonify({'error': '该文件已提交转置'}), 409
+            except jobs.JobError:
+                pass
+            payload, status = submit_transpose_job(
+                input_path, filename, preview_id, request_filters(request.form), client_id(), report_date)
+            return jsonify(payload), status
+
         if 'file' not in request.files:
             return jsonify({'error': '没有选择文件'}), 400
         
@@ -248,58 +345,295 @@ def upload_file():
             return jsonify({'error': '没有选择文件'}), 400
         
         if file and allowed_file(file.filename):
-            # 生成唯一文件名
-            filename = secure_filename(file.filename)
-            unique_id = str(uuid.uuid4())
-            input_filename = f"{unique_id}_{filename}"
-            input_path = os.path.join(UPLOAD_FOLDER, input_filename)
-            
-            # 保存上传的文件
-            file.save(input_path)
+            # 以唯一文件名保存上传的文件
+            input_path, filename, unique_id = save_uploaded_file(file)
             
-            # 生成输出文件名
-            base_name = os.path.splitext(filename)[0]
-            current_date = datetime.now().strftime("%Y%m%d")
-            output_filename = f"{base_name}_{current_date}_完整转置完成.xlsx"
-            output_path = os.path.join(OUTPUT_FOLDER, f"{unique_id}_{output_filename}")
-            
-            # 处理转置
-            results = process_excel_transpose(input_path, output_path)
-            
-            if results is not None:
-                # 清理上传文件
-                os.remove(input_path)
-                
-                return jsonify({
-                    'success': True,
-                    'message': '转置处理完成',
-                    'download_url': f'/download/{unique_id}_{output_filename}',
-                    'results': {
-                        sheet_name: df.shape for sheet_name, df in results.items() if df is not None
-                    }
-                })
-            else:
-                # 清理上传文件
-                os.remove(input_path)
-                return jsonify({'error': '转置处理失败'}), 500
+            payload, status = submit_transpose_job(
+                input_path, filename, unique_id, request_filters(request.form), client_id(), report_date)
+            return jsonify(payload), status
         else:
             return jsonify({'error': '不支持的文件格式，请上传.xlsx或.xls文件'}), 400
             
+    except HTTPException:
+        # 如请求体超过上限（413），交给对应的错误处理函数
+        raise
+    except Exception as e:
+        return jsonify({'error': f'处理过程中出现错误: {str(e)}'}), 500
+
+def chunked_upload_error_response(e):
+    """把分块上传错误转换为JSON响应"""
+    payload = {'error': str(e)}
+    payload.update(e.extra)
+    return jsonify(payload), e.status_code
+
+@app.route('/upload/init', methods=['POST'])
+def chunked_upload_init():
+    """创建分块上传会话，请求体: {"filename": ..., "size": ...}"""
+    data = request.get_json(silent=True) or request.form
+    filename = data.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify({'error': '不支持的文件格式，请上传.xlsx或.xls文件'}), 400
+    try:
+        session = chunked_upload.init_upload(UPLOAD_FOLDER, filename, data.get('size'))
+    except chunked_upload.ChunkedUploadError as e:
+        return chunked_upload_error_response(e)
+    return jsonify(session), 201
+
+@app.route('/upload/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    """查询分块上传进度，用于断点续传"""
+    try:
+        return jsonify(chunked_upload.get_upload_status(UPLOAD_FOLDER, upload_id))
+    except chunked_upload.ChunkedUploadError as e:
+        return chunked_upload_error_response(e)
+
+@app.route('/upload/<upload_id>', methods=['PUT'])
+def chunked_upload_chunk(upload_id):
+    """写入一个分块，偏移量通过 ?offset= 或 Upload-Offset 请求头传入"""
+    offset = request.args.get('offset', request.headers.get('Upload-Offset'))
+    try:
+        session = chunked_upload.write_chunk(
+            UPLOAD_FOLDER, upload_id, offset, request.stream, request.content_length)
+    except chunked_upload.ChunkedUploadError as e:
+        return chunked_upload_error_response(e)
+    return jsonify(session)
+
+@app.route('/upload/<upload_id>', methods=['DELETE'])
+def chunked_upload_abort(upload_id):
+    """放弃分块上传并删除已接收的数据"""
+    try:
+        chunked_upload.abort_upload(UPLOAD_FOLDER, upload_id)
+    except chunked_upload.ChunkedUploadError as e:
+        return chunked_upload_error_response(e)
+    return jsonify({'success': True})
+
+@app.route('/upload/<upload_id>/finalize', methods=['POST'])
+def chunked_upload_finalize(upload_id):
+    """组装分块并提交转置任务，请求体可带筛选条件和报告日期"""
+    data = request.get_json(silent=True) or request.form
+    try:
+        report_date = request_report_date(data)
+    except ValueError:
+        return jsonify({'error': '报告日期格式应为 YYYY-MM-DD'}), 400
+    try:
+        input_path, filename = chunked_upload.finalize_upload(UPLOAD_FOLDER, upload_id)
+    except chunked_upload.ChunkedUploadError as e:
+        return chunked_upload_error_response(e)
+    try:
+        payload, status = submit_transpose_job(
+            input_path, filename, upload_id, request_filters(data), client_id(), report_date)
+        return jsonify(payload), status
     except Exception as e:
         return jsonify({'error': f'处理过程中出现错误: {str(e)}'}), 500
 
+@app.route('/upload/batch', methods=['POST'])
+def upload_batch():
+    """
+    批量上传：表单字段 files 可包含多个.xlsx/.xls文件或zip压缩包，每个工作簿提交为一个转置任务，
+    筛选条件和报告日期对全部文件生效；返回批次ID，结果从 download_url 以zip流式下载
+    """
+    try:
+        report_date = request_report_date(request.form)
+    except ValueError:
+        return jsonify({'error': '报告日期格式应为 YYYY-MM-DD'}), 400
+    uploads = [file for file in request.files.getlist('files') + request.files.getlist('file') if file.filename]
+    if not uploads:
+        return jsonify({'error': '没有选择文件'}), 400
+
+    saved = []
+    try:
+        for file in uploads:
+            if batch_upload.is_zip(file.filename):
+                zip_path, _, _ = save_uploaded_file(file)
+                try:
+                    saved.extend(batch_upload.extract_workbooks(zip_path, UPLOAD_FOLDER, allowed_file))
+                finally:
+                    os.remove(zip_path)
+            elif allowed_file(file.filename):
+                saved.append(batch_upload.save_workbook(file.stream, os.path.basename(file.filename), UPLOAD_FOLDER))
+            else:
+                raise batch_upload.BatchError(f'不支持的文件格式: {file.filename}，请上传.xlsx、.xls或.zip文件')
+            if len(saved) > batch_upload.MAX_BATCH_FILES:
+                raise batch_upload.BatchError(f'单次最多上传 {batch_upload.MAX_BATCH_FILES} 个工作簿', 413)
+    except batch_upload.BatchError as e:
+        for item in saved:
+            if os.path.exists(item['input_path']):
+                os.remove(item['input_path'])
+        return jsonify({'error': str(e)}), e.status_code
+
+    filters = request_filters(request.form)
+    user = client_id()
+    files = []
+    for item in saved:
+        try:
+            payload, status = submit_transpose_job(
+                item['input_path'], item['filename'], item['job_id'], filters, user, report_date)
+        except Exception as e:
+            payload, status = {'error': f'处理过程中出现错误: {str(e)}'}, 500
+        files.append({'name': item['name'], 'filename': item['filename'],
+                      'job_id': item['job_id'] if status == 202 else None,
+                      'error': payload.get('error')})
+
+    batch_id = str(uuid.uuid4())
+    batch_upload.create_batch(UPLOAD_FOLDER, batch_id, files, user=user)
+    return jsonify({
+        'success': True,
+        'batch_id': batch_id,
+        'status_url': f'/batches/{batch_id}',
+        'download_url': f'/batches/{batch_id}/download',
+        'files': files,
+    }), 202
+
+@app.route('/batches/<batch_id>')
+def batch_status(batch_id):
+    """查询批次中每个文件的任务状态"""
+    try:
+        batch = batch_upload.get_batch(UPLOAD_FOLDER, batch_id)
+    except batch_upload.BatchError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    batch.pop('user', None)
+    return jsonify(batch)
+
+@app.route('/batches/<batch_id>/download')
+def batch_download(batch_id):
+    """
+    下载批次结果zip：连接后立即开始传输，每个文件转置完成就写入，
+    全部结束后写入 批量转置汇总.json
+    """
+    try:
+        chunks = batch_upload.stream_results(UPLOAD_FOLDER, OUTPUT_FOLDER, batch_id)
+    except batch_upload.BatchError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    download_name = f"批量转置_{datetime.now().strftime('%Y%m%d')}_{batch_id[:8]}.zip"
+    response = Response(stream_with_context(chunks), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+    # 关闭代理缓冲，完成一个文件就送达客户端
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """查询转置任务状态，排队时返回 queue_position，完成后 result 中包含下载地址"""
+    try:
+        job = jobs.get_job(UPLOAD_FOLDER, job_id)
+    except jobs.JobError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    # 内部字段不返回给客户端
+    for field in ('input_path', 'pid', 'user'):
+        job.pop(field, None)
+    if job['status'] == jobs.STATUS_QUEUED:
+        job['queue_position'] = scheduler.queue_position(UPLOAD_FOLDER, job_id)
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """取消排队中或运行中的任务，运行中的任务在子进程结束后状态变为 cancelled"""
+    try:
+        job = scheduler.cancel_job(UPLOAD_FOLDER, job_id)
+    except jobs.JobError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    if job['status'] == jobs.STATUS_CANCELLED:
+        return jsonify({'success': True, 'status': job['status']})
+    return jsonify({'success': True, 'status': job['status'], 'cancel_requested': True}), 202
+
+@app.route('/results/<job_id>')
+def result_sheets(job_id):
+    """列出任务结果缓存中的工作表及其行数、列名"""
+    try:
+        return jsonify({'sheets': result_cache.list_sheets(job_id)})
+    except result_cache.ResultCacheError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+@app.route('/results/<job_id>/<sheet_name>')
+def result_window(job_id, sheet_name):
+    """
+    分页读取转置结果：?offset=0&limit=100&sort=列名（-列名为降序）&filter=列名:文本
+    filter 可重复，同时满足；文本包含匹配，数字同时按数值相等匹配
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        return jsonify({'error': 'offset 和 limit 必须是整数'}), 400
+    filters = []
+    for item in request.args.getlist('filter'):
+        name, sep, text = item.partition(':')
+        if not sep or not text:
+            return jsonify({'error': f'筛选条件格式应为 列名:文本，实际为 {item}'}), 400
+        filters.append((name, text))
+    try:
+        return jsonify(result_cache.query(job_id, sheet_name, offset, limit,
+                                          request.args.get('sort'), filters))
+    except result_cache.ResultCacheError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+@app.route('/api/query')
+def warehouse_query():
+    """
+    数据仓库常用查询（需设置 WAREHOUSE_PATH），读取写入时预先计算的汇总表：
+    ?q=platform_average|trend|keyword_share&metric=指标&start=&end=&brands=&platforms=&keywords=
+    """
+    try:
+        return jsonify(warehouse.query(request.args.get('q', ''), request.args))
+    except warehouse.WarehouseError as e:
+        return jsonify({'error': str(e)}), e.status_code
+
+def send_output_file(file_path, download_name):
+    """
+    发送输出文件，支持Range断点续传和ETag条件请求
+    输出文件名带有唯一ID、生成后不再修改，允许客户端缓存
+    """
+    janitor.touch(file_path)
+    response = send_file(file_path, as_attachment=True, download_name=download_name,
+                         conditional=True, etag=True, max_age=DOWNLOAD_MAX_AGE)
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """下载文件"""
     try:
         file_path = os.path.join(OUTPUT_FOLDER, filename)
         if os.path.exists(file_path):
-            return send_file(file_path, as_attachment=True, download_name=filename)
+            return send_output_file(file_path, filename)
         else:
             return jsonify({'error': '文件不存在'}), 404
     except Exception as e:
         return jsonify({'error': f'下载失败: {str(e)}'}), 500
 
+@app.route('/download/<filename>/bundle')
+def download_bundle(filename):
+    """把输出的各工作表导出为CSV或Parquet并打包为zip下载，?format=csv|parquet"""
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in output_bundle.BUNDLE_FORMATS:
+        return jsonify({'error': f'不支持的打包格式: {fmt}'}), 400
+    try:
+        file_path = os.path.join(OUTPUT_FOLDER, filename)
+        if not os.path.exists(file_path):
+            return jsonify({'error': '文件不存在'}), 404
+        try:
+            bundle_path = output_bundle.build_bundle(file_path, fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return send_output_file(bundle_path, f"{os.path.splitext(filename)[0]}_{fmt}.zip")
+    except Exception as e:
+        return jsonify({'error': f'下载失败: {str(e)}'}), 500
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus格式的运行指标"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def start_background_services():
+    """启动后台服务（目录自动清理、任务调度）"""
+    janitor.start_janitor(UPLOAD_FOLDER, OUTPUT_FOLDER)
+    start_job_scheduler()
+
 if __name__ == '__main__':
+    # 调试模式的重载器会先启动一个监视进程，只在实际服务的子进程中启动后台服务
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services()
     app.run(debug=True, host='0.0.0.0', port=8080)
 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量上传
+一次请求上传多个工作簿或一个zip压缩包：压缩包中的工作簿解压到上传目录，
+每个文件作为普通转置任务提交到调度队列（按内存预算并行执行），
+批次记录只保存各文件对应的任务ID，状态以任务记录为准
+
+下载时边等待边输出zip：哪个文件先转置完成就先写入哪个，客户端不必等全部完成才开始接收；
+zip中包含每个文件的转置结果和品牌汇总，最后写入 批量转置汇总.json（每个文件的状态、行数和错误）
+"""
+
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+import zlib
+
+import brand_summary
+import chunked_upload
+import jobs
+
+# 批次记录存放的子目录（位于上传目录下，由自动清理按上传文件保留期删除）
+BATCH_SUBDIR = 'batches'
+# 单个批次最多的工作簿数
+MAX_BATCH_FILES = int(os.environ.get('BATCH_MAX_FILES', '50'))
+# 压缩包解压后的总大小上限，防止压缩炸弹
+MAX_EXTRACTED_BYTES = int(os.environ.get('BATCH_MAX_EXTRACTED_MB', '2048')) * 1024 * 1024
+# 下载时检查任务状态的间隔（秒）
+POLL_INTERVAL_SECONDS = 1.0
+# 从输出文件复制到zip时的缓冲区大小，每复制一块就发送给客户端
+COPY_BUFFER_SIZE = 256 * 1024
+SUMMARY_MEMBER = '批量转置汇总.json'
+
+_BATCH_ID_PATTERN = re.compile(r'^[0-9a-f-]{32,36}$')
+_write_lock = threading.Lock()
+
+
+class BatchError(Exception):
+    """批量上传错误，附带HTTP状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def is_zip(filename):
+    return filename.lower().endswith('.zip')
+
+
+def _batch_path(upload_folder, batch_id):
+    if not batch_id or not _BATCH_ID_PATTERN.match(batch_id):
+        raise BatchError('无效的批次ID', 404)
+    folder = os.path.join(upload_folder, BATCH_SUBDIR)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{batch_id}.json")
+
+
+def _member_name(info):
+    """zip成员的文件名（不含目录）；Windows压缩工具生成的GBK文件名按GBK解码"""
+    name = info.filename
+    if not info.flag_bits & 0x800:
+        try:
+            name = name.encode('cp437').decode('gbk')
+        except (UnicodeEncodeError, UnicodeDecodeError):
+            pass
+    return name.replace('\\', '/').rsplit('/', 1)[-1]
+
+
+def save_workbook(stream, name, upload_folder):
+    """
+    把一个工作簿保存到上传目录，命名方式与普通上传相同（唯一ID_文件名）
+
+    返回:
+    dict: name（原始文件名）、filename（安全文件名）、job_id、input_path
+    """
+    job_id = str(uuid.uuid4())
+    filename = chunked_upload.safe_filename(name, job_id[:8])
+    input_path = os.path.join(upload_folder, f"{job_id}_{filename}")
+    try:
+        with open(input_path, 'wb') as f:
+            shutil.copyfileobj(stream, f)
+    except Exception:
+        # 读取中断（如压缩包成员损坏）时不留下不完整的文件
+        if os.path.exists(input_path):
+            os.remove(input_path)
+        raise
+    return {'name': name, 'filename': filename, 'job_id': job_id, 'input_path': input_path}
+
+
+def extract_workbooks(zip_path, upload_folder, allowed_file):
+    """
+    解压压缩包中的工作簿，跳过目录、隐藏文件、Office临时文件和不支持的格式；
+    任一成员无法解压时删除已解压的文件并抛出 BatchError
+
+    参数:
+    allowed_file: 判断文件名是否为支持的工作簿格式的函数
+
+    返回:
+    list: save_workbook 的返回值列表
+    """
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise BatchError('压缩包已损坏或不是zip格式')
+    with archive:
+        members = []
+        for info in archive.infolist():
+            name = _member_name(info)
+            if (info.is_dir() or info.filename.startswith('__MACOSX/')
+                    or name.startswith(('.', '~')) or not allowed_file(name)):
+                continue
+            members.append((info, name))
+        if not members:
+            raise BatchError('压缩包中没有.xlsx或.xls文件')
+        if len(members) > MAX_BATCH_FILES:
+            raise BatchError(f'压缩包中有 {len(members)} 个工作簿，单次最多 {MAX_BATCH_FILES} 个', 413)
+        if sum(info.file_size for info, _ in members) > MAX_EXTRACTED_BYTES:
+            raise BatchError(f'压缩包解压后超过 {MAX_EXTRACTED_BYTES // 1024 // 1024} MB 的上限', 413)
+        saved = []
+        try:
+            for info, name in members:
+                try:
+                    with archive.open(info) as stream:
+                        saved.append(save_workbook(stream, name, upload_folder))
+                except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError) as e:
+                    # 校验失败、数据截断、不支持的压缩方式或加密的成员
+                    raise BatchError(f'压缩包中的 {name} 无法解压: {str(e)}')
+        except Exception:
+            for item in saved:
+                if os.path.exists(item['input_path']):
+                    os.remove(item['input_path'])
+            raise
+    return saved
+
+
+def create_batch(upload_folder, batch_id, files, **fields):
+    """
+    创建批次记录
+
+    参数:
+    files: 每个文件一项，含 name、job_id（提交失败时为None）和 error
+    """
+    batch = {'batch_id': batch_id, 'created_at': time.time(), 'files': files}
+    batch.update(fields)
+    with _write_lock:
+        with open(_batch_path(upload_folder, batch_id), 'w', encoding='utf-8') as f:
+            json.dump(batch, f, ensure_ascii=False)
+    return batch
+
+
+def get_batch(upload_folder, batch_id):
+    """读取批次记录，并附上每个文件当前的任务状态"""
+    try:
+        with open(_batch_path(upload_folder, batch_id), 'r', encoding='utf-8') as f:
+            batch = json.load(f)
+    except FileNotFoundError:
+        raise BatchError('批次不存在或已过期', 404)
+    for item in batch['files']:
+        if not item.get('job_id'):
+            item['status'] = jobs.STATUS_FAILED
+            continue
+        try:
+            job = jobs.get_job(upload_folder, item['job_id'])
+        except jobs.JobError:
+            item.update(status=jobs.STATUS_FAILED, error='任务记录已过期')
+            continue
+        item['status'] = job['status']
+        result = job.get('result') or {}
+        if job['status'] in jobs.FINISHED_STATUSES:
+            item['error'] = result.get('error')
+            item['results'] = result.get('results')
+            item['download_url'] = result.get('download_url')
+            item['seconds'] = round(job['updated_at'] - job.get('started_at', job['created_at']), 2)
+    batch['finished'] = sum(item['status'] in jobs.FINISHED_STATUSES for item in batch['files'])
+    batch['total'] = len(batch['files'])
+    return batch
+
+
+class _ZipStream(io.RawIOBase):
+    """只追加、不可定位的写入缓冲，zipfile写入后取出已生成的字节发送给客户端"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _unique_member(name, used):
+    """同名文件（如压缩包不同目录中的同名工作簿）加序号区分"""
+    stem, ext = os.path.splitext(name)
+    candidate, index = name, 2
+    while candidate in used:
+        candidate = f"{stem}({index}){ext}"
+        index += 1
+    used.add(candidate)
+    return candidate
+
+
+def _write_file(zf, stream, path, member, compress_type):
+    """把文件分块写入zip成员，每块写完后产出已生成的字节"""
+    info = zipfile.ZipInfo(member, time.localtime()[:6])
+    info.compress_type = compress_type
+    with open(path, 'rb') as source, zf.open(info, 'w') as target:
+        while True:
+            block = source.read(COPY_BUFFER_SIZE)
+            if not block:
+                break
+            target.write(block)
+            yield stream.take()
+    yield stream.take()
+
+
+def stream_results(upload_folder, output_folder, batch_id, poll_interval=POLL_INTERVAL_SECONDS):
+    """
+    生成批次结果zip的字节流：按完成顺序写入每个文件的转置结果和品牌汇总，
+    全部结束后写入 SUMMARY_MEMBER；批次不存在时在开始输出前抛出 BatchError
+    """
+    get_batch(upload_folder, batch_id)
+
+    def generate():
+        stream = _ZipStream()
+        written = set()
+        used = set()
+        expired = set()
+        with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as zf:
+            while True:
+                batch = get_batch(upload_folder, batch_id)
+                for item in batch['files']:
+                    if item['job_id'] in written or item['status'] not in jobs.FINISHED_STATUSES:
+                        continue
+                    written.add(item['job_id'])
+                    if item['status'] != jobs.STATUS_DONE or not item.get('download_url'):
+                        continue
+                    output_path = os.path.join(output_folder, os.path.basename(item['download_url']))
+                    if not os.path.exists(output_path):
+                        expired.add(item['job_id'])
+                        continue
+                    # 输出文件名为 任务ID_安全文件名_日期_完整转置完成.xlsx，换回原始文件名
+                    prefix = len(item['job_id']) + 1 + len(os.path.splitext(item['filename'])[0])
+                    member = _unique_member(
+                        os.path.splitext(item['name'])[0] + os.path.basename(output_path)[prefix:], used)
+                    # xlsx本身已压缩，直接存储
+                    yield from _write_file(zf, stream, output_path, member, zipfile.ZIP_STORED)
+                    summary_path = brand_summary.summary_path_for(output_path)
+                    if os.path.exists(summary_path):
+                        yield from _write_file(zf, stream, summary_path,
+                                               brand_summary.summary_path_for(member), zipfile.ZIP_DEFLATED)
+                if batch['finished'] == batch['total']:
+                    break
+                time.sleep(poll_interval)
+
+            for item in batch['files']:
+                if item['job_id'] in expired:
+                    item.update(status=jobs.STATUS_FAILED, error='输出文件已过期')
+            summary = {
+                'batch_id': batch_id,
+                'total': batch['total'],
+                'succeeded': sum(item['status'] == jobs.STATUS_DONE for item in batch['files']),
+                'files': [{key: item.get(key) for key in ('name', 'status', 'results', 'seconds', 'error')}
+                          for item in batch['files']],
+            }
+            zf.writestr(SUMMARY_MEMBER, json.dumps(summary, ensure_ascii=False, indent=2))
+        yield stream.take()
+
+    return generate()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+XLSX读取性能对比
+对比 openpyxl.load_workbook(data_only=True)、openpyxl只读模式 和 轻量级XlsxReader
+读取全部工作表单元格值的耗时，并校验三者读出的值完全一致
+
+用法: python benchmark_xlsx_reader.py [文件1.xlsx 文件2.xlsx ...] [--repeat N]
+不指定文件时测试 待处理文件/ 目录下的所有xlsx
+"""
+
+import glob
+import os
+import sys
+import time
+
+import openpyxl
+
+from xlsx_reader import XlsxReader
+
+
+def read_with_openpyxl(path, read_only=False):
+    """用openpyxl读取所有工作表的值"""
+    wb = openpyxl.load_workbook(path, data_only=True, read_only=read_only)
+    sheets = {}
+    for ws in wb.worksheets:
+        sheets[ws.title] = [tuple(row) for row in ws.iter_rows(values_only=True)]
+    if read_only:
+        wb.close()
+    return sheets
+
+
+def read_with_xlsx_reader(path):
+    """用XlsxReader读取所有工作表的值"""
+    with XlsxReader(path) as reader:
+        return {name: list(reader.iter_rows(name)) for name in reader.sheetnames}
+
+
+def normalize(rows):
+    """去掉行尾的空值和末尾的空行，不同读取方式的补齐规则不同，只比较实际内容"""
+    result = []
+    for row in rows:
+        row = list(row)
+        while row and row[-1] is None:
+            row.pop()
+        result.append(tuple(row))
+    while result and not result[-1]:
+        result.pop()
+    return result
+
+
+def time_call(func, repeat):
+    """多次运行取最短耗时"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def benchmark_file(path, repeat):
+    """测试单个文件，返回各方式耗时"""
+    print(f"\n文件: {path} ({os.path.getsize(path) / 1024 / 1024:.2f} MB)")
+
+    candidates = [
+        ('openpyxl data_only', lambda: read_with_openpyxl(path)),
+        ('openpyxl read_only', lambda: read_with_openpyxl(path, read_only=True)),
+        ('XlsxReader', lambda: read_with_xlsx_reader(path)),
+    ]
+    timings = {}
+    reference = None
+    for label, func in candidates:
+        elapsed, sheets = time_call(func, repeat)
+        timings[label] = elapsed
+        cells = sum(value is not None for rows in sheets.values() for row in rows for value in row)
+        print(f"  {label:<20} {elapsed:8.3f} 秒  ({cells} 个非空单元格)")
+
+        normalized = {name: normalize(rows) for name, rows in sheets.items()}
+        if reference is None:
+            reference = normalized
+        elif normalized != reference:
+            print(f"  ❌ {label} 读出的值与 openpyxl data_only 不一致")
+
+    baseline = timings['openpyxl data_only']
+    print(f"  XlsxReader 加速比: {baseline / timings['XlsxReader']:.1f}x")
+    return timings
+
+
+def main():
+    args = sys.argv[1:]
+    repeat = 3
+    if '--repeat' in args:
+        index = args.index('--repeat')
+        repeat = int(args[index + 1])
+        del args[index:index + 2]
+
+    files = args or sorted(
+        path for path in glob.glob(os.path.join("待处理文件", "*.xlsx"))
+        if not os.path.basename(path).startswith("~")
+    )
+    if not files:
+        print("使用方法: python benchmark_xlsx_reader.py [文件1.xlsx ...] [--repeat N]")
+        print("未指定文件，且 待处理文件/ 目录下没有xlsx文件")
+        return
+
+    print("=" * 60)
+    print(f"XLSX读取性能对比（每种方式运行 {repeat} 次取最短耗时）")
+    print("=" * 60)
+    for path in files:
+        benchmark_file(path, repeat)
+
+
+if __name__ == "__main__":
+    main()
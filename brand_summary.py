@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置时同步计算的品牌汇总
+转置结果按批次生成时逐批累加每个 (品牌, 品牌类型, 分组, AI平台) 分组各指标的
+行数、合计、最小值、最大值，转置结束即得到汇总，不需要再读一遍长表
+分组是三行及以上表头中品牌和指标之间各层的取值（见 transpose_engine.level_names），
+多层时用 " / " 连接；两行表头没有分组，分组列为 ALL
+
+汇总包括三个层级（分组、AI平台或品牌为 ALL 表示全部合计）：
+    品牌 × 分组 × AI平台
+    品牌 × 全部分组和AI平台
+    品牌类型（客户/竞品） × 全部分组和AI平台
+只统计数值，文本和空单元格不计入行数
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SUMMARY_SHEET = '品牌汇总'
+ALL = '全部'
+SUMMARY_COLUMNS = ['工作表', '品牌', '品牌类型', '分组', 'AI平台', '指标', '行数', '合计', '平均值', '最小值', '最大值']
+
+
+def summary_path_for(output_path):
+    """输出文件对应的汇总JSON路径"""
+    return f"{os.path.splitext(output_path)[0]}.summary.json"
+
+
+def _merge(groups, key, stats):
+    """把一个分组的统计值 [指标, (行数, 合计, 最小值, 最大值)] 合并到 groups[key]"""
+    previous = groups.get(key)
+    if previous is None:
+        groups[key] = stats.copy()
+        return
+    previous[:, :2] += stats[:, :2]
+    previous[:, 2] = np.fmin(previous[:, 2], stats[:, 2])
+    previous[:, 3] = np.fmax(previous[:, 3], stats[:, 3])
+
+
+class RollupAccumulator:
+    """
+    一个工作表的汇总累加器
+
+    参数:
+    layout_name: 工作表名称
+    columns: 转置输出的列名
+    metric_columns: 其中的指标列
+    platform_columns: 可能表示AI平台的列名，取输出中第一个存在的
+    level_columns: 品牌和指标之间各层表头的列名，两行表头时为空
+    """
+
+    def __init__(self, layout_name, columns, metric_columns, platform_columns=(), level_columns=()):
+        self.layout_name = layout_name
+        self.metrics = list(metric_columns)
+        self._brand = columns.index('品牌')
+        self._brand_type = columns.index('品牌类型')
+        self._platform = next((columns.index(name) for name in platform_columns if name in columns), None)
+        self._level_positions = [columns.index(name) for name in level_columns]
+        self._metric_positions = [columns.index(name) for name in self.metrics]
+        # {(品牌, 品牌类型, 分组, AI平台): 数组[指标, (行数, 合计, 最小值, 最大值)]}
+        self._groups = {}
+
+    def add(self, batch):
+        """累加一批转置结果，batch 为按输出列排列的值数组列表"""
+        if not len(batch[self._brand]):
+            return
+        frame = pd.DataFrame({
+            '品牌': batch[self._brand],
+            '品牌类型': batch[self._brand_type],
+            '分组': ALL,
+            'AI平台': batch[self._platform] if self._platform is not None else ALL,
+        })
+        if self._level_positions:
+            levels = [pd.Series(batch[position], dtype=object).fillna('').astype(str)
+                      for position in self._level_positions]
+            frame['分组'] = levels[0].str.cat(levels[1:], sep=' / ') if len(levels) > 1 else levels[0]
+        frame['AI平台'] = frame['AI平台'].fillna('').astype(str)
+        for i, position in enumerate(self._metric_positions):
+            frame[i] = pd.to_numeric(pd.Series(batch[position], dtype=object), errors='coerce')
+        grouped = frame.groupby(['品牌', '品牌类型', '分组', 'AI平台'], sort=False)[list(range(len(self.metrics)))]
+        stats = [grouped.agg(how) for how in ('count', 'sum', 'min', 'max')]
+        for key, *values in zip(stats[0].index, *(s.to_numpy(dtype=np.float64) for s in stats)):
+            _merge(self._groups, key, np.stack(values, axis=1))
+
+    def _levels(self):
+        """
+        三个层级的分组及其统计值：按品牌出现顺序，每个品牌先列出各(分组, AI平台)、再列出全部合计，
+        最后是各品牌类型的合计
+        """
+        # {(品牌, 品牌类型): {(分组, AI平台): 统计值}} 和 {(品牌, 品牌类型): 全部合计}
+        details = {}
+        totals = {}
+        for (brand, brand_type, group, platform), stats in self._groups.items():
+            by_group = details.setdefault((brand, brand_type), {})
+            # 既没有分组也没有AI平台列时，分组本身就是全部合计
+            if (group, platform) != (ALL, ALL):
+                _merge(by_group, (group, platform), stats)
+            _merge(totals, (brand, brand_type), stats)
+        levels = []
+        types = {}
+        for (brand, brand_type), by_group in details.items():
+            levels.extend(((brand, brand_type) + key, stats) for key, stats in by_group.items())
+            levels.append(((brand, brand_type, ALL, ALL), totals[(brand, brand_type)]))
+            _merge(types, (ALL, brand_type, ALL, ALL), totals[(brand, brand_type)])
+        return levels + list(types.items())
+
+    def rows(self):
+        """汇总行，列同 SUMMARY_COLUMNS；没有数值的指标不输出"""
+        result = []
+        for (brand, brand_type, group, platform), stats in self._levels():
+            for metric, (count, total, low, high) in zip(self.metrics, stats):
+                if not count:
+                    continue
+                result.append((self.layout_name, brand, brand_type, group, platform, metric, int(count),
+                               float(total), float(total / count), float(low), float(high)))
+        return result
+
+
+def summary_dataframe(rollups):
+    """把 {工作表: RollupAccumulator} 合并为一张汇总表"""
+    rows = [row for rollup in rollups.values() for row in rollup.rows()]
+    return pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+
+
+def write_summary_json(rollups, path):
+    """
+    把汇总写为JSON: {工作表: [{品牌, 品牌类型, 分组, AI平台, 指标: {指标名: {行数, 合计, 平均值, 最小值, 最大值}}}]}
+    """
+    data = {}
+    for sheet_name, rollup in rollups.items():
+        groups = {}
+        for _, brand, brand_type, level, platform, metric, *stats in rollup.rows():
+            group = groups.setdefault((brand, brand_type, level, platform), {
+                '品牌': brand, '品牌类型': brand_type, '分组': level, 'AI平台': platform, '指标': {}})
+            group['指标'][metric] = dict(zip(SUMMARY_COLUMNS[6:], stats))
+        data[sheet_name] = list(groups.values())
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块断点续传上传模块
+协议：init 创建上传会话 -> 按偏移量 PUT 分块 -> finalize 组装完成
+分块直接流式写入磁盘上的 .part 文件，已接收字节数以文件大小为准，
+因此网络中断或服务重启后都可以从断点继续上传；
+同一会话的分块写入由文件锁串行化，重试请求与仍在写入的请求不会交错写入
+
+环境变量:
+    MAX_UPLOAD_MB   单个上传文件的大小上限（默认1024），普通上传和分块上传共用
+"""
+
+import contextlib
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+# 分块文件存放的子目录
+CHUNK_SUBDIR = 'chunks'
+# 建议的分块大小，客户端可自行调整
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+# 单个分块允许的最大字节数
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# 从请求流复制到磁盘时的缓冲区大小
+COPY_BUFFER_SIZE = 256 * 1024
+# 上传文件大小上限，app 中同时用作普通上传请求体的上限
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_MB', '1024')) * 1024 * 1024
+
+_UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ChunkedUploadError(Exception):
+    """分块上传错误，附带HTTP状态码和可返回给客户端的附加信息"""
+
+    def __init__(self, message, status_code=400, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.extra = extra
+
+
+def _chunk_folder(upload_folder):
+    folder = os.path.join(upload_folder, CHUNK_SUBDIR)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _session_paths(upload_folder, upload_id):
+    """返回上传会话的元数据文件和数据文件路径"""
+    if not upload_id or not _UPLOAD_ID_PATTERN.match(upload_id):
+        raise ChunkedUploadError('无效的上传ID', 404)
+    folder = _chunk_folder(upload_folder)
+    return (os.path.join(folder, f"{upload_id}.json"),
+            os.path.join(folder, f"{upload_id}.part"))
+
+
+@contextlib.contextmanager
+def _session_lock(upload_folder, upload_id):
+    """
+    对上传会话加排他锁（锁在元数据文件上），期间完成 检查偏移量 -> 写入 -> 更新 的全过程；
+    已有请求在写入时立即返回409和当前进度，不等待，避免卡住的连接阻塞客户端重试
+    """
+    meta_path, _ = _session_paths(upload_folder, upload_id)
+    try:
+        lock_file = open(meta_path, 'r')
+    except FileNotFoundError:
+        raise ChunkedUploadError('上传会话不存在或已过期', 404)
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ChunkedUploadError('该上传正在写入其他分块，请稍后按返回的进度重试', 409,
+                                     received=_load_session(upload_folder, upload_id)[0]['received'])
+        yield
+    finally:
+        lock_file.close()
+
+
+def _load_session(upload_folder, upload_id):
+    meta_path, part_path = _session_paths(upload_folder, upload_id)
+    if not os.path.exists(meta_path) or not os.path.exists(part_path):
+        raise ChunkedUploadError('上传会话不存在或已过期', 404)
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        session = json.load(f)
+    session['received'] = os.path.getsize(part_path)
+    return session, part_path
+
+
+def safe_filename(name, fallback):
+    """
+    保存上传文件用的安全文件名，保留原扩展名（读取时按扩展名选择后端）
+    secure_filename 会去掉中文，纯中文文件名只剩扩展名（如 "xls"），此时用 fallback 代替文件名主体
+    """
+    filename = secure_filename(name)
+    ext = os.path.splitext(name)[1].lower()
+    if not filename.lower().endswith(ext) or len(filename) <= len(ext):
+        filename = secure_filename(f"{fallback}{ext}")
+    return filename
+
+
+def init_upload(upload_folder, filename, total_size):
+    """
+    创建上传会话
+
+    参数:
+    upload_folder: 上传目录
+    filename: 原始文件名
+    total_size: 文件总字节数
+
+    返回:
+    dict: 会话信息（upload_id、chunk_size、received等）
+    """
+    if not filename:
+        raise ChunkedUploadError('没有选择文件')
+    try:
+        total_size = int(total_size)
+    except (TypeError, ValueError):
+        raise ChunkedUploadError('文件大小无效')
+    if total_size <= 0:
+        raise ChunkedUploadError('文件大小无效')
+    if total_size > MAX_UPLOAD_BYTES:
+        raise ChunkedUploadError(f'文件超过 {MAX_UPLOAD_BYTES // 1024 // 1024} MB 的上限', 413,
+                                 max_size=MAX_UPLOAD_BYTES)
+
+    upload_id = uuid.uuid4().hex
+    meta_path, part_path = _session_paths(upload_folder, upload_id)
+    session = {
+        'upload_id': upload_id,
+        'filename': safe_filename(filename, upload_id[:8]),
+        'total_size': total_size,
+        'created_at': time.time(),
+    }
+    # 先创建空的数据文件，再写元数据，保证元数据存在时数据文件一定存在
+    open(part_path, 'wb').close()
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(session, f, ensure_ascii=False)
+
+    session['received'] = 0
+    session['chunk_size'] = DEFAULT_CHUNK_SIZE
+    return session
+
+
+def get_upload_status(upload_folder, upload_id):
+    """查询上传进度，客户端断线后据此决定从哪个偏移量继续"""
+    session, _ = _load_session(upload_folder, upload_id)
+    session['complete'] = session['received'] >= session['total_size']
+    return session
+
+
+def write_chunk(upload_folder, upload_id, offset, stream, content_length=None):
+    """
+    把一个分块从请求流直接写入磁盘
+
+    参数:
+    offset: 分块在文件中的起始偏移量，必须等于当前已接收字节数
+    stream: 可读的请求体流
+    content_length: 分块长度（可选，用于提前校验）
+
+    返回:
+    dict: 写入后的会话状态
+    """
+    with _session_lock(upload_folder, upload_id):
+        return _write_chunk_locked(upload_folder, upload_id, offset, stream, content_length)
+
+
+def _write_chunk_locked(upload_folder, upload_id, offset, stream, content_length):
+    """write_chunk 的主体，调用方持有会话锁"""
+    session, part_path = _load_session(upload_folder, upload_id)
+    received = session['received']
+    total_size = session['total_size']
+
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        raise ChunkedUploadError('缺少有效的offset参数', received=received)
+    if offset != received:
+        # 偏移量不连续时告诉客户端实际进度，由客户端从该位置重传
+        raise ChunkedUploadError('分块偏移量与已接收字节数不一致', 409, received=received)
+    if content_length is not None and content_length > MAX_CHUNK_SIZE:
+        raise ChunkedUploadError('分块过大', 413, max_chunk_size=MAX_CHUNK_SIZE)
+
+    limit = min(MAX_CHUNK_SIZE, total_size - received)
+    written = 0
+    with open(part_path, 'r+b') as f:
+        f.seek(offset)
+        while True:
+            buffer = stream.read(COPY_BUFFER_SIZE)
+            if not buffer:
+                break
+            if written + len(buffer) > limit:
+                # 丢弃越界部分，保持文件内容与已确认的进度一致
+                f.truncate(offset)
+                raise ChunkedUploadError('分块超出文件声明的大小或单块上限', 413, received=received)
+            f.write(buffer)
+            written += len(buffer)
+
+    # 刷新元数据的修改时间，活跃的会话不会被自动清理误删
+    os.utime(_session_paths(upload_folder, upload_id)[0])
+    session['received'] = received + written
+    session['complete'] = session['received'] >= total_size
+    return session
+
+
+def finalize_upload(upload_folder, upload_id):
+    """
+    完成上传，把分块文件移动为正式的上传文件
+
+    返回:
+    tuple: (input_path, filename)，input_path 按 {upload_id}_{filename} 命名
+    """
+    with _session_lock(upload_folder, upload_id):
+        session, part_path = _load_session(upload_folder, upload_id)
+        if session['received'] != session['total_size']:
+            raise ChunkedUploadError('文件尚未上传完整', 409,
+                                     received=session['received'], total_size=session['total_size'])
+
+        input_path = os.path.join(upload_folder, f"{upload_id}_{session['filename']}")
+        shutil.move(part_path, input_path)
+        abort_upload(upload_folder, upload_id)
+    return input_path, session['filename']
+
+
+def abort_upload(upload_folder, upload_id):
+    """删除上传会话及已接收的分块"""
+    for path in _session_paths(upload_folder, upload_id):
+        if os.path.exists(path):
+            os.remove(path)
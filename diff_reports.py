@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+改动前/改动后对比报告
+把两份数据按 (关键词名称, AI平台, 信源平台名称, 品牌) 等自然键对齐，
+计算每个指标的差值和变化率，标出变化显著的行
+
+两种输入:
+    python diff_reports.py 改动前.xlsx 改动后.xlsx    两个文件（原始报告或转置结果）逐工作表对比
+    python diff_reports.py 示例.xlsx                  一个工作表中 "改动前"、"改动后" 两个区域对比
+                                                      （precise_transpose.py 处理的示例格式）
+
+两个区域/文件都先转换为长表（宽表经过与正式转置相同的处理），再用一次外连接对齐，
+计算全部向量化完成，不逐行比较
+
+用法:
+    python diff_reports.py <文件> [文件2] [-o 输出文件] [--threshold 0.2] [--header-rows N]
+"""
+
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import readers
+import transpose_engine
+import warehouse
+
+BEFORE = '改动前'
+AFTER = '改动后'
+# 变化率的绝对值达到该比例时视为显著变化
+SIGNIFICANT_CHANGE = 0.2
+
+STATUS_ADDED = '新增'
+STATUS_REMOVED = '删除'
+STATUS_CHANGED = '变化'
+STATUS_UNCHANGED = '不变'
+
+
+def _find_marker_rows(rows, marker):
+    """值等于 marker 的单元格所在的行号列表（1开始）"""
+    return [row_idx for row_idx, row in enumerate(rows, start=1)
+            if any(isinstance(value, str) and value.strip() == marker for value in row)]
+
+
+def _block_sheet(sheet, header_row, end_row, first_col):
+    """
+    把工作表中的一个宽表区域截取为 load_sheet 格式的独立工作表：
+    表头行的上一行为品牌行，表头行为指标行，first_col 为关键词名称所在列；
+    品牌行中没有合并的品牌按其后连续的空单元格补充合并区域
+    """
+    rows = [tuple(row[first_col - 1:]) for row in sheet['rows'][header_row - 2:end_row]]
+    merged_ranges = []
+    for min_row, min_col, max_row, max_col in sheet['merged_ranges']:
+        if min_row >= header_row - 1 and max_row <= end_row and min_col >= first_col:
+            merged_ranges.append((min_row - header_row + 2, min_col - first_col + 1,
+                                  max_row - header_row + 2, max_col - first_col + 1))
+    max_column = max([len(row) for row in rows] + [merged[3] for merged in merged_ranges], default=0)
+
+    brand_row = rows[0] if rows else ()
+    merged_starts = {(merged[0], merged[1]) for merged in merged_ranges}
+    for col, value in enumerate(brand_row, start=1):
+        if not (isinstance(value, str) and value.strip()) or (1, col) in merged_starts:
+            continue
+        end_col = col
+        while end_col < max_column and transpose_engine.cell_value(rows, 1, end_col + 1) in (None, ''):
+            end_col += 1
+        merged_ranges.append((1, col, 1, end_col))
+    return {'rows': rows, 'merged_ranges': merged_ranges, 'max_row': len(rows), 'max_column': max_column}
+
+
+def _block_frame(sheet_name, sheet, header_row, end_row):
+    """把一个区域转换为长表：已是长格式（含品牌、品牌类型列）时直接读取，否则按布局转置"""
+    header = sheet['rows'][header_row - 1]
+    first_col = next((col for col, value in enumerate(header, start=1) if value == '关键词名称'), None)
+    if first_col is None:
+        raise ValueError(f"{sheet_name} 第{header_row}行没有 关键词名称 列")
+    header = list(header[first_col - 1:])
+    if '品牌' in header and '品牌类型' in header:
+        width = max(i for i, value in enumerate(header, start=1) if value not in (None, ''))
+        data = []
+        for row in sheet['rows'][header_row:end_row]:
+            row = tuple(row[first_col - 1:first_col - 1 + width])
+            data.append(row + (None,) * (width - len(row)))
+        df = pd.DataFrame(data, columns=header[:width])
+        return df[df['关键词名称'].notna() & (df['关键词名称'] != '')].reset_index(drop=True)
+    block = _block_sheet(sheet, header_row, end_row, first_col)
+    return transpose_engine.transpose_sheet(sheet_name, block, mode='memory')
+
+
+def extract_blocks(path, sheet_names=None):
+    """
+    读取工作表中的 改动前、改动后 两个区域
+
+    返回:
+    dict: {工作表名称: (改动前长表, 改动后长表)}，只包含两个区域都存在的工作表
+    """
+    blocks = {}
+    with readers.open_workbook(path) as reader:
+        for sheet_name in sheet_names or reader.sheetnames:
+            if sheet_name not in transpose_engine.LAYOUTS or sheet_name not in reader.sheetnames:
+                continue
+            sheet = transpose_engine.load_sheet(reader, sheet_name)
+            before_rows = _find_marker_rows(sheet['rows'], BEFORE)
+            after_rows = _find_marker_rows(sheet['rows'], AFTER)
+            if not before_rows or not after_rows:
+                continue
+            frames = []
+            for marker_row, other_row in ((before_rows[0], after_rows[0]), (after_rows[0], before_rows[0])):
+                # 区域到另一个标记的上一行为止，另一个标记在前面时到工作表末尾
+                end_row = other_row - 1 if other_row > marker_row else sheet['max_row']
+                header_row = next((row_idx for row_idx in range(marker_row + 1, end_row + 1)
+                                   if '关键词名称' in sheet['rows'][row_idx - 1]), None)
+                if header_row is None:
+                    raise ValueError(f"{sheet_name} 第{marker_row}行开始的区域中没有找到表头")
+                frames.append(_block_frame(sheet_name, sheet, header_row, end_row))
+            blocks[sheet_name] = tuple(frames)
+            print(f"{sheet_name}: 改动前 {len(frames[0])} 行，改动后 {len(frames[1])} 行")
+    return blocks
+
+
+def diff_frames(sheet_name, before, after, threshold=SIGNIFICANT_CHANGE):
+    """
+    对比两个长表
+
+    返回:
+    DataFrame: 自然键、品牌类型、状态，每个指标的 改动前/改动后/差值/变化率，
+    以及 显著变化指标（逗号分隔，新增和删除的行列出全部指标）
+    """
+    before = before.rename(columns=dict(zip(before.columns, warehouse.warehouse_columns(before.columns))))
+    after = after.rename(columns=dict(zip(after.columns, warehouse.warehouse_columns(after.columns))))
+    columns = [column for column in after.columns if column in before.columns]
+    key = [column for column in warehouse.natural_key(sheet_name, columns) if column != '日期']
+    values = [column for column in columns if column not in key and column != '品牌类型']
+
+    # 自然键中的空值统一为空串，两边才能对齐
+    for label, df in ((BEFORE, before), (AFTER, after)):
+        df[key] = df[key].astype(object).where(df[key].notna(), '')
+        duplicates = int(df.duplicated(key).sum())
+        if duplicates:
+            print(f"{sheet_name}: {label}有 {duplicates} 行的 {'/'.join(key)} 重复，对比结果中会出现多行")
+    merged = before[key + values].merge(
+        after[key + values], on=key, how='outer', suffixes=(f'_{BEFORE}', f'_{AFTER}'),
+        indicator=True, sort=False)
+    brand_types = pd.concat([after[key + ['品牌类型']], before[key + ['品牌类型']]]).drop_duplicates(key)
+    result = merged[key].merge(brand_types, on=key, how='left') if '品牌类型' in columns else merged[key].copy()
+    result['状态'] = np.select(
+        [merged['_merge'].eq('right_only'), merged['_merge'].eq('left_only')],
+        [STATUS_ADDED, STATUS_REMOVED], STATUS_UNCHANGED).astype(object)
+
+    significant = pd.DataFrame(index=merged.index)
+    changed = np.zeros(len(merged), dtype=bool)
+    for column in values:
+        raw_old, raw_new = merged[f'{column}_{BEFORE}'], merged[f'{column}_{AFTER}']
+        old = pd.to_numeric(raw_old, errors='coerce')
+        new = pd.to_numeric(raw_new, errors='coerce')
+        delta = new.fillna(0) - old.fillna(0)
+        delta[old.isna() & new.isna()] = np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = delta / old.abs()
+        ratio[~np.isfinite(ratio)] = np.nan
+        result[f'{column}_{BEFORE}'] = raw_old.to_numpy()
+        result[f'{column}_{AFTER}'] = raw_new.to_numpy()
+        result[f'{column}_差值'] = delta.to_numpy()
+        result[f'{column}_变化率'] = ratio.to_numpy()
+        # 数值以外（如文本）只比较是否相同
+        text_differs = (old.isna() & new.isna() & ~(raw_old.isna() & raw_new.isna())
+                        & (raw_old.astype(str) != raw_new.astype(str)))
+        differs = (delta.fillna(0) != 0).to_numpy() | text_differs.to_numpy()
+        changed |= differs
+        # 原值为0或为空时变化率无法计算，有变化即视为显著
+        significant[column] = differs & ((ratio.abs() >= threshold) | ratio.isna()).to_numpy()
+
+    result.loc[changed & (result['状态'] == STATUS_UNCHANGED).to_numpy(), '状态'] = STATUS_CHANGED
+    significant.loc[result['状态'].isin([STATUS_ADDED, STATUS_REMOVED]).to_numpy(), :] = True
+    names = pd.Series([f'{column},' for column in values], index=values, dtype=object)
+    result['显著变化指标'] = (significant.dot(names).str.rstrip(',') if values
+                          else pd.Series('', index=result.index))
+    return result
+
+
+def significant_rows(diff):
+    """显著变化的行，按最大变化率的绝对值从大到小排列（新增、删除的行在最前）"""
+    selected = diff[diff['显著变化指标'] != ''].copy()
+    ratios = selected[[column for column in selected.columns if column.endswith('_变化率')]].abs()
+    order = ratios.max(axis=1).fillna(np.inf)
+    return selected.loc[order.sort_values(ascending=False, kind='stable').index].reset_index(drop=True)
+
+
+def diff_reports(paths, output_file, threshold=SIGNIFICANT_CHANGE, header_rows=None):
+    """
+    生成对比报告：每个工作表输出完整对比（<工作表>对比）和显著变化（<工作表>显著变化）两张表
+
+    参数:
+    paths: [改动前文件, 改动后文件]，或只有一个包含改动前/改动后区域的文件
+
+    返回:
+    dict: {工作表名称: 完整对比DataFrame}
+    """
+    if len(paths) == 1:
+        pairs = extract_blocks(paths[0])
+    else:
+        before_results = warehouse.read_results(paths[0], header_rows)
+        after_results = warehouse.read_results(paths[1], header_rows)
+        pairs = {sheet_name: (before_results[sheet_name], after_results[sheet_name])
+                 for sheet_name in transpose_engine.LAYOUTS
+                 if sheet_name in before_results and sheet_name in after_results}
+    if not pairs:
+        raise ValueError("没有找到可以对比的工作表")
+
+    diffs = {}
+    sheets = {}
+    for sheet_name, (before, after) in pairs.items():
+        diff = diff_frames(sheet_name, before, after, threshold)
+        diffs[sheet_name] = diff
+        sheets[f'{sheet_name}对比'] = diff
+        sheets[f'{sheet_name}显著变化'] = significant_rows(diff)
+        counts = diff['状态'].value_counts()
+        print(f"{sheet_name}: " + '，'.join(f"{status} {counts.get(status, 0)} 行" for status in (
+            STATUS_CHANGED, STATUS_ADDED, STATUS_REMOVED, STATUS_UNCHANGED))
+              + f"，显著变化 {len(sheets[f'{sheet_name}显著变化'])} 行")
+    transpose_engine.write_workbook_streaming(None, sheets, output_file)
+    return diffs
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    for option in ('-o', '--threshold', '--header-rows'):
+        if option in args:
+            index = args.index(option)
+            options[option.lstrip('-')] = args[index + 1]
+            del args[index:index + 2]
+
+    if not args or len(args) > 2:
+        print("使用方法: python diff_reports.py <改动前.xlsx> <改动后.xlsx> [-o 输出文件] [--threshold 0.2]")
+        print("          python diff_reports.py <含改动前/改动后区域的文件.xlsx>")
+        print(f"变化率绝对值达到 --threshold（默认 {SIGNIFICANT_CHANGE}）的指标标记为显著变化")
+        return
+
+    missing = [path for path in args if not os.path.exists(path)]
+    if missing:
+        print(f"找不到输入文件: {', '.join(missing)}")
+        return
+
+    base_name = os.path.splitext(os.path.basename(args[-1]))[0]
+    output_file = options.get('o') or f"{base_name}_{datetime.now().strftime('%Y%m%d')}_对比.xlsx"
+    header_rows = int(options['header-rows']) if 'header-rows' in options else None
+    diff_reports(args, output_file, float(options.get('threshold', SIGNIFICANT_CHANGE)), header_rows)
+    print(f"\n对比报告已保存: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
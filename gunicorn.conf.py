@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 生产环境配置
+启动: gunicorn -c gunicorn.conf.py wsgi:application
+以下参数均可通过同名的环境变量覆盖
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from gunicorn.workers.gthread import ThreadWorker
+
+# 监听地址，与开发模式保持一致，frp/ngrok/cloudflare 配置无需改动
+bind = os.environ.get('BIND', '0.0.0.0:8080')
+
+# 预派生的工作进程数，转置是CPU密集型任务，默认不超过CPU核数
+workers = int(os.environ.get('WEB_WORKERS', min(multiprocessing.cpu_count(), 4)))
+
+
+class JobAwareThreadWorker(ThreadWorker):
+    """
+    gthread工作进程，退出请求循环（已关闭监听、不再接收请求）后先等待本进程中运行的转置任务结束，
+    等待期间继续发送心跳；否则调度线程和任务线程随进程退出，转置子进程被终止，任务被标记为失败
+    收到SIGTERM的正常关闭同样等待，但主进程在 graceful_timeout 后会强制结束
+    """
+
+    def run(self):
+        super().run()
+        import scheduler
+        scheduler.drain(heartbeat=self.notify)
+
+
+# 每个进程再开少量线程，上传/下载等IO请求不会被正在转置的请求完全阻塞
+worker_class = JobAwareThreadWorker
+threads = int(os.environ.get('WEB_THREADS', 4))
+
+# 工作进程心跳超时，只用于发现卡死的工作进程：转置在后台任务子进程中执行，
+# 上传下载由线程处理，都不受此限制
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 120))
+keepalive = 5
+
+# 主进程预先导入应用（含pandas/openpyxl），工作进程fork后直接共享
+preload_app = True
+
+# 工作进程处理一定数量的请求后自动重启（0为不重启）。转置任务由工作进程调度，
+# 页面每秒轮询任务状态，开启后重启频繁，且重启前要等本进程运行中的任务结束（见 JobAwareThreadWorker），
+# 等待期间该进程不再接收请求；转置本身在独立子进程中执行，工作进程不积累pandas内存，默认不重启
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 0))
+max_requests_jitter = 20 if max_requests else 0
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+# 多进程共享的指标目录，必须在导入应用之前设置
+metrics_dir = os.environ.setdefault(
+    'METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'excel_transpose_metrics'))
+
+
+def on_starting(server):
+    """主进程启动时清空上一次运行遗留的指标快照"""
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """
+    子进程不继承主进程已累计的指标；每个工作进程启动自己的任务调度线程和清理线程
+    主进程不启动任何线程（fork时线程不会被复制，持有的锁可能留在加锁状态）；
+    清理线程在各工作进程中竞争清理锁，只有一个进程执行清理，其指标随该进程的快照进入 /metrics
+    """
+    import metrics
+    metrics.REGISTRY.reset()
+    import app
+    app.start_background_services()
+
+
+def worker_exit(server, worker):
+    """工作进程退出前写入尚未写出的指标（快照按间隔合并写入）"""
+    import metrics
+    metrics.REGISTRY.write_snapshot(force=True)
+
+
+def child_exit(server, worker):
+    """主进程中调用：把退出进程的累计指标并入不按进程号命名的文件"""
+    import metrics
+    metrics.REGISTRY.mark_process_dead(worker.pid)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传与输出目录的自动清理
+后台线程定期执行：
+1. 删除超过保留期的孤立上传文件和未完成的分块（进程崩溃后遗留）
+2. 删除超过保留期未被访问的输出文件
+3. 输出目录超过磁盘配额时按最近访问时间（LRU）淘汰最旧的文件
+4. 删除进程异常退出后遗留的落盘缓冲（spill.SPILL_DIR）
+5. 删除超过保留期未被浏览的结果缓存（result_cache.CACHE_DIR），按任务目录整体删除
+6. 任务记录随其输出文件一起过期：输出文件已被删除、或没有输出且结束超过输出保留期的记录删除；
+   批次记录超过输出保留期后删除
+回收的空间计入 /metrics
+gunicorn 的每个工作进程都启动清理线程，同一时间只有持有清理锁的一个进程执行清理，
+该进程退出后由其他进程接替；指标随该工作进程的快照进入 /metrics
+"""
+
+import fcntl
+import os
+import shutil
+import threading
+import time
+
+import batch_upload
+import jobs
+import metrics
+import result_cache
+import spill
+
+# 配置，可通过环境变量覆盖
+OUTPUT_TTL_SECONDS = float(os.environ.get('OUTPUT_TTL_HOURS', 72)) * 3600
+UPLOAD_TTL_SECONDS = float(os.environ.get('UPLOAD_TTL_HOURS', 6)) * 3600
+OUTPUT_QUOTA_BYTES = int(float(os.environ.get('OUTPUT_QUOTA_MB', 2048)) * 1024 * 1024)
+CLEANUP_INTERVAL_SECONDS = float(os.environ.get('CLEANUP_INTERVAL_SECONDS', 600))
+# 最近修改过的文件可能仍在写入，配额淘汰时跳过
+MIN_EVICT_AGE_SECONDS = 300
+
+# 清理锁文件，位于上传目录下
+LOCK_NAME = '.janitor.lock'
+# 不参与清理的占位文件、任务调度和清理的锁文件
+KEEP_FILES = {'.gitkeep', '.scheduler.lock', LOCK_NAME}
+# 上传目录下的任务和批次记录，不按上传文件的保留期清理，见 cleanup_jobs
+RECORD_SUBDIRS = (jobs.JOB_SUBDIR, batch_upload.BATCH_SUBDIR)
+
+RECLAIMED_BYTES = metrics.REGISTRY.register(metrics.Counter(
+    'transpose_cleanup_reclaimed_bytes_total', '自动清理回收的磁盘空间（字节）',
+    labelnames=('folder', 'reason'),
+))
+REMOVED_FILES = metrics.REGISTRY.register(metrics.Counter(
+    'transpose_cleanup_removed_files_total', '自动清理删除的文件数',
+    labelnames=('folder', 'reason'),
+))
+FOLDER_BYTES = metrics.REGISTRY.register(metrics.Gauge(
+    'transpose_folder_size_bytes', '目录当前占用的磁盘空间（字节）',
+    labelnames=('folder',),
+))
+
+_janitor_thread = None
+_janitor_lock = threading.Lock()
+
+
+def touch(path):
+    """
+    记录一次访问，供LRU淘汰使用
+    只更新访问时间，不改修改时间，下载的ETag保持不变
+    """
+    try:
+        stat = os.stat(path)
+        os.utime(path, (time.time(), stat.st_mtime))
+    except OSError:
+        pass
+
+
+def _scan(folder):
+    """列出目录下的文件，返回 (路径, 大小, 修改时间, 最近访问时间) 列表"""
+    entries = []
+    if not os.path.isdir(folder):
+        return entries
+    for root, _, files in os.walk(folder):
+        for name in files:
+            if name in KEEP_FILES:
+                continue
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime, max(stat.st_atime, stat.st_mtime)))
+    return entries
+
+
+def _remove(path, size, folder_label, reason, report):
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    RECLAIMED_BYTES.inc(size, folder=folder_label, reason=reason)
+    REMOVED_FILES.inc(folder=folder_label, reason=reason)
+    report['removed_files'] += 1
+    report['reclaimed_bytes'] += size
+    return True
+
+
+def cleanup_uploads(upload_folder, ttl_seconds=UPLOAD_TTL_SECONDS, now=None):
+    """
+    清理孤立的上传文件
+    正常流程中上传文件在转置结束后立即删除，超过保留期仍存在的都是异常遗留，
+    包括长时间没有新分块写入的分块上传会话；
+    任务和批次记录不在此清理，排队中或运行中任务的输入文件无论多久都保留
+    """
+    now = time.time() if now is None else now
+    report = {'removed_files': 0, 'reclaimed_bytes': 0}
+    record_folders = tuple(os.path.join(upload_folder, name) + os.sep for name in RECORD_SUBDIRS)
+    active_inputs = {os.path.abspath(job['input_path']) for job in jobs.list_jobs(upload_folder)
+                     if job.get('input_path')}
+    for path, size, mtime, _ in _scan(upload_folder):
+        if path.startswith(record_folders) or os.path.abspath(path) in active_inputs:
+            continue
+        if now - mtime > ttl_seconds:
+            _remove(path, size, 'uploads', 'orphan', report)
+    return report
+
+
+def _job_output_path(job, output_folder):
+    """已完成任务的输出文件路径，没有输出时返回None"""
+    download_url = (job.get('result') or {}).get('download_url')
+    return os.path.join(output_folder, os.path.basename(download_url)) if download_url else None
+
+
+def cleanup_jobs(upload_folder, output_folder, ttl_seconds=OUTPUT_TTL_SECONDS, now=None):
+    """
+    清理任务和批次记录：
+    已结束的任务在输出文件被删除（保留期或配额淘汰）后删除记录，没有输出的任务（失败、取消）
+    在结束超过保留期后删除；排队中和运行中的任务不清理；批次记录超过保留期后删除
+    """
+    now = time.time() if now is None else now
+    report = {'removed_files': 0, 'reclaimed_bytes': 0}
+    for job in jobs.list_finished_jobs(upload_folder):
+        output_path = _job_output_path(job, output_folder)
+        if output_path is not None:
+            expired = not os.path.exists(output_path)
+        else:
+            expired = now - job.get('finished_at', job['updated_at']) > ttl_seconds
+        if expired:
+            path = jobs.finished_job_path(upload_folder, job['job_id'])
+            _remove(path, _size(path), 'uploads', 'ttl', report)
+    for path, size, mtime, _ in _scan(jobs.job_folder(upload_folder)):
+        # 写记录时中断遗留的临时文件
+        if path.endswith('.tmp') and now - mtime > UPLOAD_TTL_SECONDS:
+            _remove(path, size, 'uploads', 'orphan', report)
+    for path, size, mtime, _ in _scan(os.path.join(upload_folder, batch_upload.BATCH_SUBDIR)):
+        if now - mtime > ttl_seconds:
+            _remove(path, size, 'uploads', 'ttl', report)
+    return report
+
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def cleanup_spill(spill_folder=None, ttl_seconds=UPLOAD_TTL_SECONDS, now=None):
+    """
+    清理遗留的落盘缓冲
+    正常流程中转置结束即删除，超过保留期（远大于单个请求的超时时间）仍存在的都是崩溃遗留
+    """
+    spill_folder = spill_folder or spill.SPILL_DIR
+    now = time.time() if now is None else now
+    report = {'removed_files': 0, 'reclaimed_bytes': 0}
+    for path, size, mtime, _ in _scan(spill_folder):
+        if now - mtime > ttl_seconds:
+            _remove(path, size, 'spill', 'orphan', report)
+    # 删除已经清空的缓冲目录
+    if os.path.isdir(spill_folder):
+        for name in os.listdir(spill_folder):
+            path = os.path.join(spill_folder, name)
+            if os.path.isdir(path) and not os.listdir(path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+    return report
+
+
+def cleanup_results(cache_folder=None, ttl_seconds=OUTPUT_TTL_SECONDS, now=None):
+    """
+    清理结果缓存：保留期与输出文件相同，从最近一次浏览算起；
+    被中断的任务遗留的临时目录没有清单文件，按目录修改时间计算
+    """
+    cache_folder = cache_folder or result_cache.CACHE_DIR
+    now = time.time() if now is None else now
+    report = {'removed_files': 0, 'reclaimed_bytes': 0, 'remaining_bytes': 0}
+    if not os.path.isdir(cache_folder):
+        return report
+    for name in os.listdir(cache_folder):
+        path = os.path.join(cache_folder, name)
+        if not os.path.isdir(path):
+            continue
+        entries = _scan(path)
+        size = sum(entry[1] for entry in entries)
+        try:
+            stat = os.stat(os.path.join(path, 'manifest.json'))
+            last_access = max(stat.st_atime, stat.st_mtime)
+        except OSError:
+            last_access = os.stat(path).st_mtime
+        if now - last_access <= ttl_seconds:
+            report['remaining_bytes'] += size
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        RECLAIMED_BYTES.inc(size, folder='results', reason='ttl')
+        REMOVED_FILES.inc(len(entries), folder='results', reason='ttl')
+        report['removed_files'] += len(entries)
+        report['reclaimed_bytes'] += size
+    return report
+
+
+def cleanup_outputs(output_folder, ttl_seconds=OUTPUT_TTL_SECONDS,
+                    quota_bytes=OUTPUT_QUOTA_BYTES, now=None):
+    """
+    清理输出目录：先按保留期删除，再按LRU淘汰到配额以内
+    """
+    now = time.time() if now is None else now
+    report = {'removed_files': 0, 'reclaimed_bytes': 0}
+    remaining = []
+    for entry in _scan(output_folder):
+        path, size, _, last_access = entry
+        if now - last_access > ttl_seconds:
+            _remove(path, size, 'outputs', 'ttl', report)
+        else:
+            remaining.append(entry)
+
+    total = sum(entry[1] for entry in remaining)
+    if total > quota_bytes:
+        # 最久未访问的排在前面
+        remaining.sort(key=lambda entry: entry[3])
+        for path, size, mtime, _ in remaining:
+            if total <= quota_bytes:
+                break
+            if now - mtime < MIN_EVICT_AGE_SECONDS:
+                continue
+            if _remove(path, size, 'outputs', 'quota', report):
+                total -= size
+    report['remaining_bytes'] = total
+    return report
+
+
+def run_cleanup(upload_folder, output_folder):
+    """执行一轮完整清理并更新目录占用指标"""
+    uploads_report = cleanup_uploads(upload_folder)
+    outputs_report = cleanup_outputs(output_folder)
+    # 在输出清理之后执行，本轮被删除的输出文件对应的任务记录同时过期
+    jobs_report = cleanup_jobs(upload_folder, output_folder)
+    spill_report = cleanup_spill()
+    results_report = cleanup_results()
+    FOLDER_BYTES.set(sum(entry[1] for entry in _scan(upload_folder)), folder='uploads')
+    FOLDER_BYTES.set(outputs_report['remaining_bytes'], folder='outputs')
+    FOLDER_BYTES.set(results_report['remaining_bytes'], folder='results')
+    reports = (uploads_report, jobs_report, outputs_report, spill_report, results_report)
+    reclaimed = sum(report['reclaimed_bytes'] for report in reports)
+    if reclaimed:
+        print(f"自动清理: 删除 {sum(report['removed_files'] for report in reports)} 个文件，"
+              f"回收 {reclaimed / 1024 / 1024:.2f} MB")
+    return {'uploads': uploads_report, 'jobs': jobs_report, 'outputs': outputs_report,
+            'spill': spill_report, 'results': results_report}
+
+
+class _JanitorLock:
+    """
+    跨进程的清理锁，不等待：已被其他进程持有时返回False，下一轮再试；
+    获取后一直持有，进程退出时由系统释放
+    """
+
+    def __init__(self, upload_folder):
+        self.path = os.path.join(upload_folder, LOCK_NAME)
+        self._file = None
+
+    def acquire(self):
+        if self._file is not None:
+            return True
+        lock_file = open(self.path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+
+def start_janitor(upload_folder, output_folder, interval=CLEANUP_INTERVAL_SECONDS):
+    """启动后台清理线程，同一进程内只启动一次；多个进程都启动时只有持有清理锁的进程执行清理"""
+    global _janitor_thread
+    with _janitor_lock:
+        if _janitor_thread is not None and _janitor_thread.is_alive():
+            return _janitor_thread
+
+        lock = _JanitorLock(upload_folder)
+
+        def loop():
+            while True:
+                try:
+                    if lock.acquire():
+                        run_cleanup(upload_folder, output_folder)
+                except Exception as e:
+                    print(f"自动清理出错: {str(e)}")
+                time.sleep(interval)
+
+        _janitor_thread = threading.Thread(target=loop, name='janitor', daemon=True)
+        _janitor_thread.start()
+        return _janitor_thread
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在独立子进程中执行转置
+调度线程留在gunicorn工作进程中等待子进程结束，期间检查取消请求和运行时间上限；
+需要停止时直接结束子进程，CPU和内存立即释放，不影响同一工作进程中的其他请求
+
+子进程由 forkserver 创建：服务进程只预先导入转置引擎、不运行其他线程，
+避免从多线程的gunicorn工作进程直接fork时继承被其他线程持有的锁
+
+环境变量:
+    JOB_TIMEOUT_SECONDS   单个任务的运行时间上限（默认1800秒，不含排队时间）
+    JOB_CPU_SECONDS       单个任务的CPU时间上限（默认1800秒），由内核通过RLIMIT_CPU强制
+"""
+
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
+import time
+import traceback
+
+import spill
+import transpose_engine
+
+JOB_TIMEOUT_SECONDS = int(os.environ.get('JOB_TIMEOUT_SECONDS', '1800'))
+JOB_CPU_SECONDS = int(os.environ.get('JOB_CPU_SECONDS', '1800'))
+# 检查取消请求和运行时间的间隔（秒）
+POLL_INTERVAL_SECONDS = 0.5
+# 发送SIGTERM后等待子进程退出的时间（秒），超时后SIGKILL
+TERMINATE_GRACE_SECONDS = 5
+
+# 任务被终止的原因
+REASON_CANCELLED = 'cancelled'
+REASON_TIMEOUT = 'timeout'
+REASON_CPU = 'cpu_limit'
+
+_context = multiprocessing.get_context('forkserver')
+_context.set_forkserver_preload(['job_process'])
+
+
+class JobAborted(Exception):
+    """任务被取消或超出资源上限而终止，reason 为 REASON_* 之一"""
+
+    def __init__(self, message, reason):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _child(conn, input_path, output_path, filters, mode, scratch_dir, cpu_seconds, cache_dir, sinks,
+           header_rows=None):
+    """子进程入口：执行转置，把各工作表形状和工作表回调事件发回父进程"""
+    if cpu_seconds:
+        # 超过软限制时内核发送SIGXCPU结束进程
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + TERMINATE_GRACE_SECONDS))
+    # 落盘缓冲放在任务自己的目录中，任务结束后由父进程整体删除
+    spill.SPILL_DIR = scratch_dir
+
+    sheet_events = []
+
+    def observer(layout, seconds, output_rows, success):
+        sheet_events.append((layout, seconds, output_rows, success))
+
+    try:
+        results = transpose_engine.process_workbook(
+            input_path, output_path, observer=observer, header_rows=header_rows, filters=filters, mode=mode,
+            cache_dir=cache_dir, sinks=sinks)
+        shapes = {name: tuple(df.shape) for name, df in results.items() if df is not None}
+        conn.send((shapes, sheet_events))
+    except Exception as e:
+        print(f"处理过程中出现错误: {str(e)}")
+        traceback.print_exc()
+        conn.send((None, sheet_events))
+    finally:
+        conn.close()
+
+
+def _stop(process):
+    """结束子进程：先SIGTERM，宽限期后仍未退出则SIGKILL"""
+    if process.is_alive():
+        process.terminate()
+        process.join(TERMINATE_GRACE_SECONDS)
+    if process.is_alive():
+        process.kill()
+        process.join()
+
+
+def run_transpose(input_path, output_path, filters=None, mode='auto', should_cancel=None,
+                  timeout=None, cpu_seconds=None, scratch_dir=None, cache_dir=None, sinks=None,
+                  header_rows=None):
+    """
+    在子进程中转置一个工作簿
+
+    参数:
+    should_cancel: 无参函数，返回True时终止任务
+    timeout: 运行时间上限（秒），默认 JOB_TIMEOUT_SECONDS
+    cpu_seconds: CPU时间上限（秒），默认 JOB_CPU_SECONDS
+    scratch_dir: 落盘缓冲目录，默认在 spill.SPILL_DIR 下新建，结束后删除
+    cache_dir: 可选，转置结果的列式缓存目录，见 transpose_engine.process_workbook
+    sinks: 可选，结果的其他输出（需可pickle），在子进程中调用，见 transpose_engine.process_workbook
+    header_rows: 可选，表头行数，缺省使用布局配置
+
+    返回:
+    tuple: (各工作表形状字典，失败时为None; 工作表回调事件 [(布局, 耗时, 输出行数, 是否成功), ...])
+
+    取消、超时或超出CPU时间时抛出 JobAborted
+    """
+    timeout = JOB_TIMEOUT_SECONDS if timeout is None else timeout
+    cpu_seconds = JOB_CPU_SECONDS if cpu_seconds is None else cpu_seconds
+    scratch_dir = scratch_dir or os.path.join(spill.SPILL_DIR, f'job_{os.getpid()}_{time.time_ns()}')
+    os.makedirs(scratch_dir, exist_ok=True)
+
+    receiver, sender = _context.Pipe(duplex=False)
+    process = _context.Process(
+        target=_child, daemon=True,
+        args=(sender, input_path, output_path, filters, mode, scratch_dir, cpu_seconds, cache_dir, sinks,
+              header_rows))
+    deadline = time.monotonic() + timeout
+    try:
+        process.start()
+        # 父进程不保留写端，子进程退出后 poll 立即返回
+        sender.close()
+        while not receiver.poll(POLL_INTERVAL_SECONDS):
+            if should_cancel is not None and should_cancel():
+                raise JobAborted('任务已取消', REASON_CANCELLED)
+            if time.monotonic() > deadline:
+                raise JobAborted(f'运行时间超过 {timeout} 秒的上限，已终止', REASON_TIMEOUT)
+        try:
+            return receiver.recv()
+        except EOFError:
+            # 子进程没有发回结果就退出了
+            process.join()
+            if process.exitcode == -signal.SIGXCPU:
+                raise JobAborted(f'CPU时间超过 {cpu_seconds} 秒的上限，已终止', REASON_CPU)
+            print(f"转置子进程异常退出，退出码 {process.exitcode}")
+            return None, []
+    finally:
+        _stop(process)
+        receiver.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置任务记录
+上传后立即返回任务ID，转置在后台执行；任务状态保存在磁盘上的JSON文件中，
+gunicorn多进程部署时任何一个工作进程都能查询到其他进程中运行的任务；
+已结束的任务记录移到 finished 子目录，调度线程每次轮询只需读取排队中和运行中的记录
+
+状态: queued（排队）-> running（处理中）-> done（完成）/ failed（失败）/ cancelled（已取消）
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+# 任务记录存放的子目录（位于上传目录下，由自动清理按上传文件保留期删除）
+JOB_SUBDIR = 'jobs'
+# 已结束任务记录的子目录（位于任务记录目录下）
+FINISHED_SUBDIR = 'finished'
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f-]{32,36}$')
+_write_lock = threading.Lock()
+
+
+class JobError(Exception):
+    """任务查询错误，附带HTTP状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def job_folder(upload_folder):
+    folder = os.path.join(upload_folder, JOB_SUBDIR)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def finished_folder(upload_folder):
+    folder = os.path.join(job_folder(upload_folder), FINISHED_SUBDIR)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _job_path(upload_folder, job_id, finished=False):
+    if not job_id or not _JOB_ID_PATTERN.match(job_id):
+        raise JobError('无效的任务ID', 404)
+    folder = finished_folder(upload_folder) if finished else job_folder(upload_folder)
+    return os.path.join(folder, f"{job_id}.json")
+
+
+def finished_job_path(upload_folder, job_id):
+    """已结束任务记录的路径"""
+    return _job_path(upload_folder, job_id, finished=True)
+
+
+def _save(path, job):
+    """先写临时文件再替换，查询方不会读到写了一半的记录"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _archive(upload_folder, job):
+    """
+    把已结束的任务记录移到 finished 子目录：先写入新位置再删除旧记录，
+    get_job 先查原位置、找不到再查 finished，任何时刻都能读到记录
+    """
+    _save(_job_path(upload_folder, job['job_id'], finished=True), job)
+    try:
+        os.remove(_job_path(upload_folder, job['job_id']))
+    except FileNotFoundError:
+        pass
+
+
+def create_job(upload_folder, job_id, filename, **fields):
+    """
+    创建任务记录
+
+    参数:
+    job_id: 任务ID，同时用作输出文件名前缀
+    filename: 原始文件名
+    fields: 其他需要保存的信息，例如预检结果 estimate
+
+    返回:
+    dict: 任务记录
+    """
+    now = time.time()
+    job = {
+        'job_id': job_id,
+        'filename': filename,
+        'status': STATUS_QUEUED,
+        'created_at': now,
+        'updated_at': now,
+    }
+    job.update(fields)
+    with _write_lock:
+        _save(_job_path(upload_folder, job_id), job)
+    return job
+
+
+def get_job(upload_folder, job_id):
+    """读取任务记录，不存在时抛出 JobError(404)"""
+    for finished in (False, True):
+        try:
+            with open(_job_path(upload_folder, job_id, finished), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            continue
+    raise JobError('任务不存在或已过期', 404)
+
+
+def _read_folder(folder):
+    result = []
+    for name in os.listdir(folder):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(folder, name), 'r', encoding='utf-8') as f:
+                result.append(json.load(f))
+        except (OSError, ValueError):
+            # 记录可能刚被清理或移动，跳过
+            continue
+    return result
+
+
+def list_jobs(upload_folder):
+    """读取排队中和运行中的任务记录"""
+    result = []
+    for job in _read_folder(job_folder(upload_folder)):
+        if job['status'] in FINISHED_STATUSES:
+            # 旧版本留在原位置的已结束记录，移走后不再重复读取
+            with _write_lock:
+                _archive(upload_folder, job)
+            continue
+        result.append(job)
+    return result
+
+
+def list_finished_jobs(upload_folder):
+    """读取已结束的任务记录（供自动清理使用）"""
+    return _read_folder(finished_folder(upload_folder))
+
+
+def update_job(upload_folder, job_id, **fields):
+    """更新任务记录中的字段并返回更新后的记录"""
+    with _write_lock:
+        job = get_job(upload_folder, job_id)
+        job.update(fields)
+        job['updated_at'] = time.time()
+        if job['status'] in FINISHED_STATUSES:
+            _archive(upload_folder, job)
+        else:
+            _save(_job_path(upload_folder, job_id), job)
+    return job
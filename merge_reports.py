@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多期报告合并
+把多个转置结果（或原始报告）合并为一个去重的长表工作簿：
+每个文件的报告日期取自文件名（或 --date），已有 日期 列的文件（如之前的合并结果）沿用原值；
+各文件的列按出现顺序取并集，AI平台列统一为 AI平台；
+按自然键 (日期, 关键词名称, 品牌, AI平台, ...) 去重，同一键出现多次时以日期较新、
+命令行中靠后的文件为准
+
+去重用 pandas 的哈希分组一次完成，不逐行比较，几十个周报合并只需数秒
+
+用法:
+    python merge_reports.py <文件1.xlsx> <文件2.xlsx> [...] [-o 输出文件] [--date YYYY-MM-DD] [--header-rows N]
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import transpose_engine
+import warehouse
+
+
+def _iso_date(value):
+    """日期单元格转为 YYYY-MM-DD，空值返回None"""
+    if value is None or pd.isna(value):
+        return None
+    if hasattr(value, 'date'):
+        return value.date().isoformat()
+    return str(value).strip()[:10] or None
+
+
+def _with_date(df, report_date):
+    """加上 日期 列并统一AI平台列名；已有日期的行保留原值"""
+    df = df.rename(columns=dict(zip(df.columns, warehouse.warehouse_columns(df.columns))))
+    dates = df.pop('日期').map(_iso_date).fillna(report_date) if '日期' in df.columns else report_date
+    df.insert(0, '日期', dates)
+    return df
+
+
+def merge_frames(sheet_name, frames):
+    """
+    合并同一布局的多个长表并按自然键去重
+
+    参数:
+    frames: [(DataFrame, 来源文件), ...]，按优先级从低到高排列
+
+    返回:
+    tuple: (合并后的DataFrame, 被覆盖的行数)
+    """
+    columns = []
+    for df, _ in frames:
+        columns.extend(column for column in df.columns if column not in columns)
+    combined = pd.concat([df.reindex(columns=columns) for df, _ in frames], ignore_index=True)
+    if not len(combined):
+        return combined, 0
+
+    key = warehouse.natural_key(sheet_name, columns)
+    # 与数据仓库一致：自然键中的空值视为空串，避免 None 与 NaN 被当成不同的键
+    key_frame = combined[key].astype(object).where(combined[key].notna(), '')
+    duplicated = key_frame.duplicated(keep='last')
+    merged = combined[~duplicated.to_numpy()]
+    # 同一日期内保持原始顺序，日期之间从早到晚
+    merged = merged.sort_values('日期', kind='stable').reset_index(drop=True)
+    return merged, int(duplicated.sum())
+
+
+def merge_reports(paths, output_file, report_date=None, header_rows=None):
+    """
+    合并多个文件并写出
+
+    参数:
+    report_date: 文件名中没有日期时使用的报告日期，缺省为当天
+
+    返回:
+    dict: {工作表名称: 合并后的DataFrame}
+    """
+    start_time = time.perf_counter()
+    default_date = warehouse.normalize_date(report_date) if report_date else None
+    loaded = []
+    for order, path in enumerate(paths):
+        file_date = warehouse.date_in_name(path) or default_date
+        if file_date is None:
+            file_date = datetime.now().date().isoformat()
+            print(f"{path}: 文件名中没有日期，按 {file_date} 处理")
+        print(f"读取 {path}（报告日期 {file_date}）")
+        loaded.append((file_date, order, path, warehouse.read_results(path, header_rows)))
+    # 日期较新的文件优先，同一日期按命令行顺序
+    loaded.sort(key=lambda item: (item[0], item[1]))
+
+    merged = {}
+    for sheet_name in transpose_engine.LAYOUTS:
+        frames = [(_with_date(results[sheet_name], file_date), path)
+                  for file_date, _, path, results in loaded if sheet_name in results]
+        if not frames:
+            continue
+        merged[sheet_name], replaced = merge_frames(sheet_name, frames)
+        total = sum(len(df) for df, _ in frames)
+        print(f"{sheet_name}: {len(frames)} 个文件共 {total} 行，去重后 {len(merged[sheet_name])} 行"
+              f"（覆盖 {replaced} 行）")
+
+    transpose_engine.write_workbook_streaming(None, merged, output_file)
+    print(f"合并完成，耗时 {time.perf_counter() - start_time:.2f} 秒: {output_file}")
+    return merged
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    for option in ('-o', '--date', '--header-rows'):
+        if option in args:
+            index = args.index(option)
+            options[option.lstrip('-')] = args[index + 1]
+            del args[index:index + 2]
+
+    if not args:
+        print("使用方法: python merge_reports.py <文件1.xlsx> <文件2.xlsx> [...] [-o 输出文件] [--date YYYY-MM-DD]")
+        print("输入可以是转置结果或原始报告，报告日期取自文件名（如 报表_20250918.xlsx）")
+        return
+
+    missing = [path for path in args if not os.path.exists(path)]
+    if missing:
+        print(f"找不到输入文件: {', '.join(missing)}")
+        return
+
+    output_file = options.get('o') or f"合并_{datetime.now().strftime('%Y%m%d')}_{len(args)}个报告.xlsx"
+    header_rows = int(options['header-rows']) if 'header-rows' in options else None
+    merge_reports(args, output_file, options.get('date'), header_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标收集模块
+在进程内累计计数器、仪表和直方图，由/metrics接口按Prometheus文本格式导出，
+不依赖任何外部服务，本地采集器直接抓取即可
+
+多进程部署（gunicorn）时设置环境变量 METRICS_MULTIPROC_DIR，
+各进程把自己的指标快照写入该目录，导出时合并所有进程的数据；
+快照最多每 SNAPSHOT_INTERVAL_SECONDS 秒写一次，导出时立即写入；
+退出的进程的计数器和直方图并入不按进程号命名的累计文件，新进程复用同一进程号时不会覆盖
+"""
+
+import bisect
+import glob
+import json
+import os
+import threading
+import time
+
+# Prometheus文本格式的Content-Type
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# 多进程模式下两次写入快照的最小间隔（秒），期间的变化由定时器合并写入
+SNAPSHOT_INTERVAL_SECONDS = 1.0
+# 已退出进程的累计数据文件名
+DEAD_SNAPSHOT_NAME = 'metrics_dead.json'
+
+
+def _escape_label_value(value):
+    """转义标签值中的特殊字符"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    """生成 {a="1",b="2"} 形式的标签串"""
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.extend(f'{name}="{_escape_label_value(value)}"' for name, value in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    """格式化数值，整数不带小数点，无穷大写为+Inf"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类，按标签值分组保存数据"""
+
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        self._registry = None
+
+    def _key(self, labels):
+        """把关键字参数形式的标签转换为有序元组"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _changed(self):
+        """数据变化后通知注册表写入多进程快照"""
+        if self._registry is not None:
+            self._registry.write_snapshot()
+
+    def snapshot(self):
+        """当前进程的数据副本，格式为 [[标签值列表, 数值], ...]"""
+        with self._lock:
+            return [[list(key), json.loads(json.dumps(value))] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge_value(a, b):
+        """合并不同进程的同一组标签的数值"""
+        return a + b
+
+    def render(self, values=None):
+        """生成该指标的文本格式，values 为合并后的数据，缺省使用本进程数据"""
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}',
+        ]
+        if values is None:
+            with self._lock:
+                items = sorted(self._values.items())
+        else:
+            items = sorted(values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [
+            f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+            for key, value in items
+        ]
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._changed()
+
+
+class Gauge(_Metric):
+    """
+    可增可减的仪表，例如正在处理的任务数
+    multiprocess_mode 决定多进程导出时如何合并：
+    sum 把各进程的值相加（各进程分别统计的量），
+    mostrecent 取最后一次更新的值（各进程都会读到的全局量，如队列长度，相加会重复计算）
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), multiprocess_mode='sum'):
+        super().__init__(name, documentation, labelnames)
+        if multiprocess_mode not in ('sum', 'mostrecent'):
+            raise ValueError(f"不支持的多进程合并方式: {multiprocess_mode}")
+        self.multiprocess_mode = multiprocess_mode
+        self._updated_at = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+            self._updated_at[key] = time.time()
+        self._changed()
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+            self._updated_at[key] = time.time()
+        self._changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def snapshot(self):
+        """mostrecent 方式的数值带上更新时间，格式为 [数值, 时间戳]"""
+        if self.multiprocess_mode != 'mostrecent':
+            return super().snapshot()
+        with self._lock:
+            return [[list(key), [value, self._updated_at.get(key, 0)]] for key, value in self._values.items()]
+
+    def merge_value(self, a, b):
+        if self.multiprocess_mode != 'mostrecent':
+            return a + b
+        return a if a[1] >= b[1] else b
+
+    def render(self, values=None):
+        if values is not None and self.multiprocess_mode == 'mostrecent':
+            values = {key: value[0] for key, value in values.items()}
+        return super().render(values)
+
+
+class Histogram(_Metric):
+    """累积分桶直方图，采集器可据此计算分位数"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0}
+                self._values[key] = state
+            # 最后一个位置对应+Inf桶
+            state['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            state['sum'] += value
+        self._changed()
+
+    @staticmethod
+    def merge_value(a, b):
+        return {
+            'counts': [x + y for x, y in zip(a['counts'], b['counts'])],
+            'sum': a['sum'] + b['sum'],
+        }
+
+    def _render_samples(self, items):
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self, multiproc_dir=None):
+        self._metrics = []
+        self.multiproc_dir = multiproc_dir
+        self._snapshot_lock = threading.Lock()
+        self._last_write = 0.0
+        self._timer = None
+
+    def register(self, metric):
+        metric._registry = self
+        self._metrics.append(metric)
+        return metric
+
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.multiproc_dir, f"metrics_{pid or os.getpid()}.json")
+
+    @staticmethod
+    def _dump(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def write_snapshot(self, force=False):
+        """
+        多进程模式下把本进程的指标写入快照文件
+        距上次写入不到 SNAPSHOT_INTERVAL_SECONDS 时只安排一次延迟写入，force 为真时立即写入
+        """
+        if not self.multiproc_dir:
+            return
+        with self._snapshot_lock:
+            wait = self._last_write + SNAPSHOT_INTERVAL_SECONDS - time.monotonic()
+            if not force and wait > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._deferred_write)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._write_locked()
+
+    def _deferred_write(self):
+        with self._snapshot_lock:
+            self._timer = None
+            self._write_locked()
+
+    def _write_locked(self):
+        data = {metric.name: metric.snapshot() for metric in self._metrics}
+        os.makedirs(self.multiproc_dir, exist_ok=True)
+        self._dump(self._snapshot_path(), data)
+        self._last_write = time.monotonic()
+
+    def _merge_into(self, merged, data):
+        """把一个快照的数据合并到 {指标名: {标签值元组: 数值}}"""
+        by_name = {metric.name: metric for metric in self._metrics}
+        for name, items in data.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            values = merged.setdefault(name, {})
+            for key, value in items:
+                key = tuple(key)
+                values[key] = metric.merge_value(values[key], value) if key in values else value
+
+    def _merged_values(self):
+        """读取所有进程的快照（包括已退出进程的累计文件）并按指标、标签合并"""
+        merged = {metric.name: {} for metric in self._metrics}
+        for path in glob.glob(os.path.join(self.multiproc_dir, 'metrics_*.json')):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._merge_into(merged, data)
+        return merged
+
+    def reset(self):
+        """
+        清空本进程的数据
+        gunicorn预加载模式下子进程会继承主进程的数据，fork之后调用以免重复统计
+        """
+        for metric in self._metrics:
+            with metric._lock:
+                metric._values.clear()
+        # 定时器线程不会随fork复制，子进程重新开始计时
+        self._timer = None
+        self._last_write = 0.0
+
+    def mark_process_dead(self, pid):
+        """
+        工作进程退出后由主进程调用：仪表数据随进程失效直接丢弃；
+        计数器和直方图是累计值，并入 DEAD_SNAPSHOT_NAME 后删除该进程的快照，
+        以免重启工作进程后数据倒退，也不会被之后复用同一进程号的新进程覆盖
+        """
+        if not self.multiproc_dir:
+            return
+        path = self._snapshot_path(pid)
+        dead_path = os.path.join(self.multiproc_dir, DEAD_SNAPSHOT_NAME)
+        with self._snapshot_lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                return
+            merged = {}
+            try:
+                with open(dead_path, 'r', encoding='utf-8') as f:
+                    self._merge_into(merged, json.load(f))
+            except (OSError, ValueError):
+                pass
+            gauges = {metric.name for metric in self._metrics if metric.type_name == 'gauge'}
+            self._merge_into(merged, {name: items for name, items in data.items() if name not in gauges})
+            self._dump(dead_path, {name: [[list(key), value] for key, value in values.items()]
+                                   for name, values in merged.items()})
+            os.remove(path)
+
+    def render(self):
+        """导出全部指标"""
+        lines = []
+        if self.multiproc_dir:
+            self.write_snapshot(force=True)
+            merged = self._merged_values()
+            for metric in self._metrics:
+                lines.extend(metric.render(merged[metric.name]))
+        else:
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry(os.environ.get('METRICS_MULTIPROC_DIR'))
+
+# 请求与任务
+UPLOAD_SIZE_BYTES = REGISTRY.register(Histogram(
+    'transpose_upload_size_bytes', '上传文件大小（字节）',
+    buckets=(64 * 1024, 256 * 1024, 1024 ** 2, 5 * 1024 ** 2, 10 * 1024 ** 2,
+             25 * 1024 ** 2, 50 * 1024 ** 2, 100 * 1024 ** 2, 250 * 1024 ** 2),
+))
+JOB_DURATION_SECONDS = REGISTRY.register(Histogram(
+    'transpose_job_duration_seconds', '单个转置任务总耗时（秒）',
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600),
+))
+JOBS_IN_PROGRESS = REGISTRY.register(Gauge(
+    'transpose_jobs_in_progress', '正在处理的转置任务数',
+))
+# 队列保存在磁盘上，每个进程的调度线程读到的是同一个值，取最近一次调度时的数量
+JOBS_QUEUED = REGISTRY.register(Gauge(
+    'transpose_jobs_queued', '排队等待的转置任务数', multiprocess_mode='mostrecent',
+))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    'transpose_jobs_total', '转置任务数，按结果统计', labelnames=('status',),
+))
+
+# 按工作表布局统计
+SHEET_DURATION_SECONDS = REGISTRY.register(Histogram(
+    'transpose_sheet_duration_seconds', '单个工作表转置耗时（秒）',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800),
+    labelnames=('layout',),
+))
+SHEET_OUTPUT_ROWS = REGISTRY.register(Histogram(
+    'transpose_output_rows', '单个工作表转置后的行数',
+    buckets=(100, 1000, 10000, 50000, 100000, 500000, 1000000, 5000000),
+    labelnames=('layout',),
+))
+SHEETS_TOTAL = REGISTRY.register(Counter(
+    'transpose_sheets_total', '工作表转置次数，按布局和结果统计',
+    labelnames=('layout', 'status'),
+))
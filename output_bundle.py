@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置结果打包模块
+把输出工作簿的每个工作表导出为CSV或Parquet并压缩为zip，
+生成的zip缓存在输出文件旁边，重复下载时直接复用，可配合ETag和断点续传
+"""
+
+import csv
+import io
+import os
+import tempfile
+import zipfile
+
+import openpyxl
+import pandas as pd
+
+BUNDLE_FORMATS = ('csv', 'parquet')
+
+
+def parquet_available():
+    """检查是否安装了写Parquet所需的pyarrow"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def bundle_path_for(output_path, fmt):
+    """输出文件对应的打包文件路径"""
+    return f"{os.path.splitext(output_path)[0]}.{fmt}.zip"
+
+
+def _write_csv_members(output_path, zf):
+    """逐行读取工作表并直接写入zip成员，不在内存中保留整张表"""
+    wb = openpyxl.load_workbook(output_path, read_only=True, data_only=True)
+    try:
+        for sheet_name in wb.sheetnames:
+            with zf.open(f"{sheet_name}.csv", 'w') as member:
+                # 带BOM的UTF-8，Excel直接打开不会乱码
+                text = io.TextIOWrapper(member, encoding='utf-8-sig', newline='')
+                writer = csv.writer(text)
+                for row in wb[sheet_name].iter_rows(values_only=True):
+                    writer.writerow(['' if value is None else value for value in row])
+                text.flush()
+                text.detach()
+    finally:
+        wb.close()
+
+
+def _write_parquet_members(output_path, zf):
+    """每个工作表写成一个Parquet文件，Parquet自带压缩，zip中不再重复压缩"""
+    sheets = pd.read_excel(output_path, sheet_name=None)
+    for sheet_name, df in sheets.items():
+        # 原样复制的工作表可能混有多种类型，统一转为字符串避免写入失败
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].map(lambda v: v if v is None or pd.isna(v) else str(v))
+        df.columns = [str(column) for column in df.columns]
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        zf.writestr(zipfile.ZipInfo(f"{sheet_name}.parquet"), buffer.getvalue(),
+                    compress_type=zipfile.ZIP_STORED)
+
+
+def build_bundle(output_path, fmt='csv'):
+    """
+    生成（或复用已缓存的）打包文件
+
+    参数:
+    output_path: 转置输出的xlsx路径
+    fmt: 'csv' 或 'parquet'
+
+    返回:
+    str: zip文件路径
+    """
+    if fmt not in BUNDLE_FORMATS:
+        raise ValueError(f"不支持的打包格式: {fmt}")
+    if fmt == 'parquet' and not parquet_available():
+        raise ValueError("服务器未安装pyarrow，无法导出Parquet")
+
+    bundle_path = bundle_path_for(output_path, fmt)
+    if (os.path.exists(bundle_path)
+            and os.path.getmtime(bundle_path) >= os.path.getmtime(output_path)):
+        return bundle_path
+
+    # 先写临时文件再原子替换，并发请求不会读到写了一半的zip
+    fd, tmp_path = tempfile.mkstemp(suffix='.zip.tmp', dir=os.path.dirname(bundle_path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f, zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED) as zf:
+            if fmt == 'csv':
+                _write_csv_members(output_path, zf)
+            else:
+                _write_parquet_members(output_path, zf)
+        os.replace(tmp_path, bundle_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return bundle_path
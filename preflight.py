@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置任务预检
+在真正加载工作簿之前估算任务规模：
+xlsx只读取每个工作表XML开头的 <dimension ref> 和合并单元格结构，
+再抽样解析前几百行得到品牌数据块的非空比例，毫秒级给出
+每个布局的输出行数、耗时和内存峰值估计，并据此选择写出方式或拒绝超大任务
+
+用法: python preflight.py <输入文件>
+"""
+
+import os
+import sys
+
+import readers
+import spill
+import transpose_engine
+
+# 抽样解析的数据行数，用于估计品牌数据块的非空比例
+SAMPLE_ROWS = 200
+# 无法抽样时假定的非空比例
+DEFAULT_FILL_RATIO = 0.25
+
+# 耗时系数（秒），按开发机上实测的吞吐量估算
+SECONDS_PER_INPUT_CELL = 2e-6
+SECONDS_PER_OUTPUT_CELL = {'memory': 20e-6, 'streaming': 11e-6, 'spill': 12e-6}
+# 读入的每个单元格在内存中的大致占用（值对象、行元组和数组副本）
+INPUT_BYTES_PER_CELL = 100
+# 各写出方式下输出的每个单元格的大致内存占用；落盘方式只在内存中保留一个批次
+OUTPUT_BYTES_PER_CELL = {'memory': spill.BYTES_PER_CELL, 'streaming': 100, 'spill': 0}
+
+# 单个任务允许的内存峰值，超出时拒绝
+MAX_JOB_MEMORY_BYTES = int(os.environ.get('MAX_JOB_MEMORY_MB', '6144')) * 1024 * 1024
+# xlsx单个工作表最多1048576行（含表头）
+EXCEL_MAX_ROWS = 1048576
+# 自动识别表头行数时检查的最大行数
+MAX_HEADER_ROWS = 8
+
+
+def _sheet_size(reader, sheet_name):
+    """工作表的行数和列数，优先使用文件声明的使用区域，否则逐行统计"""
+    dimension = reader.dimension(sheet_name)
+    # 部分工具生成的文件把使用区域写成A1，此时同样逐行统计
+    if dimension is not None and dimension[2:] != (1, 1):
+        return dimension[2], dimension[3]
+    rows = columns = 0
+    for rows, row in enumerate(reader.iter_rows(sheet_name), start=1):
+        columns = max(columns, len(row))
+    return rows, columns
+
+
+def _brand_blocks(merged_ranges, layout):
+    """第1行表头中位于基础信息列右侧的合并区域，即品牌数据块，返回 (起始列, 结束列) 列表"""
+    id_count = len(layout['id_columns'])
+    return sorted((min_col, max_col) for min_row, min_col, max_row, max_col in merged_ranges
+                  if min_row == 1 and min_col > id_count)
+
+
+def _sample_fill_ratio(reader, sheet_name, layout, blocks):
+    """抽样前 SAMPLE_ROWS 行数据，统计有数据的品牌块比例"""
+    first_row = layout['data_start_row']
+    total = hits = 0
+    for row_idx, row in enumerate(reader.iter_rows(sheet_name, max_row=first_row + SAMPLE_ROWS - 1),
+                                  start=1):
+        if row_idx < first_row or not row:
+            continue
+        for start_col, end_col in blocks:
+            total += 1
+            if any(value is not None and value != '' and value != 0
+                   for value in row[start_col - 1:end_col]):
+                hits += 1
+    return hits / total if total else DEFAULT_FILL_RATIO
+
+
+def detect_header_rows(reader, sheet_name):
+    """
+    识别布局工作表的表头行数：品牌数据块中指标名（如 可见概率）所在的行即最后一行表头；
+    基础信息列名在指标行，或在第1行并向下合并到指标行，都能识别
+
+    返回:
+    int: 表头行数；在前 MAX_HEADER_ROWS 行中找不到指标行时返回None。
+         已经转置过的长表第1行就含指标名，返回1
+    """
+    layout = transpose_engine.LAYOUTS[sheet_name]
+    id_count = len(layout['id_columns'])
+    metrics = set(layout['metric_columns'])
+    for row_idx, row in enumerate(reader.iter_rows(sheet_name, max_row=MAX_HEADER_ROWS), start=1):
+        if any(isinstance(value, str) and value.strip() in metrics for value in row[id_count:]):
+            return row_idx
+    return None
+
+
+def estimate_sheet(reader, sheet_name, header_rows=None):
+    """估算单个工作表，返回估计信息字典"""
+    rows, columns = _sheet_size(reader, sheet_name)
+    estimate = {
+        'sheet': sheet_name,
+        'layout': None,
+        'rows': rows,
+        'columns': columns,
+        'input_cells': rows * columns,
+        'brands': 0,
+        'output_rows': 0,
+        'output_rows_max': 0,
+        'output_columns': columns,
+    }
+    if sheet_name not in transpose_engine.LAYOUTS:
+        # 原样复制的工作表，输出与输入同样大小
+        estimate['output_rows'] = estimate['output_rows_max'] = rows
+        return estimate
+
+    layout = transpose_engine.resolve_layout(sheet_name, header_rows)
+    blocks = _brand_blocks(reader.merged_ranges(sheet_name), layout)
+    data_rows = max(rows - layout['data_start_row'] + 1, 0)
+    fill_ratio = _sample_fill_ratio(reader, sheet_name, layout, blocks) if blocks else 0
+    output_rows_max = data_rows * len(blocks)
+    estimate.update({
+        'layout': sheet_name,
+        'brands': len(blocks),
+        'fill_ratio': round(fill_ratio, 3),
+        'output_rows': int(round(output_rows_max * fill_ratio)),
+        'output_rows_max': output_rows_max,
+        'output_columns': (len(layout['id_columns']) + 2 + len(transpose_engine.level_names(layout))
+                           + len(layout['metric_columns'])),
+    })
+    return estimate
+
+
+def estimate_cost(sheets, mode):
+    """按写出方式估算耗时（秒）和内存峰值（字节）"""
+    input_cells = sum(sheet['input_cells'] for sheet in sheets)
+    output_cells = sum(sheet['output_rows'] * sheet['output_columns'] for sheet in sheets)
+    # 工作表逐个处理，输入峰值取最大的工作表
+    largest_input = max((sheet['input_cells'] for sheet in sheets), default=0)
+    seconds = input_cells * SECONDS_PER_INPUT_CELL + output_cells * SECONDS_PER_OUTPUT_CELL[mode]
+    memory = largest_input * INPUT_BYTES_PER_CELL + output_cells * OUTPUT_BYTES_PER_CELL[mode]
+    if mode == 'spill':
+        memory += spill.BATCH_ROWS * max((sheet['output_columns'] for sheet in sheets), default=0) \
+            * spill.BYTES_PER_CELL
+    return seconds, memory
+
+
+def choose_mode(sheets, budget=None):
+    """
+    选择写出方式：内存预算内用pandas一次写出，其次只写模式流式写出，再大则落盘
+
+    返回:
+    (写出方式, 耗时估计, 内存估计)
+    """
+    budget = spill.MEMORY_BUDGET_BYTES if budget is None else budget
+    for mode in ('memory', 'streaming'):
+        seconds, memory = estimate_cost(sheets, mode)
+        if memory <= budget:
+            return mode, seconds, memory
+    seconds, memory = estimate_cost(sheets, 'spill')
+    return 'spill', seconds, memory
+
+
+def preflight(input_file, header_rows=None):
+    """
+    预检一个输入文件
+
+    返回:
+    dict: sheets（各工作表估计）、output_rows、seconds、peak_memory_bytes、
+          mode（建议的写出方式）、rejected、reason
+    """
+    with readers.open_workbook(input_file) as reader:
+        sheets = [estimate_sheet(reader, name, header_rows) for name in reader.sheetnames]
+
+    mode, seconds, memory = choose_mode(sheets)
+    result = {
+        'sheets': sheets,
+        'output_rows': sum(sheet['output_rows'] for sheet in sheets if sheet['layout']),
+        'seconds': round(seconds, 1),
+        'peak_memory_bytes': int(memory),
+        'mode': mode,
+        'rejected': False,
+        'reason': None,
+    }
+    too_long = [sheet['sheet'] for sheet in sheets if sheet['output_rows'] + 1 > EXCEL_MAX_ROWS]
+    if too_long:
+        result['rejected'] = True
+        result['reason'] = f"工作表 {', '.join(too_long)} 转置后预计超过Excel单表 {EXCEL_MAX_ROWS} 行的上限"
+    elif memory > MAX_JOB_MEMORY_BYTES:
+        result['rejected'] = True
+        result['reason'] = (f"预计内存占用 {memory / 1024 ** 3:.1f} GB，"
+                            f"超过单个任务上限 {MAX_JOB_MEMORY_BYTES / 1024 ** 3:.1f} GB")
+    return result
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("使用方法: python preflight.py <输入文件>")
+        return
+
+    result = preflight(sys.argv[1])
+    for sheet in result['sheets']:
+        kind = '转置' if sheet['layout'] else '复制'
+        line = f"{sheet['sheet']}（{kind}）: {sheet['rows']} 行 × {sheet['columns']} 列"
+        if sheet['layout']:
+            line += (f"，{sheet['brands']} 个品牌，非空比例 {sheet.get('fill_ratio', 0):.0%}，"
+                     f"预计输出 {sheet['output_rows']} 行（最多 {sheet['output_rows_max']} 行）")
+        print(line)
+    print(f"预计耗时: {result['seconds']} 秒")
+    print(f"预计内存峰值: {result['peak_memory_bytes'] / 1024 / 1024:.0f} MB")
+    print(f"写出方式: {result['mode']}")
+    if result['rejected']:
+        print(f"❌ 拒绝: {result['reason']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作簿读取后端
+所有入口（Web应用、转置引擎、验证工具）通过 open_workbook 读取文件，
+根据文件类型、大小和已安装的依赖自动选择最快的后端：
+
+    xlsx      轻量级XlsxReader，直接解析xlsx压缩包（默认）
+    calamine  pandas + python-calamine，安装后用于较大的xlsx
+    openpyxl  openpyxl只读模式，xlsx解析失败时的兜底
+    xlrd      旧版.xls
+    csv       CSV/TSV文本，单个工作表
+
+各后端提供相同的接口：sheetnames、iter_rows、merged_ranges、read_sheet、close，
+取值规则与 openpyxl.load_workbook(data_only=True) 一致
+"""
+
+import csv
+import os
+import zipfile
+from xml.etree.ElementTree import ParseError
+
+import pandas as pd
+
+from xlsx_reader import XlsxReader
+
+# 超过该大小的xlsx优先使用calamine（如已安装）
+CALAMINE_MIN_BYTES = 5 * 1024 * 1024
+
+
+class WorkbookReader:
+    """读取后端基类，子类至少实现 sheetnames 和 iter_rows"""
+
+    backend_name = None
+
+    def __init__(self, path):
+        self.path = path
+        self.sheetnames = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        pass
+
+    def _check_sheet(self, sheet_name):
+        if sheet_name not in self.sheetnames:
+            raise KeyError(f"工作表不存在: {sheet_name}")
+
+    def iter_rows(self, sheet_name, max_row=None, columns=None):
+        """逐行产出值元组，参数含义同 XlsxReader.iter_rows"""
+        raise NotImplementedError
+
+    def merged_ranges(self, sheet_name):
+        """合并单元格区域 (min_row, min_col, max_row, max_col) 列表，不支持的格式返回空列表"""
+        return []
+
+    def dimension(self, sheet_name):
+        return None
+
+    def read_sheet(self, sheet_name, columns=None):
+        """返回 (rows, merged_ranges, max_row, max_column)，含义同 XlsxReader.read_sheet"""
+        rows = list(self.iter_rows(sheet_name, columns=columns))
+        merged = self.merged_ranges(sheet_name)
+        max_row = len(rows)
+        max_column = max((len(row) for row in rows), default=0)
+        for _, _, end_row, end_col in merged:
+            max_row = max(max_row, end_row)
+            max_column = max(max_column, end_col)
+        return rows, merged, max_row, max_column
+
+
+def _trim_row(values, columns=None):
+    """去掉行尾的空值，指定 columns 时其他列置为None"""
+    if columns is not None:
+        values = [value if col in columns else None for col, value in enumerate(values, start=1)]
+    end = len(values)
+    while end and values[end - 1] is None:
+        end -= 1
+    return tuple(values[:end])
+
+
+class _XlsxStructureMixin:
+    """xlsx文件的合并单元格和使用区域直接由XlsxReader扫描原始字节获得"""
+
+    def _structure(self):
+        if getattr(self, '_structure_reader', None) is None:
+            self._structure_reader = XlsxReader(self.path)
+        return self._structure_reader
+
+    def merged_ranges(self, sheet_name):
+        return self._structure().merged_ranges(sheet_name)
+
+    def dimension(self, sheet_name):
+        return self._structure().dimension(sheet_name)
+
+    def close(self):
+        if getattr(self, '_structure_reader', None) is not None:
+            self._structure_reader.close()
+            self._structure_reader = None
+
+
+class FastXlsxReader(XlsxReader):
+    """默认的xlsx后端"""
+
+    backend_name = 'xlsx'
+
+
+class OpenpyxlReader(_XlsxStructureMixin, WorkbookReader):
+    """openpyxl只读模式，兼容性最好，作为xlsx的兜底后端"""
+
+    backend_name = 'openpyxl'
+
+    def __init__(self, path):
+        super().__init__(path)
+        import openpyxl
+        self._wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        self.sheetnames = list(self._wb.sheetnames)
+
+    def iter_rows(self, sheet_name, max_row=None, columns=None):
+        self._check_sheet(sheet_name)
+        for row in self._wb[sheet_name].iter_rows(max_row=max_row, values_only=True):
+            yield _trim_row(row, columns)
+
+    def close(self):
+        self._wb.close()
+        super().close()
+
+
+class CalamineReader(_XlsxStructureMixin, WorkbookReader):
+    """pandas的calamine引擎（Rust实现），需要安装python-calamine"""
+
+    backend_name = 'calamine'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._excel = pd.ExcelFile(path, engine='calamine')
+        self.sheetnames = list(self._excel.sheet_names)
+
+    def iter_rows(self, sheet_name, max_row=None, columns=None):
+        self._check_sheet(sheet_name)
+        # 列投影交给calamine，未选中的列不转换为Python对象
+        usecols = sorted(col - 1 for col in columns) if columns is not None else None
+        df = self._excel.parse(sheet_name, header=None, nrows=max_row, usecols=usecols)
+        df = df.astype(object).where(df.notna(), None)
+        if columns is None:
+            for row in df.itertuples(index=False, name=None):
+                yield _trim_row(row)
+            return
+        width = max(columns, default=0)
+        positions = list(df.columns)
+        for row in df.itertuples(index=False, name=None):
+            values = [None] * width
+            for col, value in zip(positions, row):
+                values[col] = value
+            yield _trim_row(values)
+
+    def close(self):
+        self._excel.close()
+        super().close()
+
+
+class XlrdReader(WorkbookReader):
+    """旧版.xls文件"""
+
+    backend_name = 'xlrd'
+
+    def __init__(self, path):
+        super().__init__(path)
+        import xlrd
+        self._xlrd = xlrd
+        # formatting_info=True 才能取得合并单元格
+        self._book = xlrd.open_workbook(path, formatting_info=True, on_demand=True)
+        self.sheetnames = list(self._book.sheet_names())
+
+    def _convert(self, cell):
+        xlrd = self._xlrd
+        if cell.ctype in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+            return None
+        if cell.ctype == xlrd.XL_CELL_NUMBER:
+            # xls中数字都以浮点数保存，整数还原为int，与xlsx的读取结果一致
+            return int(cell.value) if float(cell.value).is_integer() else cell.value
+        if cell.ctype == xlrd.XL_CELL_DATE:
+            return xlrd.xldate_as_datetime(cell.value, self._book.datemode)
+        if cell.ctype == xlrd.XL_CELL_BOOLEAN:
+            return bool(cell.value)
+        if cell.ctype == xlrd.XL_CELL_ERROR:
+            return xlrd.error_text_from_code.get(cell.value, '#VALUE!')
+        return cell.value
+
+    def iter_rows(self, sheet_name, max_row=None, columns=None):
+        self._check_sheet(sheet_name)
+        sheet = self._book.sheet_by_name(sheet_name)
+        nrows = sheet.nrows if max_row is None else min(sheet.nrows, max_row)
+        for row_idx in range(nrows):
+            cells = sheet.row(row_idx)
+            if columns is None:
+                yield _trim_row([self._convert(cell) for cell in cells])
+            else:
+                yield _trim_row([self._convert(cell) if col in columns else None
+                                 for col, cell in enumerate(cells, start=1)])
+
+    def merged_ranges(self, sheet_name):
+        self._check_sheet(sheet_name)
+        sheet = self._book.sheet_by_name(sheet_name)
+        # xlrd的区域是0开始、上界不包含
+        return [(rlo + 1, clo + 1, rhi, chi) for rlo, rhi, clo, chi in sheet.merged_cells]
+
+    def dimension(self, sheet_name):
+        self._check_sheet(sheet_name)
+        sheet = self._book.sheet_by_name(sheet_name)
+        return (1, 1, sheet.nrows, sheet.ncols) if sheet.nrows else None
+
+    def close(self):
+        self._book.release_resources()
+
+
+def _parse_csv_value(text):
+    """CSV文本按Excel的习惯转换为数字，空串视为空单元格"""
+    if text == '':
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+class CsvReader(WorkbookReader):
+    """
+    CSV/TSV文件，作为一个以文件名命名的工作表
+    从Excel另存的宽表中合并单元格只保留了左上角的值，
+    这里把前两行中"有值单元格 + 右侧连续空单元格"还原为合并区域，便于识别品牌
+    """
+
+    backend_name = 'csv'
+    header_rows = 2
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.sheetnames = [os.path.splitext(os.path.basename(path))[0]]
+        self._delimiter = '\t' if path.lower().endswith('.tsv') else ','
+
+    def _open(self):
+        return open(self.path, 'r', encoding='utf-8-sig', newline='')
+
+    def iter_rows(self, sheet_name, max_row=None, columns=None):
+        self._check_sheet(sheet_name)
+        with self._open() as f:
+            for row_idx, row in enumerate(csv.reader(f, delimiter=self._delimiter), start=1):
+                if max_row is not None and row_idx > max_row:
+                    break
+                if columns is None:
+                    yield _trim_row([_parse_csv_value(text) for text in row])
+                else:
+                    yield _trim_row([_parse_csv_value(text) if col in columns else None
+                                     for col, text in enumerate(row, start=1)])
+
+    def merged_ranges(self, sheet_name):
+        merged = []
+        rows = list(self.iter_rows(sheet_name, max_row=self.header_rows))
+        width = max((len(row) for row in rows), default=0)
+        for row_idx, row in enumerate(rows, start=1):
+            row = row + (None,) * (width - len(row))
+            col_idx = 0
+            while col_idx < width:
+                if row[col_idx] is None:
+                    col_idx += 1
+                    continue
+                end = col_idx
+                while end + 1 < width and row[end + 1] is None:
+                    end += 1
+                if end > col_idx:
+                    merged.append((row_idx, col_idx + 1, row_idx, end + 1))
+                col_idx = end + 1
+        return merged
+
+
+BACKENDS = {
+    'xlsx': FastXlsxReader,
+    'calamine': CalamineReader,
+    'openpyxl': OpenpyxlReader,
+    'xlrd': XlrdReader,
+    'csv': CsvReader,
+}
+
+# 各扩展名按优先级排列的候选后端
+EXTENSION_BACKENDS = {
+    '.xlsx': ['xlsx', 'openpyxl'],
+    '.xlsm': ['xlsx', 'openpyxl'],
+    '.xls': ['xlrd'],
+    '.csv': ['csv'],
+    '.tsv': ['csv'],
+}
+# 扩展名无法识别时按文件头判断：旧版.xls为OLE2复合文档，.xlsx为zip
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+
+def backend_available(name):
+    """检查后端依赖是否已安装"""
+    try:
+        if name == 'calamine':
+            import python_calamine  # noqa: F401
+        elif name == 'xlrd':
+            import xlrd  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _is_ole2(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(OLE2_MAGIC)) == OLE2_MAGIC
+    except OSError:
+        return False
+
+
+def candidate_backends(path):
+    """按优先级返回适用于该文件的后端名称"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in EXTENSION_BACKENDS and _is_ole2(path):
+        ext = '.xls'
+    candidates = list(EXTENSION_BACKENDS.get(ext, ['xlsx', 'openpyxl']))
+    if ext in ('.xlsx', '.xlsm') and os.path.exists(path) and os.path.getsize(path) >= CALAMINE_MIN_BYTES:
+        candidates.insert(0, 'calamine')
+    return [name for name in candidates if backend_available(name)]
+
+
+def open_workbook(path, backend=None):
+    """
+    打开工作簿
+
+    参数:
+    path: 文件路径
+    backend: 指定后端名称（可选），缺省时自动选择
+
+    返回:
+    读取器对象，支持with语句
+    """
+    if backend is not None:
+        return BACKENDS[backend](path)
+
+    candidates = candidate_backends(path)
+    if not candidates:
+        raise ValueError(f"没有可用于读取该文件的后端: {path}")
+    last_error = None
+    for name in candidates:
+        try:
+            return BACKENDS[name](path)
+        except (zipfile.BadZipFile, ParseError, KeyError, ImportError, ValueError) as e:
+            # 当前后端无法解析时尝试下一个
+            print(f"{name} 后端无法读取 {os.path.basename(path)}: {str(e)}")
+            last_error = e
+    raise last_error
+
+
+def read_dataframe(path, sheet_name=0, header=None, backend=None):
+    """
+    读取单个工作表为DataFrame，可替代 pd.read_excel(path, sheet_name=..., header=...)
+
+    参数:
+    sheet_name: 工作表名称或序号
+    header: 表头所在行（0开始），None表示没有表头
+    """
+    with open_workbook(path, backend=backend) as reader:
+        if isinstance(sheet_name, int):
+            sheet_name = reader.sheetnames[sheet_name]
+        rows = list(reader.iter_rows(sheet_name))
+
+    # 与pandas一致：去掉末尾的空行
+    while rows and not rows[-1]:
+        rows.pop()
+    width = max((len(row) for row in rows), default=0)
+    rows = [row + (None,) * (width - len(row)) for row in rows]
+
+    if header is None:
+        return pd.DataFrame(rows)
+    columns = rows[header]
+    return pd.DataFrame(rows[header + 1:], columns=columns)
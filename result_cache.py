@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置结果的列式缓存
+任务完成后把每个转置工作表保存为 spill.SpillTable 的持久列式表，
+网页按窗口读取（偏移量、行数、排序、筛选），百万行的结果也无需下载整个xlsx
+
+目录结构:
+    RESULT_CACHE_DIR/<任务ID>/manifest.json        工作表名称、行数、列名
+    RESULT_CACHE_DIR/<任务ID>/<序号>/               一个工作表的列式表
+    RESULT_CACHE_DIR/<任务ID>/<序号>/order_*.npy    按需生成的排序索引
+
+环境变量:
+    RESULT_CACHE_DIR   缓存目录（默认 results）
+"""
+
+import datetime
+import glob
+import json
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+import spill
+
+CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', 'results')
+# 单次请求最多返回的行数
+MAX_LIMIT = 1000
+
+_JOB_ID_PATTERN = re.compile(r'^[0-9a-f-]{32,36}$')
+
+
+class ResultCacheError(Exception):
+    """结果查询错误，附带HTTP状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def job_cache_dir(job_id, cache_dir=None):
+    """任务的缓存目录"""
+    if not job_id or not _JOB_ID_PATTERN.match(job_id):
+        raise ResultCacheError('无效的任务ID', 404)
+    return os.path.join(cache_dir or CACHE_DIR, job_id)
+
+
+def _table_from_dataframe(df, scratch_dir):
+    """把DataFrame写入新的 SpillTable，数值列整批写入"""
+    table = spill.SpillTable([str(column) for column in df.columns], len(df), scratch_dir)
+    for start in range(0, len(df), spill.BATCH_ROWS):
+        batch = df.iloc[start:start + spill.BATCH_ROWS]
+        table.append([batch[column].to_numpy() if batch[column].dtype.kind in 'fiu'
+                      else batch[column].tolist() for column in batch.columns])
+    return table
+
+
+def save_results(results, directory):
+    """
+    保存 process_workbook 的转置结果，先写入临时目录再整体改名，读取方不会看到写了一半的缓存
+
+    参数:
+    results: {工作表名称: DataFrame 或尚未关闭的 spill.SpillTable}
+    directory: 任务的缓存目录（job_cache_dir 的返回值）
+    """
+    tmp_dir = f"{directory}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    sheets = []
+    try:
+        for index, (sheet_name, result) in enumerate(results.items()):
+            if result is None:
+                continue
+            table = result
+            if isinstance(result, pd.DataFrame):
+                table = _table_from_dataframe(result, tmp_dir)
+            table.save(os.path.join(tmp_dir, str(index)))
+            sheets.append({'name': sheet_name, 'path': str(index), 'rows': len(table),
+                           'columns': table.columns})
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump({'sheets': sheets, 'created_at': time.time()}, f, ensure_ascii=False)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def remove_cache(directory):
+    """删除任务的缓存，包括被中断的任务遗留的临时目录"""
+    shutil.rmtree(directory, ignore_errors=True)
+    for path in glob.glob(f"{glob.escape(directory)}.tmp-*"):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def list_sheets(job_id, cache_dir=None):
+    """任务缓存中的工作表列表 [{name, rows, columns}]，缓存不存在时抛出 ResultCacheError(404)"""
+    manifest_path = os.path.join(job_cache_dir(job_id, cache_dir), 'manifest.json')
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise ResultCacheError('结果不存在或已过期', 404)
+    # 记录访问时间，自动清理按最近访问时间淘汰
+    os.utime(manifest_path)
+    return manifest['sheets']
+
+
+def _sort_rank(values):
+    """字典值的排序名次：同类型的值之间比较，无法比较时按字符串"""
+    def key(index):
+        value = values[index]
+        if isinstance(value, (datetime.date, pd.Timestamp)):
+            return (0, value.isoformat())
+        return (1, str(value))
+    rank = np.empty(len(values), dtype=np.int64)
+    rank[sorted(range(len(values)), key=key)] = np.arange(len(values))
+    return rank
+
+
+def _sort_order(table, table_dir, column_index, descending):
+    """
+    按一列排序后的行号数组，空值总在最后；数值排在文本之前
+    结果保存为 .npy 文件，之后同样的排序直接读取
+    """
+    path = os.path.join(table_dir, f"order_{column_index}_{'desc' if descending else 'asc'}.npy")
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+
+    numbers, codes, values = table.column_arrays(column_index)
+    numbers = np.asarray(numbers)
+    codes = np.asarray(codes)
+    coded = codes >= 0
+    is_null = ~coded & np.isnan(numbers)
+    # 分组：0 数值，1 字典值，2 空值
+    group = np.where(coded, 1, np.where(is_null, 2, 0))
+    rank = _sort_rank(values)[np.where(coded, codes, 0)] if values else np.zeros(len(codes), np.int64)
+    value = np.where(coded, rank, np.where(is_null, 0, numbers)).astype(np.float64)
+    if descending:
+        value = -value
+    # lexsort 以最后一个键为主键，相同值保持原顺序
+    order = np.lexsort((value, group)).astype(np.int64)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, order)
+    os.replace(tmp_path, path)
+    return order
+
+
+def _filter_mask(table, column_index, text):
+    """一列中包含 text（不区分大小写）的行；text 是数字时同时匹配数值相等的行"""
+    numbers, codes, values = table.column_arrays(column_index)
+    numbers = np.asarray(numbers)
+    codes = np.asarray(codes)
+    needle = text.lower()
+    matched_codes = [code for code, value in enumerate(values) if needle in str(value).lower()]
+    mask = np.isin(codes, matched_codes) if matched_codes else np.zeros(len(codes), dtype=bool)
+    try:
+        number = float(text)
+    except ValueError:
+        return mask
+    return mask | ((codes < 0) & (numbers == number))
+
+
+def _jsonable(value):
+    """日期转为ISO格式字符串，其他值原样返回"""
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+
+def query(job_id, sheet_name, offset=0, limit=100, sort=None, filters=None, cache_dir=None):
+    """
+    读取一个工作表的行窗口
+
+    参数:
+    sort: 排序列名，前缀 '-' 表示降序
+    filters: [(列名, 文本), ...]，同时满足时保留该行
+
+    返回:
+    dict: columns、total_rows（全部行数）、matched_rows（筛选后行数）、offset、rows
+    """
+    sheets = list_sheets(job_id, cache_dir)
+    sheet = next((item for item in sheets if item['name'] == sheet_name), None)
+    if sheet is None:
+        raise ResultCacheError(f'工作表不存在: {sheet_name}', 404)
+    if offset < 0 or limit < 1:
+        raise ResultCacheError('offset 不能为负数，limit 必须大于0')
+    limit = min(limit, MAX_LIMIT)
+
+    table_dir = os.path.join(job_cache_dir(job_id, cache_dir), sheet['path'])
+    table = spill.SpillTable.load(table_dir)
+    try:
+        def column_index(name):
+            if name not in table.columns:
+                raise ResultCacheError(f'列不存在: {name}')
+            return table.columns.index(name)
+
+        order = None
+        if sort:
+            descending = sort.startswith('-')
+            order = _sort_order(table, table_dir, column_index(sort.lstrip('-')), descending)
+
+        mask = None
+        for name, text in filters or []:
+            column_mask = _filter_mask(table, column_index(name), text)
+            mask = column_mask if mask is None else mask & column_mask
+
+        if mask is None:
+            matched = len(table)
+            rows = (np.asarray(order[offset:offset + limit]) if order is not None
+                    else np.arange(offset, min(offset + limit, len(table))))
+        else:
+            selected = np.asarray(order)[mask[order]] if order is not None else np.nonzero(mask)[0]
+            matched = len(selected)
+            rows = selected[offset:offset + limit]
+
+        return {
+            'columns': table.columns,
+            'total_rows': len(table),
+            'matched_rows': int(matched),
+            'offset': offset,
+            'rows': [[_jsonable(value) for value in row] for row in table.take(rows)] if len(rows) else [],
+        }
+    finally:
+        table.close()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+反向转置：长表 -> 按品牌分组的宽表
+把转置结果（或合并、清洗后的长表）还原为原始报告的版式：
+第1行为品牌（合并单元格，如 "品牌A(客户)"），三行及以上表头时中间为各层分组（合并单元格），
+最后一行表头为基础信息列名和每个品牌下的指标；数据行按长表中首次出现的顺序排列
+
+品牌和分组的左右顺序从长表推断：转置输出中每个原始行的品牌按从左到右排列，
+据此做拓扑排序，信息不足时按首次出现的顺序；整个品牌或整行都没有数据的部分在转置时已被省略，无法还原
+
+取值用一次向量化的散列赋值完成，写出用openpyxl只写模式流式输出并直接写入合并区域
+
+用法:
+    python reverse_transpose.py <长表.xlsx> [输出文件] [--date YYYY-MM-DD] [--merge-keywords]
+"""
+
+import heapq
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import brand_summary
+import readers
+import transpose_engine
+import warehouse
+
+# 长表中不属于原始报告的列
+EXTRA_COLUMNS = ('日期', '来源文件', '导入时间')
+
+
+def _sequence_order(codes, group_ids, count):
+    """
+    按每组内的先后顺序排列 0..count-1：组内相邻的两项构成先后关系，
+    做拓扑排序，没有先后关系约束的项按编号（首次出现顺序）排列，存在矛盾时剩余项按编号追加
+    """
+    same_group = np.r_[False, group_ids[1:] == group_ids[:-1]]
+    edges = np.unique(np.stack([codes[:-1], codes[1:]], axis=1)[same_group[1:] & (codes[1:] != codes[:-1])],
+                      axis=0) if len(codes) > 1 else np.empty((0, 2), dtype=np.int64)
+    successors = [[] for _ in range(count)]
+    indegree = np.zeros(count, dtype=np.int64)
+    for before, after in edges:
+        successors[before].append(after)
+        indegree[after] += 1
+    ready = [code for code in range(count) if indegree[code] == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        code = heapq.heappop(ready)
+        order.append(code)
+        for successor in successors[code]:
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                heapq.heappush(ready, successor)
+    if len(order) < count:
+        placed = set(order)
+        order.extend(code for code in range(count) if code not in placed)
+    return order
+
+
+def _factorize_rows(df, columns):
+    """按几列的取值组合编号，返回 (每行的编号, 按首次出现顺序的取值元组列表)；空值统一为None"""
+    values = df[columns].astype(object)
+    values = values.where(values.notna(), None)
+    codes, uniques = pd.factorize(pd.Series(list(values.itertuples(index=False, name=None)), dtype=object),
+                                  sort=False)
+    return codes, list(uniques)
+
+
+def reverse_sheet(layout_name, df):
+    """
+    把一个长表还原为宽表
+
+    返回:
+    dict: header（表头行列表）、merged_ranges（表头合并区域 (起始行, 起始列, 结束行, 结束列)）、
+          data（object二维数组，每行一个原始数据行）
+    """
+    layout = transpose_engine.LAYOUTS[layout_name]
+    id_columns = list(layout['id_columns'])
+    platform_column = next((name for name in id_columns if name in transpose_engine.PLATFORM_COLUMNS), None)
+    if platform_column:
+        df = df.rename(columns={name: platform_column for name in transpose_engine.PLATFORM_COLUMNS
+                                if name in df.columns and name != platform_column})
+    missing = [name for name in id_columns + ['品牌', '品牌类型'] if name not in df.columns]
+    if missing:
+        raise ValueError(f"{layout_name} 缺少列: {', '.join(missing)}")
+    metrics = [name for name in layout['metric_columns'] if name in df.columns]
+    levels = [name for name in df.columns
+              if name not in id_columns + ['品牌', '品牌类型'] + metrics and name not in EXTRA_COLUMNS]
+    df = df.reset_index(drop=True)
+
+    # 数据行：基础信息的组合，按首次出现顺序编号
+    row_codes, row_values = _factorize_rows(df, id_columns)
+    # 品牌标签还原为 "名称(类型)"
+    labels = df['品牌'].astype(str) + '(' + df['品牌类型'].astype(str) + ')'
+    brand_codes, brands = pd.factorize(labels, sort=False)
+    brand_order = _sequence_order(brand_codes, row_codes, len(brands))
+
+    if levels:
+        level_codes, level_values = _factorize_rows(df, levels)
+        group_ids = row_codes.astype(np.int64) * len(brands) + brand_codes
+        level_order = _sequence_order(level_codes, group_ids, len(level_values))
+    else:
+        level_codes, level_values, level_order = np.zeros(len(df), dtype=np.int64), [()], [0]
+
+    # 数据块 = (品牌, 分组)，只保留有数据的组合
+    present = set(zip(brand_codes.tolist(), level_codes.tolist()))
+    blocks = [(brand, level) for brand in brand_order for level in level_order if (brand, level) in present]
+    block_index = np.full((len(brands), len(level_values)), -1, dtype=np.int64)
+    for i, (brand, level) in enumerate(blocks):
+        block_index[brand, level] = i
+
+    id_count, metric_count = len(id_columns), len(metrics)
+    data = np.full((len(row_values), id_count + len(blocks) * metric_count), None, dtype=object)
+    for i, name in enumerate(id_columns):
+        data[:, i] = [values[i] for values in row_values]
+    target = id_count + block_index[brand_codes, level_codes] * metric_count
+    for m, name in enumerate(metrics):
+        values = df[name].astype(object).where(df[name].notna(), None).to_numpy()
+        data[row_codes, target + m] = values
+
+    # 表头：品牌行、各分组行、指标行
+    width = data.shape[1]
+    header = [[None] * width for _ in range(len(levels) + 2)]
+    header[-1][:id_count] = id_columns
+    merged_ranges = []
+    for depth in range(len(levels) + 1):
+        # depth 0 为品牌，其后为各层分组；相同取值的相邻块合并为一个区域
+        def block_label(block):
+            brand, level = block
+            return (brand,) + tuple(level_values[level])[:depth] if levels else (brand,)
+        start = 0
+        while start < len(blocks):
+            end = start
+            while end + 1 < len(blocks) and block_label(blocks[end + 1]) == block_label(blocks[start]):
+                end += 1
+            first_col = id_count + start * metric_count + 1
+            last_col = id_count + (end + 1) * metric_count
+            brand, level = blocks[start]
+            header[depth][first_col - 1] = brands[brand] if depth == 0 else level_values[level][depth - 1]
+            if last_col > first_col:
+                merged_ranges.append((depth + 1, first_col, depth + 1, last_col))
+            start = end + 1
+    for i in range(len(blocks)):
+        header[-1][id_count + i * metric_count:id_count + (i + 1) * metric_count] = metrics
+    print(f"{layout_name}反向转置: {len(df)} 行 -> {len(row_values)} 行 × {len(brands)} 个品牌")
+    return {'header': header, 'merged_ranges': merged_ranges, 'data': data}
+
+
+def _keyword_merges(data, first_row):
+    """第1列中连续相同的关键词合并为一个区域，返回合并区域并清空区域内除首行外的单元格"""
+    merged_ranges = []
+    keywords = data[:, 0]
+    if not len(keywords):
+        return merged_ranges
+    starts = np.r_[0, np.nonzero(keywords[1:] != keywords[:-1])[0] + 1]
+    ends = np.r_[starts[1:], len(keywords)] - 1
+    for start, end in zip(starts, ends):
+        if end > start:
+            merged_ranges.append((first_row + start, 1, first_row + end, 1))
+            data[start + 1:end + 1, 0] = None
+    return merged_ranges
+
+
+def write_wide_workbook(sheets, output_file, reader=None, merge_keywords=False):
+    """
+    流式写出宽表工作簿，合并区域直接写入工作表；reader 不为None时原样复制其他工作表
+
+    参数:
+    sheets: {工作表名称: reverse_sheet 的返回值}
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    for sheet_name, sheet in sheets.items():
+        ws = wb.create_sheet(sheet_name)
+        merged_ranges = list(sheet['merged_ranges'])
+        if merge_keywords:
+            merged_ranges += _keyword_merges(sheet['data'], len(sheet['header']) + 1)
+        for row in sheet['header']:
+            cells = []
+            for value in row:
+                cell = WriteOnlyCell(ws, value=value)
+                if value is not None:
+                    cell.font = Font(bold=True)
+                    cell.alignment = Alignment(horizontal='center', vertical='center')
+                cells.append(cell)
+            ws.append(cells)
+        for row in sheet['data']:
+            ws.append(row.tolist())
+        for min_row, min_col, max_row, max_col in merged_ranges:
+            ws.merged_cells.add(f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}")
+
+    for sheet_name in reader.sheetnames if reader is not None else ():
+        if sheet_name in sheets or sheet_name == brand_summary.SUMMARY_SHEET:
+            continue
+        ws = wb.create_sheet(sheet_name)
+        for row in reader.iter_rows(sheet_name):
+            ws.append(row)
+        print(f"复制工作表: {sheet_name}")
+    wb.save(output_file)
+
+
+def reverse_workbook(input_file, output_file, report_date=None, merge_keywords=False):
+    """
+    反向转置工作簿中的各布局长表，其他工作表原样复制（转置时生成的品牌汇总除外）
+
+    参数:
+    report_date: 长表中有多个日期（合并结果）时只还原该日期的数据
+
+    返回:
+    dict: {工作表名称: reverse_sheet 的返回值}
+    """
+    sheets = {}
+    with readers.open_workbook(input_file) as reader:
+        for sheet_name in transpose_engine.LAYOUTS:
+            if sheet_name not in reader.sheetnames:
+                continue
+            rows = list(reader.iter_rows(sheet_name))
+            if not rows or '品牌' not in rows[0]:
+                print(f"{sheet_name} 不是长表，跳过")
+                continue
+            df = pd.DataFrame(rows[1:], columns=list(rows[0])).dropna(how='all')
+            if '日期' in df.columns:
+                dates = sorted({str(value)[:10] for value in df['日期'].dropna()})
+                if report_date:
+                    df = df[df['日期'].astype(str).str[:10] == warehouse.normalize_date(report_date)]
+                elif len(dates) > 1:
+                    raise ValueError(f"{sheet_name} 包含多个日期 {', '.join(dates)}，请用 --date 指定")
+            sheets[sheet_name] = reverse_sheet(sheet_name, df)
+        write_wide_workbook(sheets, output_file, reader, merge_keywords)
+    return sheets
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    merge_keywords = '--merge-keywords' in args
+    if merge_keywords:
+        args.remove('--merge-keywords')
+    for option in ('--date',):
+        if option in args:
+            index = args.index(option)
+            options[option[2:]] = args[index + 1]
+            del args[index:index + 2]
+
+    if not args:
+        print("使用方法: python reverse_transpose.py <长表.xlsx> [输出文件] [--date YYYY-MM-DD] [--merge-keywords]")
+        print("--merge-keywords: 连续相同的关键词合并单元格")
+        return
+
+    input_file = args[0]
+    if not os.path.exists(input_file):
+        print(f"找不到输入文件: {input_file}")
+        return
+    if len(args) > 1:
+        output_file = args[1]
+    else:
+        base_name = os.path.splitext(os.path.basename(input_file))[0]
+        output_file = f"{base_name}_{datetime.now().strftime('%Y%m%d')}_还原宽表.xlsx"
+
+    reverse_workbook(input_file, output_file, options.get('date'), merge_keywords)
+    print(f"\n文件已保存: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置任务调度
+所有任务先进入磁盘上的队列（jobs 模块的任务记录），由调度线程按以下规则放行：
+
+1. 准入控制：正在运行的任务预计内存之和不超过全局预算，并发数不超过上限；
+   没有任务在运行时总是放行队首任务，避免单个大任务永远无法开始
+2. 按用户公平：正在运行任务少的用户优先，同一用户的任务按提交顺序依次排队
+3. 小任务优先：同等条件下预计耗时短的任务先执行，内存不够时允许后面的小任务插队，
+   等待超过 STARVATION_SECONDS 的任务不再被插队，预留内存等它开始
+
+gunicorn每个工作进程各有一个调度线程，通过文件锁协调，任何进程都可以领取队列中的任务；
+领取任务的进程异常退出后，其运行中的任务标记为失败并释放预算；
+工作进程正常退出前调用 drain 停止领取新任务，并等待本进程中运行的任务结束；
+任务可随时取消，运行中的任务由领取它的进程结束转置子进程（见 job_process 模块）
+
+环境变量:
+    SCHEDULER_MEMORY_MB     全局内存预算（默认物理内存的75%）
+    MAX_CONCURRENT_JOBS     同时运行的任务数上限（默认CPU核数）
+"""
+
+import fcntl
+import os
+import threading
+import time
+
+import jobs
+import metrics
+
+# 预计耗时不超过该值（秒）的任务视为小任务
+SMALL_JOB_SECONDS = 30
+# 任务等待超过该时间（秒）后不再被后来的小任务插队
+STARVATION_SECONDS = 600
+# 调度线程的轮询间隔（秒），提交或结束任务时会立即唤醒
+POLL_INTERVAL_SECONDS = 1.0
+
+
+def _default_memory_budget():
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.75)
+    except (ValueError, OSError, AttributeError):
+        return 4096 * 1024 * 1024
+
+
+MEMORY_BUDGET_BYTES = (int(os.environ['SCHEDULER_MEMORY_MB']) * 1024 * 1024
+                       if os.environ.get('SCHEDULER_MEMORY_MB') else _default_memory_budget())
+MAX_CONCURRENT_JOBS = int(os.environ.get('MAX_CONCURRENT_JOBS', os.cpu_count() or 2))
+
+_state = {'pid': None, 'thread': None, 'upload_folder': None, 'runner': None, 'draining': False}
+# 本进程中正在执行任务的线程，先加入集合再启动，任务结束时由线程自己移除
+_job_threads = set()
+_job_threads_lock = threading.Lock()
+_wakeup = threading.Event()
+_start_lock = threading.Lock()
+
+
+class _QueueLock:
+    """跨进程的队列锁，保护"读取未结束的任务 -> 选择 -> 标记为运行中"这一过程"""
+
+    def __init__(self, upload_folder):
+        self.path = os.path.join(jobs.job_folder(upload_folder), '.scheduler.lock')
+
+    def __enter__(self):
+        self._file = open(self.path, 'a')
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _job_memory(job):
+    return (job.get('estimate') or {}).get('peak_memory_bytes', 0)
+
+
+def _job_seconds(job):
+    return (job.get('estimate') or {}).get('seconds', 0)
+
+
+def order_queue(all_jobs, now=None):
+    """
+    按调度规则排列排队中的任务
+
+    返回:
+    list: 排队中的任务记录，第一个最先执行
+    """
+    now = time.time() if now is None else now
+    running_per_user = {}
+    for job in all_jobs:
+        if job['status'] == jobs.STATUS_RUNNING:
+            user = job.get('user')
+            running_per_user[user] = running_per_user.get(user, 0) + 1
+
+    queued = sorted((job for job in all_jobs if job['status'] == jobs.STATUS_QUEUED),
+                    key=lambda job: job['created_at'])
+    # 同一用户的第几个排队任务，用于在用户之间轮转
+    nth_of_user = {}
+    ranked = []
+    for job in queued:
+        user = job.get('user')
+        nth = nth_of_user.get(user, 0)
+        nth_of_user[user] = nth + 1
+        starving = now - job['created_at'] > STARVATION_SECONDS
+        small = _job_seconds(job) <= SMALL_JOB_SECONDS
+        key = (not starving, running_per_user.get(user, 0) + nth, not small,
+               _job_seconds(job), job['created_at'])
+        ranked.append((key, job))
+    ranked.sort(key=lambda item: item[0])
+    return [job for _, job in ranked]
+
+
+def select_jobs(all_jobs, budget=None, max_concurrent=None, now=None):
+    """
+    选出可以立即开始的任务
+
+    返回:
+    list: 按顺序放行的任务记录
+    """
+    budget = MEMORY_BUDGET_BYTES if budget is None else budget
+    max_concurrent = MAX_CONCURRENT_JOBS if max_concurrent is None else max_concurrent
+    now = time.time() if now is None else now
+
+    running = [job for job in all_jobs if job['status'] == jobs.STATUS_RUNNING]
+    used = sum(_job_memory(job) for job in running)
+    slots = max_concurrent - len(running)
+    selected = []
+    for job in order_queue(all_jobs, now):
+        if slots <= 0:
+            break
+        memory = _job_memory(job)
+        if used + memory <= budget or (not running and not selected):
+            selected.append(job)
+            used += memory
+            slots -= 1
+        elif now - job['created_at'] > STARVATION_SECONDS:
+            # 预留内存给等待过久的任务，后面的任务不再插队
+            break
+    return selected
+
+
+def queue_position(upload_folder, job_id):
+    """排队中任务的位置（1开始），不在队列中返回None"""
+    for position, job in enumerate(order_queue(jobs.list_jobs(upload_folder)), start=1):
+        if job['job_id'] == job_id:
+            return position
+    return None
+
+
+def finish_job(upload_folder, job_id, status, **fields):
+    """
+    记录任务结束；与取消请求共用队列锁，避免其他进程写入的取消标记覆盖最终状态
+    """
+    with _QueueLock(upload_folder):
+        job = jobs.update_job(upload_folder, job_id, status=status, finished_at=time.time(), **fields)
+    _wakeup.set()
+    return job
+
+
+def cancel_job(upload_folder, job_id):
+    """
+    取消任务：排队中的任务直接标记为已取消并删除上传文件；
+    运行中的任务记录取消请求，由执行它的进程结束转置子进程后标记
+
+    返回:
+    dict: 更新后的任务记录，已结束的任务抛出 JobError(409)
+    """
+    with _QueueLock(upload_folder):
+        job = jobs.get_job(upload_folder, job_id)
+        if job['status'] in jobs.FINISHED_STATUSES:
+            raise jobs.JobError('任务已结束，无法取消', 409)
+        if job['status'] == jobs.STATUS_QUEUED:
+            job = jobs.update_job(upload_folder, job_id, status=jobs.STATUS_CANCELLED,
+                                  finished_at=time.time(),
+                                  result={'error': '任务已取消', 'reason': 'cancelled'})
+            input_path = job.get('input_path')
+            if input_path and os.path.exists(input_path):
+                os.remove(input_path)
+        else:
+            job = jobs.update_job(upload_folder, job_id, cancel_requested=True)
+    _wakeup.set()
+    return job
+
+
+def _reap_dead(upload_folder, all_jobs):
+    """运行中的任务所属进程已退出时标记为失败"""
+    for job in all_jobs:
+        if job['status'] == jobs.STATUS_RUNNING and job.get('pid') and not _process_alive(job['pid']):
+            print(f"任务 {job['job_id']} 所在进程 {job['pid']} 已退出，标记为失败")
+            job.update(jobs.update_job(
+                upload_folder, job['job_id'], status=jobs.STATUS_FAILED, finished_at=time.time(),
+                result={'error': '处理进程意外退出，请重新上传'}))
+
+
+def dispatch_once():
+    """领取当前可以开始的任务，在本进程的后台线程中执行"""
+    upload_folder, runner = _state['upload_folder'], _state['runner']
+    with _QueueLock(upload_folder):
+        all_jobs = jobs.list_jobs(upload_folder)
+        _reap_dead(upload_folder, all_jobs)
+        selected = select_jobs(all_jobs)
+        for job in selected:
+            jobs.update_job(upload_folder, job['job_id'], status=jobs.STATUS_RUNNING,
+                            started_at=time.time(), pid=os.getpid())
+        metrics.JOBS_QUEUED.set(sum(job['status'] == jobs.STATUS_QUEUED for job in all_jobs) - len(selected))
+    for job in selected:
+        thread = threading.Thread(target=_run, args=(runner, job), daemon=True)
+        # 启动前加入集合：很快结束的任务移除自己时一定已经在集合中，drain 不会等待已结束的线程
+        with _job_threads_lock:
+            _job_threads.add(thread)
+        thread.start()
+    return selected
+
+
+def _run(runner, job):
+    try:
+        runner(job)
+    finally:
+        with _job_threads_lock:
+            _job_threads.discard(threading.current_thread())
+        # 释放的预算可以立即分配给下一个任务
+        _wakeup.set()
+
+
+def _loop():
+    while True:
+        _wakeup.wait(POLL_INTERVAL_SECONDS)
+        _wakeup.clear()
+        if _state['draining']:
+            continue
+        try:
+            dispatch_once()
+        except Exception as e:
+            print(f"任务调度出错: {str(e)}")
+
+
+def start(upload_folder, runner):
+    """
+    启动本进程的调度线程，可重复调用；fork出的子进程需要重新启动
+
+    参数:
+    upload_folder: 上传目录（任务记录所在位置）
+    runner: 执行任务的函数 runner(任务记录)
+    """
+    with _start_lock:
+        _state['upload_folder'] = upload_folder
+        _state['runner'] = runner
+        if _state['pid'] == os.getpid() and _state['thread'] is not None:
+            return
+        _state['pid'] = os.getpid()
+        _state['thread'] = threading.Thread(target=_loop, name='job-scheduler', daemon=True)
+        _state['thread'].start()
+        print(f"任务调度已启动: 内存预算 {MEMORY_BUDGET_BYTES / 1024 ** 3:.1f} GB，"
+              f"最多 {MAX_CONCURRENT_JOBS} 个任务同时运行")
+
+
+def drain(heartbeat=None, interval=POLL_INTERVAL_SECONDS):
+    """
+    停止领取新任务，等待本进程中运行的任务全部结束；用于工作进程退出前，
+    否则调度线程和任务线程随进程结束，转置子进程被终止，任务被标记为失败
+
+    参数:
+    heartbeat: 可选，等待期间定期调用的无参函数（如gunicorn工作进程的心跳）
+    """
+    _state['draining'] = True
+    if _job_threads:
+        print(f"等待本进程中 {len(_job_threads)} 个运行中的任务结束...")
+    while _job_threads:
+        if heartbeat is not None:
+            heartbeat()
+        time.sleep(interval)
+
+
+def notify():
+    """有新任务提交时唤醒调度线程"""
+    _wakeup.set()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置结果的落盘缓冲
+转置后的工作表超过内存预算时，按列写入临时目录下的内存映射文件，
+写出Excel时再分批从映射文件读回，进程内只保留一个批次的数据
+
+每列保存为两个映射文件：
+    数值 float64   数字直接保存，空值为NaN
+    编码 int32     -1 表示浮点数或空值，-2 表示整数，>=0 为字典中的下标
+字符串、日期、布尔值等放入字典，关键词、平台、品牌这类重复值多的列占用很小
+save() 后目录中再写入列名和字典，成为可由 SpillTable.load() 重新打开的持久列式表
+
+环境变量:
+    TRANSPOSE_MEMORY_MB  单个工作表转置结果的内存预算（默认1024）
+    SPILL_DIR            落盘临时目录（默认系统临时目录下的 datazhuanzhi_spill）
+"""
+
+import json
+import math
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+MEMORY_BUDGET_BYTES = int(os.environ.get('TRANSPOSE_MEMORY_MB', '1024')) * 1024 * 1024
+SPILL_DIR = os.environ.get('SPILL_DIR') or os.path.join(tempfile.gettempdir(), 'datazhuanzhi_spill')
+
+# 结果中每个单元格在DataFrame和openpyxl写出过程中的大致内存占用
+BYTES_PER_CELL = 300
+# 每批编码或解码的行数
+BATCH_ROWS = 50000
+
+CODE_NUMBER = -1
+CODE_INT = -2
+
+
+def estimate_bytes(rows, columns):
+    """估算 rows 行 columns 列的转置结果在内存中处理时的占用"""
+    return rows * columns * BYTES_PER_CELL
+
+
+def exceeds_budget(rows, columns, budget=None):
+    """结果是否超过内存预算，需要落盘"""
+    return estimate_bytes(rows, columns) > (MEMORY_BUDGET_BYTES if budget is None else budget)
+
+
+class SpillTable:
+    """
+    落盘的列式表格，行数在创建时确定，按批次追加
+
+    用法:
+        table = SpillTable(['关键词名称', ...], 行数)
+        table.append([列1的值, 列2的值, ...])
+        for row in table.iter_rows(): ...
+        table.close()
+    """
+
+    def __init__(self, columns, capacity, scratch_dir=None):
+        self.columns = list(columns)
+        self.capacity = capacity
+        self.size = 0
+        scratch_dir = scratch_dir or SPILL_DIR
+        os.makedirs(scratch_dir, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='spill_', dir=scratch_dir)
+        # 映射文件不允许长度为0
+        length = max(capacity, 1)
+        self._numbers = []
+        self._codes = []
+        for i in range(len(self.columns)):
+            self._numbers.append(np.memmap(os.path.join(self.directory, f'{i}.num'),
+                                           dtype=np.float64, mode='w+', shape=(length,)))
+            self._codes.append(np.memmap(os.path.join(self.directory, f'{i}.code'),
+                                         dtype=np.int32, mode='w+', shape=(length,)))
+        self._dictionaries = [{} for _ in self.columns]
+        self._values = [[] for _ in self.columns]
+        # 已保存为持久表或从持久表打开时，close() 不删除文件
+        self._persistent = False
+
+    @classmethod
+    def load(cls, directory):
+        """只读打开 save() 保存的持久表"""
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, 'dictionaries.pkl'), 'rb') as f:
+            values = pickle.load(f)
+        table = cls.__new__(cls)
+        table.columns = meta['columns']
+        table.capacity = table.size = meta['size']
+        table.directory = directory
+        table._numbers = [np.memmap(os.path.join(directory, f'{i}.num'), dtype=np.float64, mode='r')
+                          for i in range(len(table.columns))]
+        table._codes = [np.memmap(os.path.join(directory, f'{i}.code'), dtype=np.int32, mode='r')
+                        for i in range(len(table.columns))]
+        table._dictionaries = None
+        table._values = values
+        table._persistent = True
+        return table
+
+    @property
+    def shape(self):
+        return (self.size, len(self.columns))
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def append(self, columns):
+        """追加一批数据，columns 为与列名一一对应、长度相同的值序列"""
+        count = len(columns[0]) if columns else 0
+        if self.size + count > self.capacity:
+            raise ValueError(f"超出预分配的行数: {self.size + count} > {self.capacity}")
+        start, end = self.size, self.size + count
+        for i, values in enumerate(columns):
+            if isinstance(values, np.ndarray) and values.dtype.kind in 'fiu':
+                # 纯数值列整批写入
+                self._numbers[i][start:end] = values
+                self._codes[i][start:end] = CODE_NUMBER if values.dtype.kind == 'f' else CODE_INT
+                continue
+            numbers = np.full(count, np.nan)
+            codes = np.full(count, CODE_NUMBER, dtype=np.int32)
+            dictionary = self._dictionaries[i]
+            for j, value in enumerate(values):
+                if value is None:
+                    continue
+                kind = type(value)
+                if kind is float or kind is np.float64:
+                    if not math.isnan(value):
+                        numbers[j] = value
+                elif (kind is int or kind is np.int64) and abs(value) < 2 ** 53:
+                    numbers[j] = value
+                    codes[j] = CODE_INT
+                elif value is pd.NaT:
+                    continue
+                else:
+                    code = dictionary.get(value)
+                    if code is None:
+                        code = len(self._values[i])
+                        dictionary[value] = code
+                        self._values[i].append(value)
+                    codes[j] = code
+            self._numbers[i][start:end] = numbers
+            self._codes[i][start:end] = codes
+        self.size = end
+
+    def column_arrays(self, i):
+        """第i列的 (数值数组, 编码数组, 字典值列表)，长度为实际行数"""
+        return self._numbers[i][:self.size], self._codes[i][:self.size], self._values[i]
+
+    def _decode(self, i, rows):
+        """把一列中 rows（切片或行号数组）选中的行还原为Python对象列表"""
+        numbers = np.asarray(self._numbers[i][rows])
+        codes = np.asarray(self._codes[i][rows])
+        result = numbers.astype(object)
+        result[np.isnan(numbers) & (codes == CODE_NUMBER)] = None
+        ints = codes == CODE_INT
+        if ints.any():
+            result[ints] = numbers[ints].astype(np.int64).tolist()
+        coded = codes >= 0
+        if coded.any():
+            dictionary = np.empty(len(self._values[i]), dtype=object)
+            dictionary[:] = self._values[i]
+            result[coded] = dictionary[codes[coded]]
+        return result.tolist()
+
+    def take(self, rows):
+        """按行号数组取出若干行，返回值元组列表"""
+        return list(zip(*(self._decode(i, rows) for i in range(len(self.columns)))))
+
+    def iter_rows(self, batch_rows=BATCH_ROWS):
+        """逐行产出值元组，空值为None"""
+        for start in range(0, self.size, batch_rows):
+            end = min(start + batch_rows, self.size)
+            yield from zip(*(self._decode(i, slice(start, end)) for i in range(len(self.columns))))
+
+    def to_dataframe(self):
+        """全部读回内存，仅用于小表或测试"""
+        return pd.DataFrame(list(self.iter_rows()), columns=self.columns).infer_objects()
+
+    def save(self, directory):
+        """
+        保存为持久表并移动到 directory（不能已存在），之后只能用 SpillTable.load() 读取
+        """
+        for array in self._numbers + self._codes:
+            array.flush()
+        with open(os.path.join(self.directory, 'dictionaries.pkl'), 'wb') as f:
+            pickle.dump(self._values, f)
+        with open(os.path.join(self.directory, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'columns': self.columns, 'size': self.size}, f, ensure_ascii=False)
+        self._numbers = []
+        self._codes = []
+        shutil.move(self.directory, directory)
+        self.directory = directory
+        self._persistent = True
+
+    def close(self):
+        """释放映射并删除临时文件"""
+        self._numbers = []
+        self._codes = []
+        if not self._persistent:
+            shutil.rmtree(self.directory, ignore_errors=True)
@@ -14,7 +14,12 @@ fi
 # 启动Flask应用
 echo "📱 启动Flask应用..."
 source venv/bin/activate
-python app.py &
+# 生产模式：gunicorn多进程；设置 DEV=1 时使用Flask开发服务器
+if [ "$DEV" = "1" ]; then
+    python app.py &
+else
+    gunicorn -c gunicorn.conf.py wsgi:application &
+fi
 FLASK_PID=$!
 
 echo "⏳ 等待Flask应用启动..."
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量上传测试
+检查解压时跳过目录、临时文件和不支持的格式，成员名中的目录不会写到上传目录之外，
+成员损坏时返回400并删除已解压的文件；
+以及下载时按完成的任务输出zip，失败和输出已过期的文件只记录在 批量转置汇总.json 中
+
+用法: python -m pytest test_batch_upload.py
+"""
+
+import io
+import json
+import os
+import uuid
+import zipfile
+
+import pytest
+
+import batch_upload
+import jobs
+
+WORKBOOK = b'PK\x03\x04 workbook ' * 100
+
+
+def _allowed(name):
+    return name.lower().endswith(('.xlsx', '.xls'))
+
+
+def _zip(path, members, compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, 'w', compression) as zf:
+        for name, data in members:
+            zf.writestr(name, data)
+    return str(path)
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    folder = tmp_path / 'uploads'
+    folder.mkdir()
+    return str(folder)
+
+
+def test_extract_workbooks(tmp_path, upload_folder):
+    zip_path = _zip(tmp_path / 'a.zip', [
+        ('报表/报表.xlsx', WORKBOOK),
+        ('报表/', b''),
+        ('__MACOSX/报表/._报表.xlsx', b'x'),
+        ('报表/~$报表.xlsx', b'x'),
+        ('报表/说明.txt', b'x'),
+        ('../../旧报表.XLS', WORKBOOK),
+    ])
+    saved = batch_upload.extract_workbooks(zip_path, upload_folder, _allowed)
+    assert [item['name'] for item in saved] == ['报表.xlsx', '旧报表.XLS']
+    # 成员名中的目录被去掉，文件都在上传目录中
+    assert sorted(os.listdir(upload_folder)) == sorted(os.path.basename(item['input_path']) for item in saved)
+    for item in saved:
+        assert os.path.basename(item['input_path']) == f"{item['job_id']}_{item['filename']}"
+        with open(item['input_path'], 'rb') as f:
+            assert f.read() == WORKBOOK
+    # 纯中文文件名用任务ID代替，保留扩展名
+    assert saved[1]['filename'] == f"{saved[1]['job_id'][:8]}.xls"
+
+
+def test_member_name_gbk():
+    # Windows压缩工具按GBK编码文件名，且不设置UTF-8标志
+    info = zipfile.ZipInfo('报表\\周报.xlsx'.encode('gbk').decode('cp437'))
+    assert batch_upload._member_name(info) == '周报.xlsx'
+
+
+def _error(call, *args):
+    with pytest.raises(batch_upload.BatchError) as error:
+        call(*args)
+    return error.value
+
+
+def test_bad_member(tmp_path, upload_folder):
+    zip_path = _zip(tmp_path / 'a.zip', [('a.xlsx', WORKBOOK), ('b.xlsx', b'B' * 1000), ('c.xlsx', WORKBOOK)])
+    # 改坏第二个成员的数据，读取时CRC校验失败
+    with open(zip_path, 'rb') as f:
+        data = f.read()
+    offset = data.index(b'B' * 1000)
+    with open(zip_path, 'wb') as f:
+        f.write(data[:offset] + b'C' + data[offset + 1:])
+
+    error = _error(batch_upload.extract_workbooks, zip_path, upload_folder, _allowed)
+    assert error.status_code == 400 and 'b.xlsx' in str(error)
+    # 已解压的 a.xlsx 和不完整的 b.xlsx 都被删除
+    assert os.listdir(upload_folder) == []
+
+
+def test_truncated_member(tmp_path, upload_folder):
+    zip_path = _zip(tmp_path / 'a.zip', [('a.xlsx', os.urandom(5000))], zipfile.ZIP_DEFLATED)
+    with zipfile.ZipFile(zip_path) as zf:
+        info = zf.infolist()[0]
+    # 压缩数据被截断（中央目录仍完整），解压到一半出错
+    with open(zip_path, 'rb') as f:
+        data = f.read()
+    start = info.header_offset + 30 + len(info.filename.encode('utf-8'))
+    end = start + info.compress_size
+    data = data[:start + 100] + b'\0' * (info.compress_size - 100) + data[end:]
+    with open(zip_path, 'wb') as f:
+        f.write(data)
+    assert _error(batch_upload.extract_workbooks, zip_path, upload_folder, _allowed).status_code == 400
+    assert os.listdir(upload_folder) == []
+
+
+def test_bad_archive(tmp_path, upload_folder, monkeypatch):
+    path = tmp_path / 'a.zip'
+    path.write_bytes(b'not a zip')
+    assert '损坏' in str(_error(batch_upload.extract_workbooks, str(path), upload_folder, _allowed))
+
+    zip_path = _zip(tmp_path / 'b.zip', [('说明.txt', b'x')])
+    assert _error(batch_upload.extract_workbooks, zip_path, upload_folder, _allowed).status_code == 400
+    monkeypatch.setattr(batch_upload, 'MAX_BATCH_FILES', 1)
+    zip_path = _zip(tmp_path / 'c.zip', [('a.xlsx', WORKBOOK), ('b.xlsx', WORKBOOK)])
+    assert _error(batch_upload.extract_workbooks, zip_path, upload_folder, _allowed).status_code == 413
+    monkeypatch.setattr(batch_upload, 'MAX_EXTRACTED_BYTES', len(WORKBOOK))
+    zip_path = _zip(tmp_path / 'd.zip', [('a.xlsx', WORKBOOK + b'x')])
+    assert _error(batch_upload.extract_workbooks, zip_path, upload_folder, _allowed).status_code == 413
+
+
+def _finished_job(upload_folder, output_folder, name, status, output=True):
+    """提交并结束一个任务；成功的任务写出转置结果和品牌汇总"""
+    job_id = str(uuid.uuid4())
+    filename = batch_upload.chunked_upload.safe_filename(name, job_id[:8])
+    jobs.create_job(upload_folder, job_id, filename)
+    output_name = f"{job_id}_{os.path.splitext(filename)[0]}_20250918_完整转置完成.xlsx"
+    result = {'error': None if status == jobs.STATUS_DONE else '转置失败'}
+    if status == jobs.STATUS_DONE:
+        result.update(results={'关键词数据分析': [4, 12]}, download_url=f'/download/{output_name}')
+        if output:
+            with open(os.path.join(output_folder, output_name), 'wb') as f:
+                f.write(name.encode('utf-8'))
+            with open(os.path.join(output_folder, output_name[:-5] + '.summary.json'), 'w') as f:
+                f.write('{}')
+    jobs.update_job(upload_folder, job_id, status=status, result=result)
+    return {'name': name, 'filename': filename, 'job_id': job_id, 'error': None}
+
+
+def test_stream_results(tmp_path, upload_folder):
+    output_folder = str(tmp_path / 'results')
+    os.makedirs(output_folder)
+    files = [
+        _finished_job(upload_folder, output_folder, '周报.xlsx', jobs.STATUS_DONE),
+        _finished_job(upload_folder, output_folder, '周报.xls', jobs.STATUS_DONE),
+        _finished_job(upload_folder, output_folder, '月报.xlsx', jobs.STATUS_FAILED),
+        _finished_job(upload_folder, output_folder, '季报.xlsx', jobs.STATUS_DONE, output=False),
+        # 提交失败的文件没有任务
+        {'name': '年报.xlsx', 'filename': '年报.xlsx', 'job_id': None, 'error': '预检未通过'},
+    ]
+    batch_id = str(uuid.uuid4())
+    batch_upload.create_batch(upload_folder, batch_id, files)
+
+    data = b''.join(batch_upload.stream_results(upload_folder, output_folder, batch_id, poll_interval=0))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        # 输出文件换回原始文件名，同名的加序号
+        assert zf.namelist() == ['周报_20250918_完整转置完成.xlsx', '周报_20250918_完整转置完成.summary.json',
+                                 '周报_20250918_完整转置完成(2).xlsx', '周报_20250918_完整转置完成(2).summary.json',
+                                 batch_upload.SUMMARY_MEMBER]
+        assert zf.read('周报_20250918_完整转置完成(2).xlsx') == '周报.xls'.encode('utf-8')
+        summary = json.loads(zf.read(batch_upload.SUMMARY_MEMBER))
+    assert summary['total'] == 5 and summary['succeeded'] == 2
+    errors = {item['name']: (item['status'], item['error']) for item in summary['files']}
+    assert errors['月报.xlsx'] == (jobs.STATUS_FAILED, '转置失败')
+    assert errors['季报.xlsx'] == (jobs.STATUS_FAILED, '输出文件已过期')
+    assert errors['年报.xlsx'] == (jobs.STATUS_FAILED, '预检未通过')
+
+
+@pytest.mark.parametrize('batch_id', ['../../etc', str(uuid.uuid4())])
+def test_unknown_batch(upload_folder, batch_id):
+    assert _error(batch_upload.stream_results, upload_folder, upload_folder, batch_id).status_code == 404
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+品牌汇总测试
+检查三个层级的分组和统计值：三行表头的中间层（分组）分别汇总，不合并到同一行；
+行按品牌分组排列，文本和空值不计入行数
+
+用法: python -m pytest test_brand_summary.py
+"""
+
+import json
+
+import pytest
+
+import brand_summary
+
+ALL = brand_summary.ALL
+COLUMNS = ['关键词名称', 'AI平台', '品牌', '品牌类型', '分组1', '数值']
+
+
+def _batch(rows):
+    return [[row[i] for row in rows] for i in range(len(COLUMNS))]
+
+
+@pytest.fixture
+def rollup():
+    rollup = brand_summary.RollupAccumulator('信源数据分析', COLUMNS, ['数值'], ('AI平台',), ('分组1',))
+    rollup.add(_batch([
+        ['关键词A', '豆包', '品牌甲', '客户', '第一组', 1.0],
+        ['关键词A', '豆包', '品牌甲', '客户', '第二组', 3.0],
+        ['关键词A', '豆包', '品牌乙', '竞品', '第一组', 5.0],
+    ]))
+    # 第二批中的同一分组与第一批合并
+    rollup.add(_batch([
+        ['关键词B', '豆包', '品牌甲', '客户', '第一组', 2.0],
+        ['关键词B', 'DeepSeek', '品牌甲', '客户', '第一组', '-'],
+        ['关键词B', 'DeepSeek', '品牌乙', '竞品', None, 7.0],
+    ]))
+    return rollup
+
+
+def test_groups_by_level(rollup):
+    rows = [row[1:7] for row in rollup.rows()]
+    assert rows == [
+        ('品牌甲', '客户', '第一组', '豆包', '数值', 2),
+        ('品牌甲', '客户', '第二组', '豆包', '数值', 1),
+        ('品牌甲', '客户', ALL, ALL, '数值', 3),
+        ('品牌乙', '竞品', '第一组', '豆包', '数值', 1),
+        ('品牌乙', '竞品', '', 'DeepSeek', '数值', 1),
+        ('品牌乙', '竞品', ALL, ALL, '数值', 2),
+        (ALL, '客户', ALL, ALL, '数值', 3),
+        (ALL, '竞品', ALL, ALL, '数值', 2),
+    ]
+    first = rollup.rows()[0]
+    assert first[7:] == pytest.approx((3.0, 1.5, 1.0, 2.0))
+
+
+def test_without_levels():
+    # 两行表头没有分组，分组列为全部，品牌下直接按AI平台汇总
+    columns = ['关键词名称', 'AI平台名称', '品牌', '品牌类型', '数值']
+    rollup = brand_summary.RollupAccumulator('关键词数据分析', columns, ['数值'], ('AI平台名称',))
+    rollup.add([['关键词A'] * 2, ['豆包', 'Kimi'], ['品牌甲'] * 2, ['客户'] * 2, [0.5, 0.25]])
+    assert [row[1:5] for row in rollup.rows()] == [
+        ('品牌甲', '客户', ALL, '豆包'), ('品牌甲', '客户', ALL, 'Kimi'),
+        ('品牌甲', '客户', ALL, ALL), (ALL, '客户', ALL, ALL)]
+
+
+def test_summary_outputs(rollup, tmp_path):
+    frame = brand_summary.summary_dataframe({'信源数据分析': rollup})
+    assert list(frame.columns) == brand_summary.SUMMARY_COLUMNS and len(frame) == 8
+    path = brand_summary.write_summary_json({'信源数据分析': rollup}, str(tmp_path / 'a.summary.json'))
+    with open(path, encoding='utf-8') as f:
+        groups = json.load(f)['信源数据分析']
+    assert groups[1]['分组'] == '第二组' and groups[1]['指标']['数值']['合计'] == 3.0
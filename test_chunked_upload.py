@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分块上传测试
+检查按偏移量续传、偏移量不一致返回409和实际进度、超出声明大小或上限返回413、
+同一会话的并发写入返回409，以及组装完成后会话文件被清理；
+接口层的错误响应（JSON中带实际进度或上限）
+
+用法: python -m pytest test_chunked_upload.py
+"""
+
+import fcntl
+import io
+import os
+
+import pytest
+
+import app
+import chunked_upload
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def upload_folder(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def session(upload_folder):
+    return chunked_upload.init_upload(upload_folder, '报表_20250918.xlsx', len(DATA))
+
+
+def _write(upload_folder, session, offset, data, content_length=None):
+    return chunked_upload.write_chunk(upload_folder, session['upload_id'], offset, io.BytesIO(data),
+                                      content_length)
+
+
+def _error(call, *args):
+    with pytest.raises(chunked_upload.ChunkedUploadError) as error:
+        call(*args)
+    return error.value
+
+
+def test_resume_and_finalize(upload_folder, session):
+    assert session['received'] == 0 and session['filename'].endswith('.xlsx')
+    assert _write(upload_folder, session, 0, DATA[:4000])['received'] == 4000
+    # 断线后按查询到的进度继续
+    status = chunked_upload.get_upload_status(upload_folder, session['upload_id'])
+    assert status['received'] == 4000 and not status['complete']
+    assert _write(upload_folder, session, 4000, DATA[4000:])['complete']
+
+    input_path, filename = chunked_upload.finalize_upload(upload_folder, session['upload_id'])
+    assert os.path.basename(input_path) == f"{session['upload_id']}_{filename}"
+    with open(input_path, 'rb') as f:
+        assert f.read() == DATA
+    # 会话文件已删除，再次完成或查询返回404
+    assert os.listdir(os.path.join(upload_folder, chunked_upload.CHUNK_SUBDIR)) == []
+    assert _error(chunked_upload.finalize_upload, upload_folder, session['upload_id']).status_code == 404
+
+
+def test_wrong_offset(upload_folder, session):
+    _write(upload_folder, session, 0, DATA[:100])
+    for offset in (0, 50, 200):
+        error = _error(_write, upload_folder, session, offset, DATA[:10])
+        assert error.status_code == 409 and error.extra == {'received': 100}
+    error = _error(_write, upload_folder, session, 'abc', DATA[:10])
+    assert error.status_code == 400 and error.extra == {'received': 100}
+    # 进度没有变化
+    assert chunked_upload.get_upload_status(upload_folder, session['upload_id'])['received'] == 100
+
+
+def test_chunk_exceeds_declared_size(upload_folder, session):
+    _write(upload_folder, session, 0, DATA[:100])
+    error = _error(_write, upload_folder, session, 100, DATA)
+    assert error.status_code == 413 and error.extra == {'received': 100}
+    # 越界的分块被丢弃，文件内容与确认的进度一致
+    part_path = chunked_upload._session_paths(upload_folder, session['upload_id'])[1]
+    assert os.path.getsize(part_path) == 100
+    error = _error(_write, upload_folder, session, 100, b'x', chunked_upload.MAX_CHUNK_SIZE + 1)
+    assert error.status_code == 413 and error.extra == {'max_chunk_size': chunked_upload.MAX_CHUNK_SIZE}
+
+
+def test_oversize_init(upload_folder, monkeypatch):
+    monkeypatch.setattr(chunked_upload, 'MAX_UPLOAD_BYTES', 1000)
+    error = _error(chunked_upload.init_upload, upload_folder, 'a.xlsx', 1001)
+    assert error.status_code == 413 and error.extra == {'max_size': 1000}
+    assert chunked_upload.init_upload(upload_folder, 'a.xlsx', 1000)['total_size'] == 1000
+
+
+@pytest.mark.parametrize('filename, size', [('', 10), ('a.xlsx', 0), ('a.xlsx', 'abc'), ('a.xlsx', None)])
+def test_invalid_init(upload_folder, filename, size):
+    assert _error(chunked_upload.init_upload, upload_folder, filename, size).status_code == 400
+
+
+def test_incomplete_finalize(upload_folder, session):
+    _write(upload_folder, session, 0, DATA[:100])
+    error = _error(chunked_upload.finalize_upload, upload_folder, session['upload_id'])
+    assert error.status_code == 409 and error.extra == {'received': 100, 'total_size': len(DATA)}
+
+
+def test_concurrent_write(upload_folder, session):
+    # 另一个请求正在写入该会话时立即返回409，不等待
+    meta_path = chunked_upload._session_paths(upload_folder, session['upload_id'])[0]
+    with open(meta_path, 'r') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        error = _error(_write, upload_folder, session, 0, DATA[:10])
+    assert error.status_code == 409 and error.extra == {'received': 0}
+
+
+@pytest.mark.parametrize('upload_id', ['../../etc', 'x' * 32, ''])
+def test_invalid_upload_id(upload_folder, upload_id):
+    error = _error(chunked_upload.get_upload_status, upload_folder, upload_id)
+    assert error.status_code == 404
+
+
+@pytest.fixture
+def client(upload_folder, monkeypatch):
+    monkeypatch.setattr(app, 'UPLOAD_FOLDER', upload_folder)
+    return app.app.test_client()
+
+
+def test_routes(client, monkeypatch):
+    monkeypatch.setattr(chunked_upload, 'MAX_UPLOAD_BYTES', len(DATA))
+    response = client.post('/upload/init', json={'filename': 'a.xlsx', 'size': len(DATA) + 1})
+    assert response.status_code == 413 and response.get_json()['max_size'] == len(DATA)
+
+    response = client.post('/upload/init', json={'filename': 'a.xlsx', 'size': len(DATA)})
+    assert response.status_code == 201
+    upload_id = response.get_json()['upload_id']
+    assert client.put(f'/upload/{upload_id}?offset=0', data=DATA[:100]).get_json()['received'] == 100
+    response = client.put(f'/upload/{upload_id}', data=DATA[:100], headers={'Upload-Offset': '0'})
+    assert response.status_code == 409 and response.get_json()['received'] == 100
+    assert client.get(f'/upload/{upload_id}').get_json()['received'] == 100
+
+
+def test_plain_upload_too_large(client, monkeypatch):
+    # 普通上传的请求体超过上限时返回413，不被通用错误处理转换为500
+    monkeypatch.setitem(client.application.config, 'MAX_CONTENT_LENGTH', 1000)
+    response = client.post('/upload', data={'file': (io.BytesIO(DATA), 'a.xlsx')})
+    assert response.status_code == 413 and 'max_size' in response.get_json()
@@ -5,12 +5,12 @@
 专门验证按照示例格式转置的数据
 """
 
-import pandas as pd
-import openpyxl
 import os
 import sys
 from datetime import datetime
 
+import readers
+
 class CorrectTransposeValidator:
     """正确转置数据验证器"""
     
@@ -66,7 +66,7 @@ class CorrectTransposeValidator:
         
         try:
             # 读取转置后的数据
-            df_transposed = pd.read_excel(self.transposed_file, sheet_name='转置后数据')
+            df_transposed = readers.read_dataframe(self.transposed_file, sheet_name='转置后数据', header=0)
             
             # 检查必要的列是否存在
             required_columns = ['关键词名称', 'AI平台名称', '信源平台名称', '品牌']
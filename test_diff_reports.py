@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+改动前/改动后对比测试
+检查按自然键对齐后的状态（新增、删除、变化、不变）、差值和变化率、显著变化指标的判断，
+以及从一个工作表的 改动前/改动后 两个宽表区域生成对比
+
+用法: python -m pytest test_diff_reports.py
+"""
+
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+
+import diff_reports
+
+SHEET = '关键词数据分析'
+COLUMNS = ['关键词名称', 'AI平台名称', '品牌', '品牌类型', '可见概率', '推荐概率']
+
+
+def _frame(rows):
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+@pytest.fixture
+def diff():
+    before = _frame([
+        ['关键词A', '豆包', '品牌甲', '客户', 0.5, 0.2],      # 不变
+        ['关键词A', '豆包', '品牌乙', '竞品', 0.5, 0.2],      # 可见概率小幅变化
+        ['关键词A', None, '品牌甲', '客户', 0.5, 0.0],        # 推荐概率从0变化，空平台对齐
+        ['关键词B', '豆包', '品牌甲', '客户', '-', 0.2],      # 文本变化
+        ['关键词C', '豆包', '品牌甲', '客户', 0.1, 0.1],      # 删除
+    ])
+    after = _frame([
+        ['关键词A', '豆包', '品牌乙', '竞品', 0.55, 0.2],
+        ['关键词A', '豆包', '品牌甲', '客户', 0.5, 0.2],
+        ['关键词A', np.nan, '品牌甲', '客户', 0.5, 0.1],
+        ['关键词B', '豆包', '品牌甲', '客户', 'N/A', 0.2],
+        ['关键词D', '豆包', '品牌乙', '竞品', 0.3, 0.3],      # 新增
+    ])
+    result = diff_reports.diff_frames(SHEET, before, after)
+    return result.set_index(['关键词名称', 'AI平台', '品牌'])
+
+
+def test_statuses(diff):
+    assert diff['状态'].to_dict() == {
+        ('关键词A', '豆包', '品牌甲'): diff_reports.STATUS_UNCHANGED,
+        ('关键词A', '豆包', '品牌乙'): diff_reports.STATUS_CHANGED,
+        ('关键词A', '', '品牌甲'): diff_reports.STATUS_CHANGED,
+        ('关键词B', '豆包', '品牌甲'): diff_reports.STATUS_CHANGED,
+        ('关键词C', '豆包', '品牌甲'): diff_reports.STATUS_REMOVED,
+        ('关键词D', '豆包', '品牌乙'): diff_reports.STATUS_ADDED,
+    }
+    # 新增、删除的行品牌类型取自存在的一侧
+    assert diff.loc[('关键词D', '豆包', '品牌乙'), '品牌类型'] == '竞品'
+
+
+def test_delta_and_significance(diff):
+    row = diff.loc[('关键词A', '豆包', '品牌乙')]
+    assert row['可见概率_差值'] == pytest.approx(0.05)
+    assert row['可见概率_变化率'] == pytest.approx(0.1)
+    # 变化率低于阈值不算显著
+    assert row['显著变化指标'] == ''
+    # 原值为0时变化率无法计算，有变化即显著
+    row = diff.loc[('关键词A', '', '品牌甲')]
+    assert np.isnan(row['推荐概率_变化率']) and row['显著变化指标'] == '推荐概率'
+    assert diff.loc[('关键词B', '豆包', '品牌甲'), '显著变化指标'] == '可见概率'
+    assert diff.loc[('关键词C', '豆包', '品牌甲'), '显著变化指标'] == '可见概率,推荐概率'
+    assert diff.loc[('关键词C', '豆包', '品牌甲'), '可见概率_差值'] == pytest.approx(-0.1)
+
+
+def test_threshold():
+    before = _frame([['关键词A', '豆包', '品牌甲', '客户', 0.5, 0.2]])
+    after = _frame([['关键词A', '豆包', '品牌甲', '客户', 0.55, 0.2]])
+    assert diff_reports.diff_frames(SHEET, before, after, threshold=0.05)['显著变化指标'].tolist() == ['可见概率']
+
+
+def test_significant_rows(diff):
+    rows = diff_reports.significant_rows(diff.reset_index())
+    # 只列出显著变化的行（新增、删除、从0或文本变化），小幅变化的行不列出
+    assert set(rows['状态']) == {diff_reports.STATUS_CHANGED, diff_reports.STATUS_ADDED,
+                                diff_reports.STATUS_REMOVED}
+    assert len(rows) == 4
+
+
+def _write_block(worksheet, first_row, values):
+    """在 first_row 写入一个区域：标记行、品牌行（品牌甲 C:D 合并，品牌乙不合并）、指标行和数据行"""
+    worksheet.cell(row=first_row, column=1, value=diff_reports.BEFORE if first_row == 1 else diff_reports.AFTER)
+    worksheet.cell(row=first_row + 1, column=3, value='品牌甲(客户)')
+    worksheet.merge_cells(start_row=first_row + 1, start_column=3, end_row=first_row + 1, end_column=4)
+    worksheet.cell(row=first_row + 1, column=5, value='品牌乙(竞品)')
+    for col, name in enumerate(['关键词名称', 'AI平台名称', '可见概率', '推荐概率', '可见概率', '推荐概率'], start=1):
+        worksheet.cell(row=first_row + 2, column=col, value=name)
+    for offset, row in enumerate(values, start=3):
+        for col, value in enumerate(row, start=1):
+            worksheet.cell(row=first_row + offset, column=col, value=value)
+
+
+def test_blocks_in_one_sheet(tmp_path):
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = SHEET
+    _write_block(worksheet, 1, [['关键词A', '豆包', 0.5, 0.2, 0.3, None],
+                                ['关键词B', '豆包', 0.4, None, None, None]])
+    _write_block(worksheet, 7, [['关键词A', '豆包', 0.5, 0.2, 0.6, None],
+                                ['关键词C', '豆包', None, None, 0.1, 0.1]])
+    path = str(tmp_path / '示例.xlsx')
+    workbook.save(path)
+
+    result = diff_reports.diff_reports([path], str(tmp_path / '对比.xlsx'))[SHEET]
+    statuses = {(row['关键词名称'], row['品牌']): row['状态'] for _, row in result.iterrows()}
+    assert statuses == {
+        ('关键词A', '品牌甲'): diff_reports.STATUS_UNCHANGED,
+        ('关键词A', '品牌乙'): diff_reports.STATUS_CHANGED,
+        ('关键词B', '品牌甲'): diff_reports.STATUS_REMOVED,
+        ('关键词C', '品牌乙'): diff_reports.STATUS_ADDED,
+    }
+    sheets = openpyxl.load_workbook(str(tmp_path / '对比.xlsx'), read_only=True).sheetnames
+    assert sheets == [f'{SHEET}对比', f'{SHEET}显著变化']
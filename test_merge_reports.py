@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多期报告合并测试
+检查按自然键 (日期, 关键词名称, 品牌, AI平台, ...) 去重：同一日期的重复行以命令行中靠后的文件为准，
+不同日期的行都保留；键中的空值（None 和 NaN）视为相同；AI平台名称列统一为 AI平台，
+已有 日期 列的合并结果沿用原日期
+
+用法: python -m pytest test_merge_reports.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import merge_reports
+
+SHEET = '关键词数据分析'
+METRICS = ['可见概率', '推荐概率', '信源平台占比', '信源文章占比',
+           'Top1占比', 'Top前3占比', 'Top前5占比', 'Top前10占比']
+
+
+def _keyword_sheet(value):
+    """关键词数据分析的转置结果，第三行AI平台为空"""
+    df = pd.DataFrame([['关键词A', '豆包', '品牌甲', '客户'],
+                       ['关键词A', '豆包', '品牌乙', '竞品'],
+                       ['关键词B', None, '品牌甲', '客户']],
+                      columns=['关键词名称', 'AI平台名称', '品牌', '品牌类型'])
+    for metric in METRICS:
+        df[metric] = value
+    return df
+
+
+def _save(path, df):
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name=SHEET, index=False)
+    return str(path)
+
+
+def test_merge_frames_dedup():
+    first = _keyword_sheet(0.1)
+    second = _keyword_sheet(0.2)
+    # 第二个文件中AI平台的空值为NaN，与第一个文件中的None是同一个键
+    second.loc[2, 'AI平台名称'] = np.nan
+    frames = [(merge_reports._with_date(first, '2025-09-18'), 'a.xlsx'),
+              (merge_reports._with_date(second, '2025-09-18'), 'b.xlsx')]
+    merged, replaced = merge_reports.merge_frames(SHEET, frames)
+    assert replaced == 3 and len(merged) == 3
+    assert list(merged.columns[:3]) == ['日期', '关键词名称', 'AI平台']
+    assert merged['可见概率'].tolist() == [0.2, 0.2, 0.2]
+
+
+def test_merge_frames_keeps_other_dates():
+    frames = [(merge_reports._with_date(_keyword_sheet(0.2), '2025-09-25'), 'b.xlsx'),
+              (merge_reports._with_date(_keyword_sheet(0.1), '2025-09-18'), 'a.xlsx')]
+    merged, replaced = merge_reports.merge_frames(SHEET, frames)
+    assert replaced == 0
+    # 日期从早到晚，同一日期内保持原始顺序
+    assert merged['日期'].tolist() == ['2025-09-18'] * 3 + ['2025-09-25'] * 3
+    assert merged['品牌'].tolist()[:3] == ['品牌甲', '品牌乙', '品牌甲']
+
+
+def test_merge_reports(tmp_path):
+    old = _save(tmp_path / '报表_20250918.xlsx', _keyword_sheet(0.1))
+    new = _save(tmp_path / '报表_20250925.xlsx', _keyword_sheet(0.3))
+    # 同一期报告的更正版本在命令行中靠后，覆盖先前的行
+    fixed = _save(tmp_path / '更正_20250918.xlsx', _keyword_sheet(0.2).iloc[:1])
+    output = str(tmp_path / '合并.xlsx')
+    merged = merge_reports.merge_reports([new, old, fixed], output)[SHEET]
+    assert len(merged) == 6
+    first_week = merged[merged['日期'] == '2025-09-18']
+    assert first_week['可见概率'].tolist() == pytest.approx([0.1, 0.1, 0.2])
+
+    # 再次合并已合并的结果：沿用 日期 列，与新文件中相同日期的行去重
+    again = merge_reports.merge_reports([output, new], str(tmp_path / '再次合并.xlsx'))[SHEET]
+    assert len(again) == 6
+    assert sorted(set(again['日期'])) == ['2025-09-18', '2025-09-25']
+
+
+def test_iso_date():
+    assert merge_reports._iso_date(pd.Timestamp('2025-09-18 08:00')) == '2025-09-18'
+    assert merge_reports._iso_date(' 2025-09-18 ') == '2025-09-18'
+    assert merge_reports._iso_date(np.nan) is None
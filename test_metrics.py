@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+运行指标测试
+检查多进程导出时仪表的合并方式：各进程分别统计的量相加，队列长度等全局量取最近一次更新的值，
+以及进程退出后其仪表数据被丢弃
+
+用法: python -m pytest test_metrics.py
+"""
+
+import metrics
+
+
+def _registry(tmp_path):
+    registry = metrics.MetricsRegistry(str(tmp_path))
+    in_progress = registry.register(metrics.Gauge('jobs_in_progress', '运行中'))
+    queued = registry.register(metrics.Gauge('jobs_queued', '排队中', multiprocess_mode='mostrecent'))
+    return registry, in_progress, queued
+
+
+def _write_process(registry, pid, now, monkeypatch, **values):
+    """在时刻 now 以另一个进程号更新并写出快照，模拟其他工作进程"""
+    with monkeypatch.context() as patch:
+        patch.setattr(metrics.os, 'getpid', lambda: pid)
+        patch.setattr(metrics.time, 'time', lambda: now)
+        for metric in registry._metrics:
+            metric.set(values[metric.name])
+        registry.write_snapshot(force=True)
+
+
+def test_gauge_merge_modes(tmp_path, monkeypatch):
+    registry, in_progress, queued = _registry(tmp_path)
+    _write_process(registry, 1001, 100.0, monkeypatch, jobs_in_progress=2, jobs_queued=5)
+    # 另一个进程后调度，读到的队列更短
+    _write_process(registry, 1002, 200.0, monkeypatch, jobs_in_progress=1, jobs_queued=3)
+
+    merged = registry._merged_values()
+    assert in_progress.render(merged['jobs_in_progress'])[-1] == 'jobs_in_progress 3'
+    assert queued.render(merged['jobs_queued'])[-1] == 'jobs_queued 3'
+
+    # 进程退出后仪表数据被丢弃
+    registry.mark_process_dead(1002)
+    merged = registry._merged_values()
+    assert in_progress.render(merged['jobs_in_progress'])[-1] == 'jobs_in_progress 2'
+    assert queued.render(merged['jobs_queued'])[-1] == 'jobs_queued 5'
+
+
+def test_single_process_render():
+    gauge = metrics.Gauge('jobs_queued', '排队中', multiprocess_mode='mostrecent')
+    gauge.set(4)
+    assert gauge.render()[-1] == 'jobs_queued 4'
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+预检测试
+检查工作表规模和输出行数的估计、表头行数识别、按内存预算选择写出方式的边界，
+以及超过Excel行数上限或单个任务内存上限时拒绝任务
+
+用法: python -m pytest test_preflight.py
+"""
+
+import openpyxl
+import pytest
+
+import preflight
+
+METRICS = ['可见概率', '推荐概率', '信源平台占比', '信源文章占比',
+           'Top1占比', 'Top前3占比', 'Top前5占比', 'Top前10占比']
+
+
+@pytest.fixture
+def report(tmp_path):
+    """
+    关键词数据分析：两个品牌各8列，4行数据中品牌甲有3行有数据、品牌乙有1行，非空比例为 4/8；
+    另有一个原样复制的说明工作表
+    """
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = '关键词数据分析'
+    worksheet.append([None, None, '品牌甲(客户)'] + [None] * 7 + ['品牌乙(竞品)'])
+    worksheet.append(['关键词名称', 'AI平台名称'] + METRICS * 2)
+    worksheet.merge_cells('C1:J1')
+    worksheet.merge_cells('K1:R1')
+    worksheet.append(['关键词A', '豆包'] + [0.1] * 8 + [0.2] * 8)
+    worksheet.append(['关键词A', 'DeepSeek'] + [0.3] + [None] * 15)
+    worksheet.append(['关键词B', '豆包'] + [0] * 16)
+    worksheet.append(['关键词B', 'DeepSeek'] + [None] * 7 + ['-'])
+    notes = workbook.create_sheet('说明')
+    notes.append(['报表说明'])
+    notes.append([123])
+    path = str(tmp_path / 'report.xlsx')
+    workbook.save(path)
+    return path
+
+
+def test_estimate(report):
+    result = preflight.preflight(report)
+    keyword, notes = result['sheets']
+    assert (keyword['rows'], keyword['columns'], keyword['brands']) == (6, 18, 2)
+    assert keyword['fill_ratio'] == 0.5
+    assert (keyword['output_rows'], keyword['output_rows_max'], keyword['output_columns']) == (4, 8, 12)
+    assert notes['layout'] is None and notes['output_rows'] == 2
+    # 只统计转置工作表的输出行数
+    assert result['output_rows'] == 4
+    assert result['mode'] == 'memory' and not result['rejected'] and result['reason'] is None
+
+
+def test_detect_header_rows(report, tmp_path):
+    with preflight.readers.open_workbook(report) as reader:
+        assert preflight.detect_header_rows(reader, '关键词数据分析') == 2
+
+    # 三行表头：品牌下先按AI平台分组
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = '关键词数据分析'
+    worksheet.append([None, None, '品牌甲(客户)'])
+    worksheet.append([None, None, '豆包'])
+    worksheet.append(['关键词名称', 'AI平台名称'] + METRICS)
+    # 已经转置过的长表第1行就是指标
+    long_table = workbook.create_sheet('信源数据分析')
+    long_table.append(['关键词名称', 'AI平台', '信源平台名称', '选用信源文章总数', '品牌', '品牌类型',
+                       '选用信源文章占比', '选用信源文章数'])
+    path = str(tmp_path / 'three.xlsx')
+    workbook.save(path)
+    with preflight.readers.open_workbook(path) as reader:
+        assert preflight.detect_header_rows(reader, '关键词数据分析') == 3
+        assert preflight.detect_header_rows(reader, '信源数据分析') == 1
+
+
+def _sheets(output_rows, input_cells=1000, output_columns=12):
+    return [{'input_cells': input_cells, 'output_rows': output_rows, 'output_columns': output_columns}]
+
+
+def test_choose_mode_thresholds():
+    sheets = _sheets(1_000_000)
+    _, memory_in_memory = preflight.estimate_cost(sheets, 'memory')
+    _, memory_streaming = preflight.estimate_cost(sheets, 'streaming')
+    _, memory_spill = preflight.estimate_cost(sheets, 'spill')
+    assert memory_in_memory > memory_streaming > memory_spill
+
+    # 内存估计恰好等于预算时仍在预算内
+    assert preflight.choose_mode(sheets, budget=memory_in_memory)[0] == 'memory'
+    assert preflight.choose_mode(sheets, budget=memory_in_memory - 1)[0] == 'streaming'
+    assert preflight.choose_mode(sheets, budget=memory_streaming)[0] == 'streaming'
+    mode, seconds, memory = preflight.choose_mode(sheets, budget=memory_streaming - 1)
+    assert mode == 'spill' and memory == memory_spill
+    # 超出所有预算时仍返回落盘方式，是否拒绝由 preflight 按单任务上限判断
+    assert preflight.choose_mode(sheets, budget=0)[0] == 'spill'
+    assert seconds == pytest.approx(preflight.estimate_cost(sheets, 'spill')[0])
+
+
+def test_estimate_cost_uses_largest_input():
+    sheets = _sheets(0, input_cells=10) + _sheets(0, input_cells=30)
+    seconds, memory = preflight.estimate_cost(sheets, 'memory')
+    assert memory == 30 * preflight.INPUT_BYTES_PER_CELL
+    assert seconds == pytest.approx(40 * preflight.SECONDS_PER_INPUT_CELL)
+
+
+def test_reject_too_many_rows(report, monkeypatch):
+    monkeypatch.setattr(preflight, 'EXCEL_MAX_ROWS', 4)
+    result = preflight.preflight(report)
+    assert result['rejected'] and '关键词数据分析' in result['reason'] and '说明' not in result['reason']
+
+
+def test_reject_memory(report, monkeypatch):
+    monkeypatch.setattr(preflight, 'MAX_JOB_MEMORY_BYTES', 1024)
+    result = preflight.preflight(report)
+    assert result['rejected'] and '内存' in result['reason']
+    assert result['peak_memory_bytes'] > 1024
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+读取后端选择测试
+检查按扩展名选择后端，扩展名缺失时按文件头识别旧版.xls，以及上传文件名保留扩展名
+
+用法: python -m pytest test_readers.py
+"""
+
+import pytest
+
+import chunked_upload
+import readers
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('信源报告.xls', 'abcd1234.xls'),
+    ('信源报告.XLSX', 'abcd1234.xlsx'),
+    ('report 1.xls', 'report_1.xls'),
+    ('报告_v2.xlsx', 'v2.xlsx'),
+])
+def test_safe_filename_keeps_extension(name, expected):
+    assert chunked_upload.safe_filename(name, 'abcd1234') == expected
+
+
+def test_backend_by_extension(tmp_path):
+    path = tmp_path / 'a.xls'
+    path.write_bytes(b'')
+    assert readers.candidate_backends(str(path)) == (['xlrd'] if readers.backend_available('xlrd') else [])
+
+
+def test_backend_by_magic_bytes(tmp_path):
+    ole2 = tmp_path / 'abc_xls'
+    ole2.write_bytes(readers.OLE2_MAGIC + b'\0' * 504)
+    zipped = tmp_path / 'abc_xlsx'
+    zipped.write_bytes(b'PK\x03\x04' + b'\0' * 100)
+    if readers.backend_available('xlrd'):
+        assert readers.candidate_backends(str(ole2)) == ['xlrd']
+    assert readers.candidate_backends(str(zipped)) == ['xlsx', 'openpyxl']
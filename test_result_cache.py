@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+结果缓存测试
+检查列式缓存的行窗口、排序（数值在前、文本其次、空值总在最后，相同值保持原顺序）和筛选
+
+用法: python -m pytest test_result_cache.py
+"""
+
+import glob
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import result_cache
+
+SHEET = '关键词数据分析'
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    保存一个6行的工作表，返回 (任务ID, 缓存目录)；序号列用于核对行的顺序，
+    数值列混有浮点数、整数、文本和空值，品牌列大小写混合且有空值
+    """
+    df = pd.DataFrame({
+        '序号': [0, 1, 2, 3, 4, 5],
+        '品牌': ['B', 'a', None, 'A', 'b', 'c'],
+        '数值': [3.0, '-', 1.0, np.nan, 3.0, 2],
+    })
+    job_id = str(uuid.uuid4())
+    cache_dir = str(tmp_path)
+    result_cache.save_results({SHEET: df, '空工作表': None}, result_cache.job_cache_dir(job_id, cache_dir))
+    return job_id, cache_dir
+
+
+def _order(cache, **kwargs):
+    job_id, cache_dir = cache
+    window = result_cache.query(job_id, SHEET, cache_dir=cache_dir, **kwargs)
+    return [row[0] for row in window['rows']]
+
+
+def test_manifest(cache):
+    sheets = result_cache.list_sheets(*cache)
+    assert [sheet['name'] for sheet in sheets] == [SHEET]
+    assert sheets[0]['rows'] == 6 and sheets[0]['columns'] == ['序号', '品牌', '数值']
+
+
+def test_window(cache):
+    job_id, cache_dir = cache
+    window = result_cache.query(job_id, SHEET, offset=2, limit=3, cache_dir=cache_dir)
+    assert window['total_rows'] == window['matched_rows'] == 6
+    assert window['rows'] == [[2, None, 1.0], [3, 'A', None], [4, 'b', 3.0]]
+    assert _order(cache, offset=5, limit=10) == [5]
+    assert _order(cache, offset=10) == []
+
+
+def test_sort_nulls_last(cache):
+    # 数值升序，3.0 相同的两行保持原顺序，然后是文本，空值最后
+    assert _order(cache, sort='数值') == [2, 5, 0, 4, 1, 3]
+    # 降序时空值仍在最后
+    assert _order(cache, sort='-数值') == [0, 4, 5, 2, 1, 3]
+    assert _order(cache, sort='品牌') == [3, 0, 1, 4, 5, 2]
+    assert _order(cache, sort='-品牌') == [5, 4, 1, 0, 3, 2]
+    # 排序索引保存后再次查询直接读取
+    table_dir = os.path.join(result_cache.job_cache_dir(*cache), '0')
+    assert len(glob.glob(os.path.join(table_dir, 'order_*.npy'))) == 4
+    assert _order(cache, sort='-数值', offset=1, limit=2) == [4, 5]
+
+
+def test_filter(cache):
+    # 文本不区分大小写
+    assert _order(cache, filters=[('品牌', 'b')]) == [0, 4]
+    # 数字同时匹配数值相等的行，整数和浮点数都可以
+    assert _order(cache, filters=[('数值', '3')]) == [0, 4]
+    assert _order(cache, filters=[('数值', '2')]) == [5]
+    assert _order(cache, filters=[('品牌', '不存在')]) == []
+
+
+def test_filter_with_sort_and_window(cache):
+    job_id, cache_dir = cache
+    window = result_cache.query(job_id, SHEET, sort='-序号', filters=[('品牌', 'B'), ('数值', '3')],
+                                offset=1, cache_dir=cache_dir)
+    assert window['matched_rows'] == 2
+    assert [row[0] for row in window['rows']] == [0]
+
+
+@pytest.mark.parametrize('kwargs, status_code', [
+    ({'sheet_name': '不存在'}, 404),
+    ({'sort': '不存在'}, 400),
+    ({'offset': -1}, 400),
+    ({'job_id': 'missing'}, 404),
+    ({'job_id': '../x'}, 404),
+])
+def test_errors(cache, kwargs, status_code):
+    job_id, cache_dir = cache
+    if kwargs.get('job_id') == 'missing':
+        kwargs['job_id'] = str(uuid.uuid4())
+    kwargs = {'job_id': job_id, 'sheet_name': SHEET, **kwargs}
+    with pytest.raises(result_cache.ResultCacheError) as error:
+        result_cache.query(cache_dir=cache_dir, **kwargs)
+    assert error.value.status_code == status_code
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+反向转置测试
+检查品牌和分组左右顺序的推断（拓扑排序，矛盾或信息不足时按首次出现顺序），
+以及宽表转置后再反向转置得到原来的表头、合并区域和数据
+
+用法: python -m pytest test_reverse_transpose.py
+"""
+
+import numpy as np
+import pandas as pd
+
+import readers
+import reverse_transpose
+import transpose_engine
+
+KEYWORD_SHEET = '关键词数据分析'
+KEYWORD_METRICS = transpose_engine.LAYOUTS[KEYWORD_SHEET]['metric_columns']
+
+
+def _order(sequences, count):
+    """每个序列是一组内从左到右出现的编号"""
+    codes = np.array([code for sequence in sequences for code in sequence], dtype=np.int64)
+    groups = np.array([i for i, sequence in enumerate(sequences) for _ in sequence], dtype=np.int64)
+    return reverse_transpose._sequence_order(codes, groups, count)
+
+
+def test_sequence_order():
+    # 各组的先后关系合起来得到完整顺序
+    assert _order([[0, 2], [2, 1]], 3) == [0, 2, 1]
+    # 先后关系只在组内成立，跨组相邻不构成约束
+    assert _order([[1], [0]], 2) == [0, 1]
+    # 没有约束的项按编号排列
+    assert _order([[2, 3]], 4) == [0, 1, 2, 3]
+
+
+def test_sequence_order_contradictory():
+    # 两组顺序相反，剩余项按编号追加
+    assert _order([[0, 1], [1, 0]], 2) == [0, 1]
+    # 0 在最前没有矛盾，1 和 2 之间有矛盾
+    assert _order([[0, 1, 2], [2, 1]], 3) == [0, 1, 2]
+    # 矛盾不影响其他项的先后关系
+    assert _order([[3, 1], [1, 3], [0, 2]], 4) == [0, 2, 1, 3]
+    assert sorted(_order([[0, 1], [1, 2], [2, 0]], 3)) == [0, 1, 2]
+
+
+def _keyword_sheet():
+    """两行表头，品牌乙只在第2行有数据；每个有数据的品牌块至少有一个非空指标"""
+    header = [[None, None, '品牌甲(客户)'] + [None] * 7 + ['品牌乙(竞品)'] + [None] * 7,
+              ['关键词名称', 'AI平台名称'] + KEYWORD_METRICS * 2]
+    data = [['关键词A', '豆包'] + [i / 10 for i in range(1, 9)] + [None] * 8,
+            ['关键词A', 'DeepSeek'] + [0.5, None] + [0.2] * 6 + [0.3] * 8,
+            ['关键词B', '豆包'] + [None] * 7 + ['-'] + [None] * 8]
+    return header, [(1, 3, 1, 10), (1, 11, 1, 18)], data
+
+
+def _source_sheet():
+    """三行表头：品牌甲下 豆包、DeepSeek 两组，品牌乙下只有 DeepSeek 一组"""
+    header = [[None] * 4 + ['品牌甲(客户)', None, None, None, '品牌乙(竞品)', None],
+              [None] * 4 + ['豆包', None, 'DeepSeek', None, 'DeepSeek', None],
+              ['关键词名称', 'AI平台', '信源平台名称', '选用信源文章总数'] + ['选用信源文章占比', '选用信源文章数'] * 3]
+    merged = [(1, 5, 1, 8), (1, 9, 1, 10), (2, 5, 2, 6), (2, 7, 2, 8), (2, 9, 2, 10)]
+    data = [['关键词A', '豆包', '知乎', 10, 0.5, 5, None, None, 0.1, 1],
+            ['关键词A', '豆包', '百家号', 10, None, None, 0.3, 3, 0.2, 2]]
+    return header, merged, data
+
+
+def _sheet(header, merged, data):
+    rows = [tuple(row) for row in header + data]
+    return {'rows': rows, 'merged_ranges': merged, 'max_row': len(rows), 'max_column': len(rows[0])}
+
+
+def _round_trip(layout_name, header, merged, data):
+    long_table = transpose_engine.transpose_sheet(layout_name, _sheet(header, merged, data),
+                                                  header_rows=len(header), mode='memory')
+    wide = reverse_transpose.reverse_sheet(layout_name, long_table)
+    assert wide['header'] == header
+    assert sorted(wide['merged_ranges']) == sorted(merged)
+    assert wide['data'].tolist() == data
+
+
+def test_round_trip_two_row_header():
+    _round_trip(KEYWORD_SHEET, *_keyword_sheet())
+
+
+def test_round_trip_three_row_header():
+    _round_trip('信源数据分析', *_source_sheet())
+
+
+def test_reverse_workbook(tmp_path):
+    header, merged, data = _keyword_sheet()
+    long_table = transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(header, merged, data), mode='memory')
+    # 合并结果中多出的 日期 列不属于原始报告
+    long_table.insert(0, '日期', '2025-09-18')
+    input_file = str(tmp_path / '长表.xlsx')
+    with pd.ExcelWriter(input_file) as writer:
+        long_table.to_excel(writer, sheet_name=KEYWORD_SHEET, index=False)
+        pd.DataFrame([['说明']]).to_excel(writer, sheet_name='说明', index=False, header=False)
+
+    output_file = str(tmp_path / '宽表.xlsx')
+    reverse_transpose.reverse_workbook(input_file, output_file, merge_keywords=True)
+    with readers.open_workbook(output_file) as reader:
+        assert reader.sheetnames == [KEYWORD_SHEET, '说明']
+        rows, merged_ranges, _, width = reader.read_sheet(KEYWORD_SHEET)
+    rows = [row + (None,) * (width - len(row)) for row in rows]
+    # 连续相同的关键词合并为一个区域
+    assert sorted(merged_ranges) == sorted(merged + [(3, 1, 4, 1)])
+    expected = [tuple(row) for row in header + data]
+    expected[3] = (None,) + expected[3][1:]
+    assert rows == expected
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+任务调度测试
+检查排队顺序（按用户公平、小任务优先、等待过久的任务不被插队）和准入控制（内存预算、并发上限）
+
+用法: python -m pytest test_scheduler.py
+"""
+
+import os
+import time
+import uuid
+
+import jobs
+import metrics
+import scheduler
+
+NOW = 1_000_000.0
+MB = 1024 * 1024
+
+
+def _job(job_id, user='u1', waited=0, seconds=10, memory=100 * MB, status=jobs.STATUS_QUEUED):
+    """构造任务记录，waited 为已排队的秒数"""
+    return {'job_id': job_id, 'user': user, 'status': status, 'created_at': NOW - waited,
+            'estimate': {'seconds': seconds, 'peak_memory_bytes': memory}}
+
+
+def _ids(job_list):
+    return [job['job_id'] for job in job_list]
+
+
+def test_fifo_within_user():
+    queue = [_job('b', waited=10), _job('a', waited=20), _job('c', waited=5)]
+    assert _ids(scheduler.order_queue(queue, NOW)) == ['a', 'b', 'c']
+
+
+def test_fair_between_users():
+    queue = [_job('a1', 'A', waited=40), _job('a2', 'A', waited=30), _job('a3', 'A', waited=20),
+             _job('b1', 'B', waited=10)]
+    assert _ids(scheduler.order_queue(queue, NOW)) == ['a1', 'b1', 'a2', 'a3']
+    # A已有任务在运行时B的任务先执行
+    running = [_job('a0', 'A', waited=50, status=jobs.STATUS_RUNNING)]
+    assert _ids(scheduler.order_queue(queue + running, NOW)) == ['b1', 'a1', 'a2', 'a3']
+
+
+def test_small_jobs_first():
+    big = _job('big', 'A', waited=20, seconds=scheduler.SMALL_JOB_SECONDS * 10)
+    small = _job('small', 'B', waited=10, seconds=scheduler.SMALL_JOB_SECONDS)
+    assert _ids(scheduler.order_queue([big, small], NOW)) == ['small', 'big']
+    # 等待过久的大任务排到最前
+    big['created_at'] = NOW - scheduler.STARVATION_SECONDS - 1
+    assert _ids(scheduler.order_queue([big, small], NOW)) == ['big', 'small']
+
+
+def test_finished_jobs_ignored():
+    queue = [_job('done', status=jobs.STATUS_DONE), _job('failed', 'B', status=jobs.STATUS_FAILED),
+             _job('queued')]
+    assert _ids(scheduler.order_queue(queue, NOW)) == ['queued']
+    assert _ids(scheduler.select_jobs(queue, budget=1000 * MB, max_concurrent=4, now=NOW)) == ['queued']
+
+
+def test_memory_budget():
+    running = _job('r', 'A', memory=600 * MB, status=jobs.STATUS_RUNNING)
+    big = _job('big', 'B', waited=20, seconds=100, memory=600 * MB)
+    small = _job('small', 'C', waited=10, seconds=100, memory=300 * MB)
+    # 大任务内存不够，后面的小任务可以插队
+    assert _ids(scheduler.select_jobs([running, big, small], budget=1000 * MB,
+                                      max_concurrent=4, now=NOW)) == ['small']
+    # 大任务等待过久后预留内存，不再放行后面的任务
+    big['created_at'] = NOW - scheduler.STARVATION_SECONDS - 1
+    assert scheduler.select_jobs([running, big, small], budget=1000 * MB, max_concurrent=4, now=NOW) == []
+
+
+def test_oversized_job_runs_alone():
+    huge = _job('huge', memory=5000 * MB)
+    # 没有任务在运行时总是放行队首任务
+    assert _ids(scheduler.select_jobs([huge], budget=1000 * MB, max_concurrent=4, now=NOW)) == ['huge']
+    # 放行后预算已满，同一轮不再放行其他任务
+    other = _job('other', 'B', waited=-1, memory=1 * MB)
+    assert _ids(scheduler.select_jobs([huge, other], budget=1000 * MB, max_concurrent=4, now=NOW)) == ['huge']
+
+
+def test_concurrency_limit():
+    queue = [_job(f'j{i}', f'u{i}', waited=10 - i, memory=1 * MB) for i in range(5)]
+    assert _ids(scheduler.select_jobs(queue, budget=1000 * MB, max_concurrent=3, now=NOW)) == ['j0', 'j1', 'j2']
+    running = [_job('r', 'x', memory=1 * MB, status=jobs.STATUS_RUNNING)]
+    assert _ids(scheduler.select_jobs(queue + running, budget=1000 * MB, max_concurrent=3, now=NOW)) == ['j0', 'j1']
+
+
+def test_finished_records_archived(tmp_path):
+    upload_folder = str(tmp_path)
+    queued, finished = str(uuid.uuid4()), str(uuid.uuid4())
+    jobs.create_job(upload_folder, queued, 'a.xlsx')
+    jobs.create_job(upload_folder, finished, 'b.xlsx')
+    scheduler.finish_job(upload_folder, finished, jobs.STATUS_DONE, result={})
+    # 已结束的记录移到 finished 子目录，调度只读取未结束的记录，查询仍能找到
+    assert _ids(jobs.list_jobs(upload_folder)) == [queued]
+    assert _ids(jobs.list_finished_jobs(upload_folder)) == [finished]
+    assert jobs.get_job(upload_folder, finished)['status'] == jobs.STATUS_DONE
+    assert not os.path.exists(os.path.join(jobs.job_folder(upload_folder), f"{finished}.json"))
+    assert scheduler.queue_position(upload_folder, queued) == 1
+    assert scheduler.queue_position(upload_folder, finished) is None
+
+
+
+def test_drain_after_short_jobs(tmp_path, monkeypatch):
+    upload_folder = str(tmp_path)
+    for _ in range(20):
+        jobs.create_job(upload_folder, str(uuid.uuid4()), 'a.xlsx', estimate={'peak_memory_bytes': 0})
+    monkeypatch.setitem(scheduler._state, 'upload_folder', upload_folder)
+    monkeypatch.setitem(scheduler._state, 'runner', lambda job: None)
+    monkeypatch.setitem(scheduler._state, 'draining', False)
+    monkeypatch.setattr(scheduler, 'MAX_CONCURRENT_JOBS', 20)
+    assert len(scheduler.dispatch_once()) == 20
+
+    deadline = time.time() + 5
+
+    def heartbeat():
+        assert time.time() < deadline, f"drain 仍在等待 {len(scheduler._job_threads)} 个线程"
+
+    # 立即结束的任务线程都会从集合中移除，drain 很快返回
+    scheduler.drain(heartbeat=heartbeat, interval=0.01)
+    assert not scheduler._job_threads
+
+
+def test_dispatch_sets_queued_gauge(tmp_path, monkeypatch):
+    upload_folder = str(tmp_path)
+    for _ in range(3):
+        jobs.create_job(upload_folder, str(uuid.uuid4()), 'a.xlsx', estimate={'peak_memory_bytes': 0})
+    monkeypatch.setitem(scheduler._state, 'upload_folder', upload_folder)
+    monkeypatch.setitem(scheduler._state, 'runner', lambda job: None)
+    monkeypatch.setitem(scheduler._state, 'draining', False)
+    monkeypatch.setattr(scheduler, 'MAX_CONCURRENT_JOBS', 2)
+    monkeypatch.setattr(metrics.JOBS_QUEUED, '_values', {})
+    # 放行2个任务后还剩1个排队
+    assert len(scheduler.dispatch_once()) == 2
+    assert metrics.JOBS_QUEUED._values == {(): 1}
+    scheduler.drain(interval=0.01)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+落盘缓冲测试
+检查 SpillTable 写入后按批次、按行号读回以及保存为持久表后重新打开，值和类型都与写入时一致
+
+用法: python -m pytest test_spill.py
+"""
+
+import datetime
+import os
+
+import numpy as np
+import pytest
+
+import spill
+
+COLUMNS = ['关键词名称', '品牌', '数值', '整数', '日期']
+
+
+def _sample_columns():
+    """一批覆盖各种取值的数据：文本、空值、NaN、浮点数、整数、大整数、日期"""
+    return [
+        ['关键词A', '关键词A', None, '关键词B', '-'],
+        ['品牌甲', '品牌乙', '品牌甲', None, '品牌乙'],
+        np.array([0.25, np.nan, 1.5, -3.0, 1e10]),
+        [1, 2 ** 60, None, 0, -7],
+        [datetime.date(2025, 9, 18), None, datetime.date(2025, 9, 19), 'x', float('nan')],
+    ]
+
+
+EXPECTED_ROWS = [
+    ('关键词A', '品牌甲', 0.25, 1, datetime.date(2025, 9, 18)),
+    ('关键词A', '品牌乙', None, 2 ** 60, None),
+    (None, '品牌甲', 1.5, None, datetime.date(2025, 9, 19)),
+    ('关键词B', None, -3.0, 0, 'x'),
+    ('-', '品牌乙', 1e10, -7, None),
+]
+
+
+def test_round_trip(tmp_path):
+    with spill.SpillTable(COLUMNS, 10, str(tmp_path)) as table:
+        table.append(_sample_columns())
+        table.append(_sample_columns())
+        assert table.shape == (10, len(COLUMNS))
+        # 按批次读回，批次边界不影响结果
+        rows = list(table.iter_rows(batch_rows=3))
+        assert rows == EXPECTED_ROWS * 2
+        # 整数读回为int，不是float
+        assert type(rows[0][3]) is int
+        directory = table.directory
+    assert not os.path.exists(directory)
+
+
+def test_capacity(tmp_path):
+    with spill.SpillTable(COLUMNS, 4, str(tmp_path)) as table:
+        with pytest.raises(ValueError):
+            table.append(_sample_columns())
+
+
+def test_empty_table(tmp_path):
+    with spill.SpillTable(COLUMNS, 0, str(tmp_path)) as table:
+        assert list(table.iter_rows()) == []
+        assert table.to_dataframe().shape == (0, len(COLUMNS))
+
+
+def test_take(tmp_path):
+    with spill.SpillTable(COLUMNS, 10, str(tmp_path)) as table:
+        table.append(_sample_columns())
+        table.append(_sample_columns())
+        assert table.take(np.array([4, 0, 7])) == [EXPECTED_ROWS[4], EXPECTED_ROWS[0], EXPECTED_ROWS[2]]
+
+
+def test_save_and_load(tmp_path):
+    target = str(tmp_path / 'saved')
+    table = spill.SpillTable(COLUMNS, 5, str(tmp_path))
+    table.append(_sample_columns())
+    table.save(target)
+    table.close()
+    # 持久表关闭时不删除
+    assert os.path.isdir(target)
+
+    loaded = spill.SpillTable.load(target)
+    try:
+        assert loaded.columns == COLUMNS
+        assert len(loaded) == 5
+        assert list(loaded.iter_rows()) == EXPECTED_ROWS
+        numbers, codes, values = loaded.column_arrays(1)
+        assert sorted(values) == ['品牌乙', '品牌甲']
+        assert (codes >= 0).sum() == 4
+    finally:
+        loaded.close()
+    assert os.path.isdir(target)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置引擎测试
+检查数据区合并单元格的填充：纵向、横向和跨多行多列的区域都从左上角取值，表头区域不参与；
+用内存中构造的小工作表检查 transpose_sheet 的输出
+
+用法: python -m pytest test_transpose_engine.py
+"""
+
+import numpy as np
+import openpyxl
+import pytest
+
+import readers
+import transpose_engine
+
+KEYWORD_SHEET = '关键词数据分析'
+KEYWORD_METRICS = transpose_engine.LAYOUTS[KEYWORD_SHEET]['metric_columns']
+
+
+def _sheet(rows, merged_ranges):
+    """构造 load_sheet 返回值格式的工作表，rows 为各行的值列表"""
+    return {
+        'rows': [tuple(row) for row in rows],
+        'merged_ranges': merged_ranges,
+        'max_row': len(rows),
+        'max_column': max(len(row) for row in rows),
+    }
+
+
+def _keyword_header():
+    """关键词数据分析的两行表头：品牌甲(客户) C1:J1、品牌乙(竞品) K1:R1，各8个指标"""
+    brands = [None, None, '品牌甲(客户)'] + [None] * 7 + ['品牌乙(竞品)'] + [None] * 7
+    metrics = ['关键词名称', 'AI平台名称'] + KEYWORD_METRICS * 2
+    return [brands, metrics], [(1, 3, 1, 10), (1, 11, 1, 18)]
+
+
+def _rows(result):
+    """转置结果的前几列（基础信息、品牌、品牌类型）和第一个指标"""
+    return [row[:5] for row in transpose_engine.iter_result_rows(result)]
+
+
+def _grid(rows):
+    values = np.empty((len(rows), len(rows[0])), dtype=object)
+    values[:] = rows
+    return values
+
+
+def test_merged_fill():
+    # 数据从第3行开始，共4列
+    values = _grid([
+        ['关键词A', '豆包', None, 1],      # 第3行
+        [None, 'DeepSeek', 5, 2],         # 第4行
+        [None, None, None, None],         # 第5行
+        ['关键词B', 'Kimi', 7, None],      # 第6行
+    ])
+    merged = [
+        (1, 1, 2, 2),   # 表头区域，不参与
+        (3, 1, 5, 1),   # A3:A5 纵向
+        (3, 2, 3, 3),   # B3:C3 横向
+        (4, 2, 5, 3),   # B4:C5 多行多列
+        (4, 4, 6, 5),   # D4:E6，E列不在索引范围内
+        (6, 1, 6, 1),   # 单个单元格，忽略
+    ]
+    index = transpose_engine.MergedIntervalIndex(merged, first_row=3, columns=4)
+    assert index
+    filled = index.fill(values)
+    assert values.tolist() == [
+        ['关键词A', '豆包', '豆包', 1],
+        ['关键词A', 'DeepSeek', 'DeepSeek', 2],
+        ['关键词A', 'DeepSeek', 'DeepSeek', 2],
+        ['关键词B', 'Kimi', 7, 2],
+    ]
+    assert filled == 8, filled
+
+
+def test_no_data_merges():
+    index = transpose_engine.MergedIntervalIndex([(1, 5, 1, 6), (2, 5, 2, 6)], first_row=3, columns=4)
+    assert not index
+    values = _grid([[None, 1]])
+    assert index.fill(values) == 0 and values.tolist() == [[None, 1]]
+
+
+def test_merged_keyword():
+    # 关键词A纵向合并 A3:A4，第4行的关键词从合并区域取值，不再被当作空行跳过，
+    # 合并区域也不会被识别为品牌
+    header, merged = _keyword_header()
+    rows = header + [
+        ['关键词A', '豆包'] + [0.1] * 8 + [None] * 8,
+        [None, 'DeepSeek'] + [0] * 8 + [0.5] + [None] * 7,
+        ['关键词B', '豆包'] + [0.2] * 16,
+    ]
+    result = transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(rows, merged + [(3, 1, 4, 1)]))
+    assert _rows(result) == [
+        ('关键词A', '豆包', '品牌甲', '客户', 0.1),
+        ('关键词A', 'DeepSeek', '品牌乙', '竞品', 0.5),
+        ('关键词B', '豆包', '品牌甲', '客户', 0.2),
+        ('关键词B', '豆包', '品牌乙', '竞品', 0.2),
+    ]
+
+
+def test_two_row_header():
+    header, merged = _keyword_header()
+    layout = transpose_engine.resolve_layout(KEYWORD_SHEET)
+    columns, index = transpose_engine.build_column_index(_sheet(header, merged), layout)
+    assert columns == list(range(3, 19))
+    assert list(index.names) == ['品牌', '指标']
+    assert list(index[:2]) == [('品牌甲(客户)', '可见概率'), ('品牌甲(客户)', '推荐概率')]
+    assert list(index[8]) == ['品牌乙(竞品)', '可见概率']
+
+
+def _source_sheet_three_rows():
+    """
+    信源数据分析的三行表头：品牌甲(客户) E1:H1 下分 豆包 E2:F2、DeepSeek G2:H2 两组，
+    品牌乙(竞品) I1:J1 下只有 豆包 一组，第3行是指标
+    """
+    rows = [
+        [None] * 4 + ['品牌甲(客户)', None, None, None, '品牌乙(竞品)', None],
+        [None] * 4 + ['豆包', None, 'DeepSeek', None, '豆包', None],
+        ['关键词名称', 'AI平台', '信源平台名称', '选用信源文章总数'] + ['占比', '篇数'] * 3,
+        ['关键词A', '豆包', '知乎', 10, 0.5, 5, None, None, 0.1, 1],
+        ['关键词A', '豆包', '百家号', 10, None, None, 0.3, 3, None, None],
+    ]
+    merged = [(1, 5, 1, 8), (1, 9, 1, 10), (2, 5, 2, 6), (2, 7, 2, 8), (2, 9, 2, 10)]
+    return _sheet(rows, merged)
+
+
+def test_three_row_header():
+    sheet = _source_sheet_three_rows()
+    layout = transpose_engine.resolve_layout('信源数据分析', header_rows=3)
+    columns, index = transpose_engine.build_column_index(sheet, layout)
+    assert columns == list(range(5, 11))
+    assert list(index.names) == ['品牌', '分组1', '指标']
+    # 指标按在分组中的位置对应布局的 metric_columns，不使用表头文字
+    assert list(index[2]) == ['品牌甲(客户)', 'DeepSeek', '选用信源文章占比']
+
+    result = transpose_engine.transpose_sheet('信源数据分析', sheet, header_rows=3)
+    assert list(result.columns) == ['关键词名称', 'AI平台', '信源平台名称', '选用信源文章总数', '品牌', '品牌类型',
+                                    '分组1', '选用信源文章占比', '选用信源文章数']
+    assert [row[2:] for row in transpose_engine.iter_result_rows(result)] == [
+        ('知乎', 10, '品牌甲', '客户', '豆包', 0.5, 5),
+        ('知乎', 10, '品牌乙', '竞品', '豆包', 0.1, 1),
+        ('百家号', 10, '品牌甲', '客户', 'DeepSeek', 0.3, 3),
+    ]
+
+
+def test_level_names():
+    layout = {'id_columns': ['关键词名称'], 'metric_columns': ['数值'], 'data_start_row': 5,
+              'level_columns': ['AI平台']}
+    assert transpose_engine.level_names(layout) == ['AI平台', '分组2']
+    assert transpose_engine.level_names(dict(layout, data_start_row=3)) == []
+    with pytest.raises(ValueError):
+        transpose_engine.resolve_layout(KEYWORD_SHEET, header_rows=1)
+
+
+def _keyword_rows():
+    header, merged = _keyword_header()
+    rows = header + [
+        ['关键词A', '豆包'] + [0.1] * 8 + [0.2] * 8,
+        ['关键词A', 'DeepSeek'] + [0.3] * 8 + [0.4] * 8,
+        ['关键词B', '豆包'] + [0.5] * 8 + [0.6] * 8,
+    ]
+    return rows, merged
+
+
+@pytest.mark.parametrize('filters, expected', [
+    ({'brands': '品牌乙'}, [('关键词A', '豆包', '品牌乙', '竞品', 0.2), ('关键词A', 'DeepSeek', '品牌乙', '竞品', 0.4),
+                          ('关键词B', '豆包', '品牌乙', '竞品', 0.6)]),
+    ({'keywords': '关键词B'}, [('关键词B', '豆包', '品牌甲', '客户', 0.5), ('关键词B', '豆包', '品牌乙', '竞品', 0.6)]),
+    ({'platforms': 'DeepSeek', 'brands': '品牌甲(客户)'}, [('关键词A', 'DeepSeek', '品牌甲', '客户', 0.3)]),
+    ({'keywords': '关键词C'}, []),
+])
+def test_row_and_brand_filters(filters, expected):
+    rows, merged = _keyword_rows()
+    result = transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(rows, merged),
+                                              filters=transpose_engine.parse_filters(**filters))
+    assert _rows(result) == expected
+
+
+def test_metric_filter():
+    rows, merged = _keyword_rows()
+    filters = transpose_engine.parse_filters(metrics='Top1占比，可见概率')
+    result = transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(rows, merged), filters=filters)
+    # 指标列按布局中的顺序输出
+    assert list(result.columns) == ['关键词名称', 'AI平台名称', '品牌', '品牌类型', '可见概率', 'Top1占比']
+    assert len(result) == 6
+    # 不属于该布局的指标不影响输出
+    filters = transpose_engine.parse_filters(metrics='选用信源文章数')
+    assert transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(rows, merged), filters=filters).shape == (6, 12)
+
+
+def test_load_sheet_reads_selected_columns(tmp_path):
+    rows, merged = _keyword_rows()
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = KEYWORD_SHEET
+    for row in rows:
+        worksheet.append(row)
+    for min_row, min_col, max_row, max_col in merged:
+        worksheet.merge_cells(start_row=min_row, start_column=min_col, end_row=max_row, end_column=max_col)
+    path = str(tmp_path / 'report.xlsx')
+    workbook.save(path)
+
+    layout = transpose_engine.resolve_layout(KEYWORD_SHEET)
+    filters = transpose_engine.parse_filters(brands='品牌乙', metrics='可见概率')
+    with readers.open_workbook(path) as reader:
+        sheet = transpose_engine.load_sheet(reader, KEYWORD_SHEET, layout, filters)
+    # 表头完整保留，数据区只读取基础信息列和品牌乙的可见概率列（第11列）
+    assert sheet['rows'][0][10] == '品牌乙(竞品)' and sheet['rows'][1][2] == '可见概率'
+    assert [value for value in sheet['rows'][2] if value is not None] == ['关键词A', '豆包', 0.2]
+    result = transpose_engine.transpose_sheet(KEYWORD_SHEET, sheet, filters=filters)
+    assert _rows(result) == [('关键词A', '豆包', '品牌乙', '竞品', 0.2), ('关键词A', 'DeepSeek', '品牌乙', '竞品', 0.4),
+                             ('关键词B', '豆包', '品牌乙', '竞品', 0.6)]
+
+
+def test_empty_brand_blocks_dropped():
+    # None、空串和0都视为空；一个品牌块内任一指标非空即输出整块
+    header, merged = _keyword_header()
+    rows = header + [
+        ['关键词A', '豆包'] + [None] * 7 + ['-'] + [0] * 8,
+        ['关键词A', 'DeepSeek'] + [''] * 8 + [None, 0.4] + [0] * 6,
+        ['关键词B', '豆包'] + [0] * 8 + [None] * 8,
+    ]
+    result = transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(rows, merged))
+    assert [row[:4] + row[-2:] for row in transpose_engine.iter_result_rows(result)] == [
+        ('关键词A', '豆包', '品牌甲', '客户', None, '-'),
+        ('关键词A', 'DeepSeek', '品牌乙', '竞品', 0, 0),
+    ]
+    assert result['推荐概率'].isna().tolist() == [True, False]
+
+
+def test_missing_metric_columns():
+    # 品牌乙只有前两个指标列，其余指标输出为空
+    header, merged = _keyword_header()
+    header = [header[0][:13], header[1][:13]]
+    merged = [(1, 3, 1, 10), (1, 11, 1, 12)]
+    rows = header + [['关键词A', '豆包'] + [None] * 8 + [0.2, 0.3]]
+    result = transpose_engine.transpose_sheet(KEYWORD_SHEET, _sheet(rows, merged))
+    assert list(transpose_engine.iter_result_rows(result)) == [
+        ('关键词A', '豆包', '品牌乙', '竞品', 0.2, 0.3) + (None,) * 6]
+
+
+def test_spill_matches_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(transpose_engine.spill, 'SPILL_DIR', str(tmp_path))
+    rows, merged = _keyword_rows()
+    sheet = _sheet(rows, merged)
+    in_memory = transpose_engine.transpose_sheet(KEYWORD_SHEET, sheet, mode='memory')
+    with transpose_engine.transpose_sheet(KEYWORD_SHEET, sheet, mode='spill') as spilled:
+        assert list(transpose_engine.iter_result_rows(spilled)) == list(transpose_engine.iter_result_rows(in_memory))
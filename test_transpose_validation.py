@@ -5,12 +5,12 @@
 自动测试转置后的数据是否正确
 """
 
-import pandas as pd
-import openpyxl
 import os
 import sys
 from datetime import datetime
 
+import readers
+
 class TransposeValidator:
     """转置数据验证器"""
     
@@ -66,7 +66,7 @@ class TransposeValidator:
         
         try:
             # 读取转置后的数据
-            df_transposed = pd.read_excel(self.transposed_file, sheet_name='转置后数据')
+            df_transposed = readers.read_dataframe(self.transposed_file, sheet_name='转置后数据', header=0)
             
             # 检查必要的列是否存在
             required_columns = ['关键词名称', 'AI平台名称', '信源平台名称', '品牌']
@@ -163,14 +163,14 @@ class TransposeValidator:
         
         try:
             # 读取原始文件
-            wb_original = openpyxl.load_workbook(self.original_file, data_only=True)
+            with readers.open_workbook(self.original_file) as reader:
+                sheetnames = reader.sheetnames
+                original_max_row = reader.read_sheet("信源数据分析")[2] if "信源数据分析" in sheetnames else 0
             
             # 找到信源数据分析工作表
-            if "信源数据分析" in wb_original.sheetnames:
-                ws_original = wb_original["信源数据分析"]
-                
+            if "信源数据分析" in sheetnames:
                 # 计算原始数据行数（排除表头）
-                original_data_rows = ws_original.max_row - 2  # 减去表头2行
+                original_data_rows = original_max_row - 2  # 减去表头2行
                 transposed_rows = len(df_transposed)
                 
                 # 计算期望的转置行数
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据仓库测试
+检查同一报告重复导入不产生重复行（自然键相同的行更新为新值，键中的空值按空串去重），
+以及汇总表随明细表重算
+
+用法: python -m pytest test_warehouse.py
+"""
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import warehouse
+
+METRICS = ['可见概率', '推荐概率', '信源平台占比', '信源文章占比',
+           'Top1占比', 'Top前3占比', 'Top前5占比', 'Top前10占比']
+
+
+def _keyword_sheet(scale=1.0):
+    """关键词数据分析的转置结果，第三行AI平台为空，第四行指标为文本"""
+    rows = [
+        ['关键词A', '豆包', '品牌甲', '自有品牌'],
+        ['关键词A', '豆包', '品牌乙', '竞品'],
+        ['关键词A', None, '品牌甲', '自有品牌'],
+        ['关键词B', 'DeepSeek', '品牌甲', None],
+    ]
+    df = pd.DataFrame(rows, columns=['关键词名称', 'AI平台名称', '品牌', '品牌类型'])
+    for i, metric in enumerate(METRICS):
+        df[metric] = [0.1 * (i + 1) * scale, 0.2 * scale, np.nan, '-']
+    return df
+
+
+def _source_sheet():
+    """信源数据分析的转置结果，第二行信源平台名称为空"""
+    return pd.DataFrame(
+        [['关键词A', '豆包', '知乎', 12, '品牌甲', '自有品牌', 0.5, 6],
+         ['关键词A', '豆包', None, 12, '品牌甲', '自有品牌', 0.25, 3]],
+        columns=['关键词名称', 'AI平台', '信源平台名称', '选用信源文章总数', '品牌', '品牌类型',
+                 '选用信源文章占比', '选用信源文章数'])
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'warehouse.db')
+
+
+def _count(db_path, table, where='', params=()):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM "{table}" {where}', params).fetchone()[0]
+
+
+def test_reimport_is_idempotent(db_path):
+    results = {'关键词数据分析': _keyword_sheet(), '信源数据分析': _source_sheet(), '说明': None}
+    counts = warehouse.store_results(results, '2025-09-18', 'a.xlsx', db_path=db_path)
+    assert counts == {'关键词数据分析': 4, '信源数据分析': 2}
+
+    warehouse.store_results(results, '2025-09-18', 'a.xlsx', db_path=db_path)
+    assert _count(db_path, '关键词数据分析') == 4
+    assert _count(db_path, '信源数据分析') == 2
+    # 自然键中的空值保存为空串，非键列的空值保持NULL
+    assert _count(db_path, '关键词数据分析', 'WHERE "AI平台" = \'\'') == 1
+    assert _count(db_path, '信源数据分析', 'WHERE "信源平台名称" = \'\'') == 1
+    assert _count(db_path, '关键词数据分析', 'WHERE "可见概率" IS NULL') == 1
+
+
+def test_reimport_updates_values(db_path):
+    warehouse.store_results({'关键词数据分析': _keyword_sheet()}, '2025-09-18', 'a.xlsx', db_path=db_path)
+    warehouse.store_results({'关键词数据分析': _keyword_sheet(scale=2.0)}, '2025-09-18', 'b.xlsx',
+                            db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        value, source = conn.execute(
+            'SELECT "可见概率", "来源文件" FROM "关键词数据分析" '
+            'WHERE "关键词名称" = ? AND "AI平台" = ? AND "品牌" = ?', ('关键词A', '豆包', '品牌甲')).fetchone()
+    assert value == pytest.approx(0.2) and source == 'b.xlsx'
+
+
+def test_new_date_appends(db_path):
+    warehouse.store_results({'关键词数据分析': _keyword_sheet()}, '2025-09-18', db_path=db_path)
+    warehouse.store_results({'关键词数据分析': _keyword_sheet()}, '2025-09-19', db_path=db_path)
+    assert _count(db_path, '关键词数据分析') == 8
+
+
+def test_report_date_from_name():
+    assert warehouse.report_date_from_name('报表_20250918.xlsx') == '2025-09-18'
+    assert warehouse.report_date_from_name('无日期.xlsx', default='2025-01-02') == '2025-01-02'
+    assert warehouse.normalize_date(' 2025-09-18 ') == '2025-09-18'
+
+
+def _query(db_path, name, params):
+    result = warehouse.query(name, params, db_path=db_path)
+    return [dict(zip(result['columns'], row)) for row in result['rows']]
+
+
+def test_aggregates_follow_reimport(db_path):
+    results = {'关键词数据分析': _keyword_sheet(), '信源数据分析': _source_sheet()}
+    warehouse.store_results(results, '2025-09-18', 'a.xlsx', db_path=db_path)
+    aggregate_rows = _count(db_path, '汇总_品牌平台')
+    assert aggregate_rows > 0
+    warehouse.store_results(results, '2025-09-18', 'a.xlsx', db_path=db_path)
+    assert _count(db_path, '汇总_品牌平台') == aggregate_rows
+
+    # 汇总表按新值重算：豆包平台上品牌甲的可见概率只有一行
+    warehouse.store_results({'关键词数据分析': _keyword_sheet(scale=2.0)}, '2025-09-18', 'b.xlsx',
+                            db_path=db_path)
+    rows = _query(db_path, 'platform_average', {'brands': '品牌甲', 'platforms': '豆包'})
+    assert len(rows) == 1 and rows[0]['行数'] == 1
+    assert rows[0]['平均值'] == pytest.approx(0.2)
+
+
+def test_trend_by_date(db_path):
+    warehouse.store_results({'关键词数据分析': _keyword_sheet()}, '2025-09-18', db_path=db_path)
+    warehouse.store_results({'关键词数据分析': _keyword_sheet()}, '2025-09-19', db_path=db_path)
+    rows = _query(db_path, 'trend', {'brands': '品牌乙'})
+    assert [row['日期'] for row in rows] == ['2025-09-18', '2025-09-19']
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视目录测试
+检查待处理文件的筛选和输出命名、表头行数识别和跳过原因、按预检估计验证输出行数，
+以及扫描时等文件停止变化后才派发、已处理和跳过的文件不重复派发、文件被修改后重新处理
+
+用法: python -m pytest test_watch_folder.py
+"""
+
+import json
+import os
+from datetime import datetime
+
+import openpyxl
+import pytest
+
+import watch_folder
+
+METRICS = ['可见概率', '推荐概率', '信源平台占比', '信源文章占比',
+           'Top1占比', 'Top前3占比', 'Top前5占比', 'Top前10占比']
+
+
+def _report(path, three_rows=False):
+    """关键词数据分析：两个品牌，两行或三行表头，3行数据"""
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = '关键词数据分析'
+    worksheet.append([None, None, '品牌甲(客户)'] + [None] * 7 + ['品牌乙(竞品)'])
+    worksheet.merge_cells('C1:J1')
+    worksheet.merge_cells('K1:R1')
+    if three_rows:
+        worksheet.append([None, None, '豆包'] + [None] * 7 + ['豆包'])
+    worksheet.append(['关键词名称', 'AI平台名称'] + METRICS * 2)
+    worksheet.append(['关键词A', '豆包'] + [0.1] * 8 + [0.2] * 8)
+    worksheet.append(['关键词A', 'DeepSeek'] + [0.3] + [None] * 15)
+    worksheet.append(['关键词B', '豆包'] + [None] * 16)
+    workbook.save(str(path))
+    return str(path)
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('报表.xlsx', True),
+    ('报表.XLS', True),
+    ('~$报表.xlsx', False),
+    ('.报表.xlsx', False),
+    ('报表_20250918_完整转置完成.xlsx', False),
+    ('报表.csv', False),
+])
+def test_is_candidate(name, expected):
+    assert watch_folder.is_candidate(name) == expected
+
+
+def test_output_path_for():
+    today = datetime.now().strftime('%Y%m%d')
+    assert watch_folder.output_path_for('/data/报表.xlsx') == f'/data/报表_{today}_完整转置完成.xlsx'
+    # 同名的.xls输出加后缀，不覆盖.xlsx的输出
+    assert watch_folder.output_path_for('/data/报表.XLS') == f'/data/报表_xls_{today}_完整转置完成.xlsx'
+    assert watch_folder.validation_path_for(f'/data/报表_{today}_完整转置完成.xlsx') == \
+        f'/data/报表_{today}_完整转置完成.validation.json'
+
+
+def test_detect_header_rows(tmp_path):
+    assert watch_folder.detect_workbook_header_rows(_report(tmp_path / 'a.xlsx')) == (2, None)
+    assert watch_folder.detect_workbook_header_rows(_report(tmp_path / 'b.xlsx', three_rows=True)) == (3, None)
+
+
+def test_detect_skip_reasons(tmp_path):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = '说明'
+    workbook.active.append(['报表说明'])
+    path = str(tmp_path / '说明.xlsx')
+    workbook.save(path)
+    assert watch_folder.detect_workbook_header_rows(path) == (None, '不含可转置的工作表')
+
+    # 第1行含 品牌、品牌类型 列的是转置结果
+    workbook = openpyxl.Workbook()
+    workbook.active.title = '关键词数据分析'
+    workbook.active.append(['关键词名称', 'AI平台', '品牌', '品牌类型'] + METRICS)
+    path = str(tmp_path / '长表.xlsx')
+    workbook.save(path)
+    assert watch_folder.detect_workbook_header_rows(path) == (None, '已经是转置后的长表')
+
+    workbook = openpyxl.Workbook()
+    workbook.active.title = '关键词数据分析'
+    workbook.active.append(['关键词A', '豆包', 0.1])
+    path = str(tmp_path / '无表头.xlsx')
+    workbook.save(path)
+    rows, reason = watch_folder.detect_workbook_header_rows(path)
+    assert rows is None and reason.startswith('关键词数据分析 在前')
+
+
+def test_validate():
+    estimate = {'sheets': [
+        {'sheet': '关键词数据分析', 'layout': '关键词数据分析', 'rows': 5, 'brands': 2, 'output_rows_max': 6},
+        {'sheet': '信源数据分析', 'layout': '信源数据分析', 'rows': 4, 'brands': 1, 'output_rows_max': 2},
+        {'sheet': '品牌数据分析', 'layout': '品牌数据分析', 'rows': 2, 'brands': 1, 'output_rows_max': 0},
+        {'sheet': '说明', 'layout': None, 'rows': 2, 'brands': 0, 'output_rows_max': 0},
+    ]}
+    shapes = {'关键词数据分析': (4, 12), '信源数据分析': (3, 8), '品牌数据分析': (0, 8)}
+    sheets = {sheet['sheet']: sheet for sheet in watch_folder.validate(estimate, shapes)}
+    # 不是布局工作表的不检查
+    assert list(sheets) == ['关键词数据分析', '信源数据分析', '品牌数据分析']
+    assert sheets['关键词数据分析']['passed']
+    assert sheets['信源数据分析']['checks']['不超过最大行数'] is False
+    # 估计最多0行时没有输出也算通过
+    assert sheets['品牌数据分析']['passed']
+
+    sheets = watch_folder.validate(estimate, {})
+    assert not any(sheet['checks']['已转置'] for sheet in sheets)
+
+
+@pytest.fixture
+def watcher(tmp_path, monkeypatch):
+    """不启动转置，只记录派发的文件；派发后立即记为已处理"""
+    watcher = watch_folder.FolderWatcher(str(tmp_path), workers=1, settle_seconds=5)
+    dispatched = []
+
+    def process(name, signature):
+        dispatched.append(name)
+        watcher._finish(name, signature)
+
+    monkeypatch.setattr(watcher, '_process', process)
+    watcher.dispatched = dispatched
+    yield watcher
+    watcher.executor.shutdown(wait=True)
+
+
+def test_scan_waits_until_settled(watcher, tmp_path):
+    path = _report(tmp_path / '报表.xlsx')
+    (tmp_path / '~$报表.xlsx').write_bytes(b'x')
+    mtime = os.stat(path).st_mtime
+
+    # 修改后不到等待时间，两次扫描都不派发
+    assert watcher.scan(now=mtime + 1) == pytest.approx(4)
+    assert watcher.scan(now=mtime + 2) == pytest.approx(3)
+    # 第一次看到已经停止变化的文件也要等下一次扫描确认
+    watcher.observed.clear()
+    assert watcher.scan(now=mtime + 10) == watch_folder.POLL_INTERVAL_SECONDS / 2
+    assert watcher.scan(now=mtime + 11) is None
+    watcher.wait()
+    assert watcher.dispatched == ['报表.xlsx']
+
+    # 已处理且没有变化的文件不再派发
+    watcher.scan(now=mtime + 20)
+    watcher.scan(now=mtime + 21)
+    watcher.wait()
+    assert watcher.dispatched == ['报表.xlsx']
+
+
+def test_scan_after_change(watcher, tmp_path):
+    path = _report(tmp_path / '报表.xlsx')
+    mtime = os.stat(path).st_mtime
+    watcher.scan(now=mtime + 10)
+    # 两次扫描之间文件还在写入，重新等待
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    os.utime(path, (mtime, mtime))
+    watcher.scan(now=mtime + 11)
+    assert watcher.dispatched == []
+    watcher.scan(now=mtime + 12)
+    watcher.wait()
+    assert watcher.dispatched == ['报表.xlsx']
+
+    # 处理后再次修改，重新处理
+    os.utime(path, (mtime + 30, mtime + 30))
+    watcher.scan(now=mtime + 40)
+    watcher.scan(now=mtime + 41)
+    watcher.wait()
+    assert watcher.dispatched == ['报表.xlsx', '报表.xlsx']
+
+
+def test_state_persists(watcher, tmp_path):
+    path = _report(tmp_path / '报表.xlsx')
+    mtime = os.stat(path).st_mtime
+    watcher.scan(now=mtime + 10)
+    watcher.scan(now=mtime + 11)
+    watcher.wait()
+    with open(tmp_path / watch_folder.STATE_FILE, encoding='utf-8') as f:
+        assert list(json.load(f)) == ['报表.xlsx']
+
+    # 重启后读取状态，不重复处理
+    restarted = watch_folder.FolderWatcher(str(tmp_path), workers=1, settle_seconds=5)
+    restarted.scan(now=mtime + 10)
+    assert restarted.scan(now=mtime + 11) is None and not restarted.futures
+    restarted.executor.shutdown(wait=True)
+
+
+def test_skipped_file(tmp_path):
+    workbook = openpyxl.Workbook()
+    workbook.active.title = '说明'
+    path = str(tmp_path / '说明.xlsx')
+    workbook.save(path)
+    mtime = os.stat(path).st_mtime
+
+    watcher = watch_folder.FolderWatcher(str(tmp_path), workers=1, settle_seconds=5)
+    watcher.scan(now=mtime + 10)
+    watcher.scan(now=mtime + 11)
+    watcher.wait()
+    watcher.executor.shutdown(wait=True)
+    # 跳过的文件只记在内存中，不写入状态文件，也不产生输出
+    assert '说明.xlsx' in watcher.skipped and not watcher.running
+    assert sorted(os.listdir(tmp_path)) == ['说明.xlsx']
+
+
+def test_run_once(tmp_path):
+    _report(tmp_path / '报表.xlsx', three_rows=True)
+    # 文件刚写完，等待时间为0时两次扫描即可确认
+    watcher = watch_folder.FolderWatcher(str(tmp_path), workers=1, settle_seconds=0)
+    watcher.run(once=True)
+
+    output_path = watch_folder.output_path_for(str(tmp_path / '报表.xlsx'))
+    assert os.path.exists(output_path)
+    with open(watch_folder.validation_path_for(output_path), encoding='utf-8') as f:
+        report = json.load(f)
+    assert report['status'] == 'passed' and report['header_rows'] == 3
+    # 验证摘要中的行数与输出文件一致
+    worksheet = openpyxl.load_workbook(output_path, read_only=True)['关键词数据分析']
+    assert report['sheets'][0]['output_rows'] == worksheet.max_row - 1 > 0
+    assert '报表.xlsx' in watcher.processed
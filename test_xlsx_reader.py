@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+XLSX读取器测试
+检查 XlsxReader 读出的值与 openpyxl.load_workbook(data_only=True) 一致：共享字符串（含富文本）、
+内联字符串、整数/浮点数、日期格式、布尔值、公式缓存值、缺少坐标的单元格和空行；
+合并单元格和 <dimension ref> 的字节扫描（带命名空间前缀、跨读取块边界、未声明）
+
+用法: python -m pytest test_xlsx_reader.py
+"""
+
+import datetime
+import zipfile
+
+import openpyxl
+import pytest
+
+import xlsx_reader
+
+CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/sharedStrings.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+
+ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+WORKBOOK = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+ xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="信源数据分析" sheetId="1" r:id="rId1"/></sheets>
+</workbook>'''
+
+WORKBOOK_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" Target="sharedStrings.xml"/>
+<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>'''
+
+# 第2个样式（s="1"）为内置日期格式14
+STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<fonts count="1"><font/></fonts><fills count="1"><fill><patternFill patternType="none"/></fill></fills><borders count="1"><border/></borders>
+<cellStyleXfs count="1"><xf/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0"/><xf numFmtId="14" applyNumberFormat="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+# 第2个共享字符串是富文本，第3个带拼音注释
+SHARED_STRINGS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="4" uniqueCount="4">
+<si><t>品牌甲(客户)</t></si>
+<si><r><t>关键词</t></r><r><rPr><b/></rPr><t>名称</t></r></si>
+<si><t>豆包</t><rPh sb="0" eb="2"><t>dou bao</t></rPh></si>
+<si><t xml:space="preserve"> 知乎 </t></si>
+</sst>'''
+
+# 工作表使用 x: 命名空间前缀；第3行缺失，第4行的单元格没有坐标
+SHEET = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<x:worksheet xmlns:x="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<x:dimension ref="A1:F4"/>
+<x:sheetData>
+<x:row r="1"><x:c r="C1" t="s"><x:v>0</x:v></x:c></x:row>
+<x:row r="2"><x:c r="A2" t="s"><x:v>1</x:v></x:c><x:c r="B2" t="inlineStr"><x:is><x:t>AI平台</x:t></x:is></x:c>
+<x:c r="C2"><x:v>3</x:v></x:c><x:c r="D2"><x:v>0.25</x:v></x:c><x:c r="E2" s="1"><x:v>45918</x:v></x:c>
+<x:c r="F2" t="b"><x:v>1</x:v></x:c></x:row>
+<x:row r="4"><x:c t="s"><x:v>2</x:v></x:c><x:c t="s"><x:v>3</x:v></x:c><x:c><x:f>C2*2</x:f><x:v>6</x:v></x:c>
+<x:c><x:v>1E-3</x:v></x:c><x:c t="str"><x:f>"a"</x:f><x:v>a</x:v></x:c></x:row>
+</x:sheetData>
+<x:mergeCells count="2"><x:mergeCell ref="C1:D1"/><x:mergeCell ref="$A$4:A5"/></x:mergeCells>
+</x:worksheet>'''
+
+
+def _write_package(path, sheet=SHEET):
+    with zipfile.ZipFile(path, 'w') as package:
+        package.writestr('[Content_Types].xml', CONTENT_TYPES)
+        package.writestr('_rels/.rels', ROOT_RELS)
+        package.writestr('xl/workbook.xml', WORKBOOK)
+        package.writestr('xl/_rels/workbook.xml.rels', WORKBOOK_RELS)
+        package.writestr('xl/styles.xml', STYLES)
+        package.writestr('xl/sharedStrings.xml', SHARED_STRINGS)
+        package.writestr('xl/worksheets/sheet1.xml', sheet)
+    return path
+
+
+@pytest.fixture
+def package(tmp_path):
+    return _write_package(str(tmp_path / 'report.xlsx'))
+
+
+def _openpyxl_rows(path, sheet_name):
+    worksheet = openpyxl.load_workbook(path, data_only=True)[sheet_name]
+    return [tuple(cell.value for cell in row) for row in worksheet.iter_rows()]
+
+
+def _padded(rows, width):
+    return [tuple(row) + (None,) * (width - len(row)) for row in rows]
+
+
+def test_values(package):
+    with xlsx_reader.XlsxReader(package) as reader:
+        rows = list(reader.iter_rows('信源数据分析'))
+    assert rows == [
+        (None, None, '品牌甲(客户)'),
+        ('关键词名称', 'AI平台', 3, 0.25, datetime.datetime(2025, 9, 18), True),
+        (),
+        ('豆包', ' 知乎 ', 6, 0.001, 'a'),
+    ]
+    assert type(rows[1][2]) is int
+
+
+def test_parity_with_openpyxl(package):
+    expected = _openpyxl_rows(package, '信源数据分析')
+    with xlsx_reader.XlsxReader(package) as reader:
+        rows, merged, max_row, max_column = reader.read_sheet('信源数据分析')
+    width = len(expected[0])
+    # 合并区域 A4:A5 覆盖到第5行，openpyxl的使用区域同样包含该行
+    assert (max_row, max_column) == (len(expected), width)
+    assert _padded(rows, width) + [(None,) * width] == expected
+
+    worksheet = openpyxl.load_workbook(package)['信源数据分析']
+    bounds = sorted((r.min_row, r.min_col, r.max_row, r.max_col) for r in worksheet.merged_cells.ranges)
+    assert sorted(merged) == bounds == [(1, 3, 1, 4), (4, 1, 5, 1)]
+
+
+def test_openpyxl_written_workbook(tmp_path):
+    path = str(tmp_path / 'written.xlsx')
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    worksheet.title = '关键词数据分析'
+    worksheet.append([None, None, '品牌甲(客户)'])
+    worksheet.append(['关键词名称', 'AI平台名称', '可见概率'])
+    worksheet.append(['关键词A', '豆包', 0.5])
+    worksheet.append([])
+    worksheet.append(['关键词B', None, datetime.date(2025, 9, 18), 2 ** 40, -1.5e-7])
+    worksheet.merge_cells('C1:J1')
+    workbook.save(path)
+
+    expected = _openpyxl_rows(path, '关键词数据分析')
+    with xlsx_reader.XlsxReader(path) as reader:
+        rows, merged, max_row, max_column = reader.read_sheet('关键词数据分析')
+        assert reader.dimension('关键词数据分析') == (1, 1, 5, 10)
+    assert _padded(rows, max_column) == expected
+    assert merged == [(1, 3, 1, 10)]
+
+
+def test_max_row_and_columns(package):
+    with xlsx_reader.XlsxReader(package) as reader:
+        assert list(reader.iter_rows('信源数据分析', max_row=2, columns={1, 3})) == [
+            (None, None, '品牌甲(客户)'),
+            ('关键词名称', None, 3),
+        ]
+        with pytest.raises(KeyError):
+            reader.merged_ranges('不存在')
+
+
+def test_dimension(package, tmp_path):
+    with xlsx_reader.XlsxReader(package) as reader:
+        assert reader.dimension('信源数据分析') == (1, 1, 4, 6)
+    # 未声明使用区域
+    path = _write_package(str(tmp_path / 'nodim.xlsx'), SHEET.replace('<x:dimension ref="A1:F4"/>', ''))
+    with xlsx_reader.XlsxReader(path) as reader:
+        assert reader.dimension('信源数据分析') is None
+    # 只有一个单元格时为单个坐标
+    path = _write_package(str(tmp_path / 'single.xlsx'), SHEET.replace('ref="A1:F4"', 'ref="B7"'))
+    with xlsx_reader.XlsxReader(path) as reader:
+        assert reader.dimension('信源数据分析') == (7, 2, 7, 2)
+
+
+def test_merge_scan_across_chunks(tmp_path, monkeypatch):
+    # 大量合并区域配合很小的读取块，标签必然被块边界截断
+    refs = [f'A{row}:B{row}' for row in range(1, 400)]
+    merges = ''.join(f'<mergeCell ref="{ref}"/>' for ref in refs)
+    sheet = ('<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+             '<sheetData/>'
+             f'<mergeCells count="{len(refs)}">{merges}</mergeCells></worksheet>')
+    path = _write_package(str(tmp_path / 'merges.xlsx'), sheet)
+    monkeypatch.setattr(xlsx_reader, '_SCAN_CHUNK_SIZE', 7)
+    with xlsx_reader.XlsxReader(path) as reader:
+        assert reader.merged_ranges('信源数据分析') == [(row, 1, row, 2) for row in range(1, 400)]
+
+
+@pytest.mark.parametrize('ref, expected', [
+    ('A1', (1, 1, 1, 1)),
+    ('BN12:BO13', (12, 66, 13, 67)),
+    ('$C$3:$D$9', (3, 3, 9, 4)),
+])
+def test_parse_range(ref, expected):
+    assert xlsx_reader.parse_range(ref) == expected
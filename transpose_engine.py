@@ -0,0 +1,657 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置引擎
+Web应用和命令行共用的转置实现：通过 readers.open_workbook 自动选择读取后端，
+取出各工作表的值元组和合并单元格，按工作表布局把品牌从列标题转换为行数据
+"""
+
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import brand_summary
+import readers
+import result_cache
+import spill
+
+# 支持转置的工作表布局
+# id_columns: 数据区左侧的基础信息列，依次对应第1、2...列
+# metric_columns: 每个品牌合并单元格下的指标列，依次对应品牌起始列开始的各列
+# data_start_row: 数据起始行，之前的行都是表头（第1行为品牌，最后一行为指标）
+# level_columns: 可选，三行及以上表头时品牌和指标之间各层（如AI平台）在输出中的列名
+LAYOUTS = {
+    '信源数据分析': {
+        'id_columns': ['关键词名称', 'AI平台', '信源平台名称', '选用信源文章总数'],
+        'metric_columns': ['选用信源文章占比', '选用信源文章数'],
+        'data_start_row': 3,
+    },
+    '关键词数据分析': {
+        'id_columns': ['关键词名称', 'AI平台名称'],
+        'metric_columns': ['可见概率', '推荐概率', '信源平台占比', '信源文章占比',
+                           'Top1占比', 'Top前3占比', 'Top前5占比', 'Top前10占比'],
+        'data_start_row': 3,
+    },
+}
+
+# 筛选条件：品牌、关键词、AI平台、指标，各为允许值的集合
+FILTER_FIELDS = ('brands', 'keywords', 'platforms', 'metrics')
+# 各布局中表示AI平台的基础信息列
+PLATFORM_COLUMNS = ('AI平台', 'AI平台名称')
+
+
+def parse_filters(brands=None, keywords=None, platforms=None, metrics=None):
+    """
+    整理筛选条件，每项可以是逗号分隔的字符串或字符串列表，空值表示不筛选
+
+    返回:
+    dict: {字段: 允许值集合}，没有任何筛选条件时返回None
+    """
+    filters = {}
+    for field, value in zip(FILTER_FIELDS, (brands, keywords, platforms, metrics)):
+        if not value:
+            continue
+        if isinstance(value, str):
+            value = value.replace('，', ',').split(',')
+        items = {str(item).strip() for item in value if str(item).strip()}
+        if items:
+            filters[field] = items
+    return filters or None
+
+
+def brand_selected(brand_name, filters):
+    """品牌是否满足筛选条件，完整名称或去掉括号后的名称都可以匹配"""
+    if not filters or 'brands' not in filters:
+        return True
+    return brand_name in filters['brands'] or brand_name.split('(')[0] in filters['brands']
+
+
+def _read_rows(reader, sheet_name, columns=None, max_row=None):
+    """读取工作表的值，max_row 指定时只读取前 max_row 行，返回值同 read_sheet"""
+    if max_row is None:
+        return reader.read_sheet(sheet_name, columns=columns)
+    rows = list(reader.iter_rows(sheet_name, max_row=max_row, columns=columns))
+    merged_ranges = [merged for merged in reader.merged_ranges(sheet_name) if merged[0] <= max_row]
+    max_column = max([len(row) for row in rows] + [merged[3] for merged in merged_ranges], default=0)
+    return rows, merged_ranges, len(rows), max_column
+
+
+def load_sheet(reader, sheet_name, layout=None, filters=None, max_row=None):
+    """
+    读取一个工作表
+
+    指定布局和品牌/指标筛选条件时，先读表头确定需要的列，
+    数据区只读取基础信息列和选中的品牌指标列，其余列的单元格不解析；
+    max_row 指定时只读取前 max_row 行（用于预览）
+
+    返回:
+    dict: rows(值元组列表)、merged_ranges、max_row、max_column
+    """
+    if layout is None or not filters or not ({'brands', 'metrics'} & set(filters)):
+        rows, merged_ranges, max_row, max_column = _read_rows(reader, sheet_name, max_row=max_row)
+        return {
+            'rows': rows,
+            'merged_ranges': merged_ranges,
+            'max_row': max_row,
+            'max_column': max_column,
+        }
+
+    header_rows = layout['data_start_row'] - 1
+    header = list(reader.iter_rows(sheet_name, max_row=header_rows))
+    merged_ranges = reader.merged_ranges(sheet_name)
+    header_sheet = {
+        'rows': header,
+        'merged_ranges': merged_ranges,
+        'max_row': header_rows,
+        'max_column': max([len(row) for row in header] + [m[3] for m in merged_ranges], default=0),
+    }
+    columns, _ = build_column_index(header_sheet, layout, filters)
+    selected = set(range(1, len(layout['id_columns']) + 1)) | set(columns)
+    print(f"{sheet_name}: 按筛选条件读取 {len(selected)}/{header_sheet['max_column']} 列")
+
+    rows, merged_ranges, max_row, max_column = _read_rows(
+        reader, sheet_name, columns=selected, max_row=max_row)
+    # 表头保留完整内容，供识别品牌和指标
+    rows = header + rows[header_rows:]
+    return {
+        'rows': rows,
+        'merged_ranges': merged_ranges,
+        'max_row': max(max_row, len(rows)),
+        'max_column': max(max_column, header_sheet['max_column']),
+    }
+
+
+def cell_value(rows, row_idx, col_idx):
+    """按1开始的行列号取值，超出范围返回None"""
+    if row_idx > len(rows):
+        return None
+    row = rows[row_idx - 1]
+    return row[col_idx - 1] if col_idx <= len(row) else None
+
+
+def find_brand_columns(sheet, layout):
+    """识别第1行表头合并单元格中的品牌，返回 {品牌: {'start_col': .., 'end_col': ..}}"""
+    brand_columns = {}
+    id_count = len(layout['id_columns'])
+    # 按位置排序，品牌顺序与表格从左到右一致，不受文件中合并区域记录顺序影响
+    for min_row, min_col, max_row, max_col in sorted(sheet['merged_ranges']):
+        # 下层表头（如品牌下的AI平台分组）、数据区的合并单元格和基础信息列的表头都不是品牌
+        if min_row != 1 or min_col <= id_count:
+            continue
+        brand_name = cell_value(sheet['rows'], min_row, min_col)
+        if brand_name and isinstance(brand_name, str) and brand_name.strip():
+            brand_columns[brand_name] = {
+                'start_col': min_col,
+                'end_col': max_col
+            }
+    return brand_columns
+
+
+def header_value(sheet, header_merges, row_idx, col_idx):
+    """表头单元格的值，位于合并区域内时取区域左上角的值"""
+    for min_row, min_col, max_row, max_col in header_merges:
+        if min_row <= row_idx <= max_row and min_col <= col_idx <= max_col:
+            return cell_value(sheet['rows'], min_row, min_col)
+    return cell_value(sheet['rows'], row_idx, col_idx)
+
+
+def build_column_index(sheet, layout, filters=None):
+    """
+    把品牌区域的多行表头转换为列的MultiIndex
+
+    第1行是品牌，中间各行是分组（如AI平台），最后一行是指标。
+    指标名称按在最内层分组中的位置对应 metric_columns，与两行表头的规则一致；
+    布局没有配置 metric_columns 时使用表头文字。
+    filters 中的品牌和指标条件在这里生效，未选中的列不出现在结果中。
+
+    返回:
+    (列号列表, pandas.MultiIndex)，只包含属于某个品牌且能对应到指标的列
+    """
+    header_rows = layout['data_start_row'] - 1
+    metric_columns = layout.get('metric_columns')
+    max_column = sheet['max_column']
+    header_merges = [m for m in sheet['merged_ranges'] if m[0] <= header_rows]
+
+    columns = []
+    keys = []
+    metric_filter = (filters or {}).get('metrics')
+    # 指标条件只作用于包含这些指标的布局，例如只选 可见概率 时信源数据分析仍完整输出
+    if metric_filter and metric_columns and not metric_filter & set(metric_columns):
+        metric_filter = None
+    for brand_name, col_info in find_brand_columns(sheet, layout).items():
+        if not brand_selected(brand_name, filters):
+            continue
+        group = None
+        offset = 0
+        for col in range(col_info['start_col'], min(col_info['end_col'], max_column) + 1):
+            levels = tuple(header_value(sheet, header_merges, row, col) for row in range(2, header_rows))
+            # 中间层取值变化时开始新的分组，指标位置从头计算
+            if levels != group:
+                group = levels
+                offset = 0
+            if metric_columns:
+                if offset >= len(metric_columns):
+                    offset += 1
+                    continue
+                metric = metric_columns[offset]
+            else:
+                metric = cell_value(sheet['rows'], header_rows, col)
+            offset += 1
+            if metric_filter and metric not in metric_filter:
+                continue
+            columns.append(col)
+            keys.append((brand_name,) + levels + (metric,))
+
+    names = ['品牌'] + level_names(layout) + ['指标']
+    if not keys:
+        return columns, pd.MultiIndex.from_tuples([], names=names)
+    return columns, pd.MultiIndex.from_tuples(keys, names=names)
+
+
+def level_names(layout):
+    """品牌和指标之间各层表头在输出中的列名"""
+    count = max(layout['data_start_row'] - 3, 0)
+    names = list(layout.get('level_columns', []))[:count]
+    names.extend(f'分组{i}' for i in range(len(names) + 1, count + 1))
+    return names
+
+
+class MergedIntervalIndex:
+    """
+    数据区合并单元格的区间索引
+    按列保存覆盖该列的合并区域 [起始行, 结束行] 和取值所在的列（区域左上角），
+    起始行有序，用二分查找一次性定位整列每一行所属的区域
+    """
+
+    def __init__(self, merged_ranges, first_row, columns):
+        """
+        参数:
+        merged_ranges: 合并区域 (min_row, min_col, max_row, max_col) 列表
+        first_row: 数据起始行，之前的表头区域不参与填充
+        columns: 需要建立索引的列数（从第1列开始）
+        """
+        self.first_row = first_row
+        intervals = {}
+        for min_row, min_col, max_row, max_col in merged_ranges:
+            if min_row < first_row or min_col > columns:
+                continue
+            if min_row == max_row and min_col == max_col:
+                continue
+            for col in range(min_col, min(max_col, columns) + 1):
+                intervals.setdefault(col, []).append((min_row, max_row, min_col))
+
+        self._columns = {}
+        for col, items in intervals.items():
+            items.sort()
+            starts, ends, sources = (np.array(values, dtype=np.int64) for values in zip(*items))
+            self._columns[col] = (starts, ends, sources)
+
+    def __bool__(self):
+        return bool(self._columns)
+
+    def fill(self, values):
+        """
+        把合并区域左上角的值填充到区域内其他单元格，原地修改
+
+        参数:
+        values: object类型的二维数组，第i行对应表格第 first_row+i 行，第j列对应表格第j+1列
+
+        返回:
+        int: 被填充的单元格数
+        """
+        filled = 0
+        row_numbers = np.arange(self.first_row, self.first_row + len(values))
+        for col, (starts, ends, sources) in self._columns.items():
+            # 每一行最后一个起始行不大于它的区域，行号不超过该区域结束行即被覆盖
+            pos = np.searchsorted(starts, row_numbers, side='right') - 1
+            valid = pos >= 0
+            pos = np.where(valid, pos, 0)
+            # 区域首行只有左上角单元格本身有值，横向合并时同一行的其他列也需要填充
+            covered = valid & (row_numbers <= ends[pos]) & (
+                (row_numbers != starts[pos]) | (sources[pos] != col))
+            targets = np.nonzero(covered)[0]
+            if not len(targets):
+                continue
+            source_rows = starts[pos[targets]] - self.first_row
+            values[targets, col - 1] = values[source_rows, sources[pos[targets]] - 1]
+            filled += len(targets)
+        return filled
+
+
+def resolve_layout(layout_name, header_rows=None):
+    """取得布局配置，header_rows 指定表头行数时覆盖布局中的数据起始行"""
+    layout = LAYOUTS[layout_name]
+    if header_rows is None:
+        return layout
+    if header_rows < 2:
+        raise ValueError(f"表头至少需要2行（品牌、指标），实际为 {header_rows}")
+    return dict(layout, data_start_row=header_rows + 1)
+
+
+def transpose_sheet(layout_name, sheet, header_rows=None, filters=None, mode='auto', rollups=None):
+    """
+    按布局转置一个工作表
+
+    参数:
+    layout_name: LAYOUTS中的布局名称（即工作表名称）
+    sheet: load_sheet 的返回值
+    header_rows: 可选，表头行数，缺省使用布局配置
+    filters: 可选，parse_filters 的返回值
+    mode: 'spill' 结果写入落盘缓冲；'auto' 结果超过内存预算时落盘；其他取值始终在内存中
+    rollups: 可选字典，传入时在生成结果的同时累加品牌汇总，写入 rollups[layout_name]
+
+    返回:
+    DataFrame 或 spill.SpillTable: 长格式数据，每个有数据的(行, 品牌)一行
+    """
+    print(f"处理{layout_name}工作表...")
+    layout = resolve_layout(layout_name, header_rows)
+    id_columns = layout['id_columns']
+    metric_columns = layout['metric_columns']
+    rows = sheet['rows']
+    max_column = sheet['max_column']
+    first_row = layout['data_start_row']
+
+    columns, column_index = build_column_index(sheet, layout, filters)
+    extra_columns = level_names(layout)
+
+    # 数据区整体转为object二维数组，之后的填充、过滤和取值都按数组索引完成
+    id_count = len(id_columns)
+    width = max(max_column, id_count)
+    data = []
+    for row_idx in range(first_row, sheet['max_row'] + 1):
+        row = rows[row_idx - 1] if row_idx <= len(rows) else ()
+        if len(row) < width:
+            row = row + (None,) * (width - len(row))
+        data.append(row)
+    grid = np.empty((len(data), width), dtype=object)
+    if data:
+        grid[:] = data
+
+    # 纵向合并的关键词等基础信息只在区域首行有值，整列一次性向下填充
+    id_values = grid[:, :id_count].copy()
+    merged_index = MergedIntervalIndex(sheet['merged_ranges'], first_row, id_count)
+    if merged_index:
+        filled = merged_index.fill(id_values)
+        print(f"{layout_name}: 数据区合并单元格填充 {filled} 个基础信息单元格")
+
+    # 关键词为空的行不参与转置
+    keywords = id_values[:, 0] if id_count else np.full(len(data), None, dtype=object)
+    keep = np.array([value is not None and value != '' for value in keywords], dtype=bool)
+    # 关键词和AI平台条件在转置前按行过滤
+    if filters:
+        predicates = [('keywords', 0)]
+        predicates.extend(('platforms', i) for i, name in enumerate(id_columns) if name in PLATFORM_COLUMNS)
+        for field, position in predicates:
+            if field in filters and position < id_count:
+                allowed = filters[field]
+                keep &= np.array([str(value).strip() in allowed for value in id_values[:, position]], dtype=bool)
+    row_positions = np.nonzero(keep)[0]
+
+    metric_level = column_index.get_level_values('指标')
+    if metric_columns:
+        selected_metrics = set(metric_level)
+        output_metrics = [m for m in metric_columns if m in selected_metrics] or list(metric_columns)
+    else:
+        output_metrics = list(dict.fromkeys(metric_level))
+    output_columns = id_columns + ['品牌', '品牌类型'] + extra_columns + output_metrics
+    rollup = None
+    if rollups is not None:
+        rollup = rollups[layout_name] = brand_summary.RollupAccumulator(
+            layout_name, output_columns, output_metrics, PLATFORM_COLUMNS, extra_columns)
+    if not len(row_positions) or not columns:
+        print(f"{layout_name}提取完成，总共 0 行数据")
+        return pd.DataFrame(columns=output_columns)
+
+    # 品牌区域的值：行为保留的数据行，列为 build_column_index 选中的列
+    values = grid[np.ix_(row_positions, np.array(columns) - 1)]
+
+    # 每个(品牌, 中间各层)是一个数据块，列在表头中连续排列
+    block_keys = column_index.droplevel('指标')
+    block_starts = [0] + [i for i in range(1, len(block_keys)) if block_keys[i] != block_keys[i - 1]]
+    blocks = [block_keys[i] for i in block_starts]
+    # 块内各指标所在的列，缺少该指标时指向末尾追加的空列
+    metric_position = {metric: i for i, metric in enumerate(output_metrics)}
+    gather = np.full((len(blocks), len(output_metrics)), len(columns), dtype=np.int64)
+    block_of_column = np.repeat(np.arange(len(blocks)), np.diff(block_starts + [len(columns)]))
+    for col, (block, metric) in enumerate(zip(block_of_column, metric_level)):
+        if metric in metric_position:
+            gather[block, metric_position[metric]] = col
+
+    # 一次性计算所有单元格是否非空（None、空串、0都视为空），再按块归约
+    non_empty = ~(pd.isna(values) | (values == '') | (values == 0))
+    block_has_data = np.logical_or.reduceat(non_empty, block_starts, axis=1)
+    # 只展开有数据的(行, 块)，顺序为 原始行 → 品牌从左到右
+    hit_rows, hit_blocks = np.nonzero(block_has_data)
+    print(f"{layout_name}: {block_has_data.size} 个(行, 品牌)数据块中 {len(hit_rows)} 个有数据")
+
+    padded = np.concatenate([values, np.full((len(values), 1), None, dtype=object)], axis=1)
+    block_brands = [block[0] if isinstance(block, tuple) else block for block in blocks]
+    brand_labels = [(name.split('(')[0], '客户' if '客户' in name else '竞品') for name in block_brands]
+
+    def output_batch(start, end):
+        """第 start 到 end 个有数据的块对应的输出列"""
+        batch_rows, batch_blocks = hit_rows[start:end], hit_blocks[start:end]
+        batch_ids = id_values[row_positions[batch_rows]]
+        metric_values = padded[batch_rows[:, None], gather[batch_blocks]]
+        batch = [batch_ids[:, i] for i in range(id_count)]
+        batch.append([brand_labels[b][0] for b in batch_blocks])
+        batch.append([brand_labels[b][1] for b in batch_blocks])
+        for level in range(1, len(extra_columns) + 1):
+            batch.append([blocks[b][level] for b in batch_blocks])
+        batch.extend(metric_values[:, i] for i in range(len(output_metrics)))
+        if rollup is not None:
+            rollup.add(batch)
+        return batch
+
+    if mode == 'spill' or (mode == 'auto' and spill.exceeds_budget(len(hit_rows), len(output_columns))):
+        # 结果超过内存预算：分批写入内存映射文件，写出时再流式读回
+        print(f"{layout_name}: 结果约 {spill.estimate_bytes(len(hit_rows), len(output_columns)) / 1024 / 1024:.0f} MB，"
+              f"写入落盘缓冲")
+        result = spill.SpillTable(output_columns, len(hit_rows))
+        try:
+            for start in range(0, len(hit_rows), spill.BATCH_ROWS):
+                result.append(output_batch(start, start + spill.BATCH_ROWS))
+        except Exception:
+            result.close()
+            raise
+    else:
+        result = pd.DataFrame(dict(zip(output_columns, output_batch(0, len(hit_rows))))).infer_objects()
+
+    print(f"{layout_name}提取完成，总共 {len(result)} 行数据")
+    return result
+
+
+def copy_sheet(reader, sheet_name, writer):
+    """把不需要转置的工作表按原始值复制到输出"""
+    sheet = load_sheet(reader, sheet_name)
+    width = sheet['max_column']
+    data = [row + (None,) * (width - len(row)) for row in sheet['rows']]
+    pd.DataFrame(data).to_excel(writer, sheet_name=sheet_name, index=False, header=False)
+
+
+def iter_result_rows(result):
+    """逐行产出转置结果的值元组，DataFrame中的NaN/NaT转换为None"""
+    if isinstance(result, spill.SpillTable):
+        yield from result.iter_rows()
+        return
+    for row in result.itertuples(index=False, name=None):
+        yield tuple(None if pd.isna(value) else value for value in row)
+
+
+def write_workbook_streaming(reader, results, output_file, extra_sheets=None):
+    """
+    用openpyxl只写模式保存工作簿，单元格写入后立即输出到文件，
+    内存占用与结果行数无关；表头样式与pandas导出一致
+    extra_sheets 为追加在最后的 {工作表名称: DataFrame}（如品牌汇总）；reader 为None时不复制其他工作表
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    wb = Workbook(write_only=True)
+    thin = Side(style='thin')
+
+    def write_table(sheet_name, result):
+        ws = wb.create_sheet(sheet_name)
+        header = []
+        for name in result.columns:
+            cell = WriteOnlyCell(ws, value=name)
+            cell.font = Font(bold=True)
+            cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            cell.alignment = Alignment(horizontal='center', vertical='top')
+            header.append(cell)
+        ws.append(header)
+        for row in iter_result_rows(result):
+            ws.append(row)
+
+    for sheet_name, result in results.items():
+        write_table(sheet_name, result)
+        print(f"{sheet_name}转置完成: {result.shape}")
+
+    for sheet_name in reader.sheetnames if reader is not None else ():
+        if sheet_name not in results:
+            ws = wb.create_sheet(sheet_name)
+            for row in reader.iter_rows(sheet_name):
+                ws.append(row)
+            print(f"复制工作表: {sheet_name}")
+
+    for sheet_name, result in (extra_sheets or {}).items():
+        write_table(sheet_name, result)
+        print(f"{sheet_name}: {result.shape}")
+    wb.save(output_file)
+
+
+# 写出方式：memory 全部在内存中用pandas写出；streaming 只写模式流式写出；
+# spill 转置结果落盘并流式写出；auto 超过内存预算的工作表落盘，其余在内存中
+WRITE_MODES = ('auto', 'memory', 'streaming', 'spill')
+
+
+def process_workbook(input_file, output_file, observer=None, header_rows=None, filters=None,
+                     mode='auto', cache_dir=None, sinks=None, summary=True):
+    """
+    转置工作簿中所有支持的工作表，其他工作表原样复制；
+    summary 为True时在转置的同时计算品牌汇总（见 brand_summary 模块），
+    追加为最后一个工作表，并另存为输出文件旁边的 .summary.json
+
+    参数:
+    input_file: 输入文件路径（xlsx/xls/csv）
+    output_file: 输出xlsx路径
+    observer: 可选回调 observer(布局名称, 耗时秒数, 输出行数, 是否成功)，用于统计指标
+    header_rows: 可选，表头行数（如 品牌/AI平台/指标 三行），缺省使用布局配置
+    filters: 可选，parse_filters 的返回值，只输出选中的品牌、关键词、AI平台和指标
+    mode: 写出方式，见 WRITE_MODES
+    cache_dir: 可选，转置结果另存为列式缓存的目录（见 result_cache 模块），供网页分页浏览
+    sinks: 可选，结果的其他输出，每个对象的 write(results) 在文件写出后调用（如 warehouse.WarehouseSink）
+
+    返回:
+    dict: {工作表名称: 转置后的DataFrame}，落盘的工作表为已关闭的 spill.SpillTable（仅保留shape）
+    """
+    if mode not in WRITE_MODES:
+        raise ValueError(f"不支持的写出方式: {mode}")
+    results = {}
+    rollups = {} if summary else None
+    try:
+        with readers.open_workbook(input_file) as reader:
+            write_results(reader, results, output_file, observer, header_rows, filters, mode, rollups)
+        if rollups:
+            brand_summary.write_summary_json(rollups, brand_summary.summary_path_for(output_file))
+        if cache_dir:
+            try:
+                result_cache.save_results(results, cache_dir)
+            except Exception as e:
+                # 缓存只用于在线浏览，失败不影响已写出的文件
+                print(f"保存结果缓存失败: {str(e)}")
+        for sink in sinks or ():
+            try:
+                sink.write(results)
+            except Exception as e:
+                # 同上，输出文件已经写出，其他输出失败只记录
+                print(f"写入 {type(sink).__name__} 失败: {str(e)}")
+    finally:
+        for result in results.values():
+            if isinstance(result, spill.SpillTable):
+                result.close()
+    return results
+
+
+def write_results(reader, results, output_file, observer, header_rows, filters, mode, rollups=None):
+    """process_workbook 的主体：转置支持的工作表放入 results 并写出，rollups 不为None时同时累加品牌汇总"""
+    print(f"原始文件工作表: {reader.sheetnames} (读取后端: {reader.backend_name})")
+
+    for layout_name in LAYOUTS:
+        if layout_name not in reader.sheetnames:
+            continue
+        start_time = time.perf_counter()
+        try:
+            layout = resolve_layout(layout_name, header_rows)
+            sheet = load_sheet(reader, layout_name, layout, filters)
+            df = transpose_sheet(layout_name, sheet, header_rows, filters, mode, rollups)
+        except Exception:
+            if observer:
+                observer(layout_name, time.perf_counter() - start_time, 0, False)
+            raise
+        if observer:
+            observer(layout_name, time.perf_counter() - start_time, len(df), True)
+        results[layout_name] = df
+
+    extra_sheets = {}
+    if rollups and brand_summary.SUMMARY_SHEET not in reader.sheetnames:
+        extra_sheets[brand_summary.SUMMARY_SHEET] = brand_summary.summary_dataframe(rollups)
+
+    spilled = any(isinstance(df, spill.SpillTable) for df in results.values())
+    if mode in ('streaming', 'spill') or spilled:
+        write_workbook_streaming(reader, results, output_file, extra_sheets)
+        return
+
+    # 使用pandas保存所有工作表
+    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+        # 保存转置后的工作表
+        for sheet_name, df in results.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+            print(f"{sheet_name}转置完成: {df.shape}")
+
+        # 其他工作表直接复制
+        for sheet_name in reader.sheetnames:
+            if sheet_name not in results:
+                copy_sheet(reader, sheet_name, writer)
+                print(f"复制工作表: {sheet_name}")
+
+        for sheet_name, df in extra_sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+            print(f"{sheet_name}: {df.shape}")
+
+
+# 预览时每个工作表读取的数据行数
+PREVIEW_ROWS = 50
+
+
+def preview_workbook(input_file, rows=PREVIEW_ROWS, header_rows=None, filters=None):
+    """
+    预览转置结果：每个支持的工作表只读取表头和前 rows 行数据，
+    经过与完整转置相同的处理，不写出文件
+
+    返回:
+    dict: {工作表名称: 转置后的DataFrame}
+    """
+    results = {}
+    with readers.open_workbook(input_file) as reader:
+        for layout_name in LAYOUTS:
+            if layout_name not in reader.sheetnames:
+                continue
+            layout = resolve_layout(layout_name, header_rows)
+            sheet = load_sheet(reader, layout_name, layout, filters,
+                               max_row=layout['data_start_row'] - 1 + rows)
+            results[layout_name] = transpose_sheet(layout_name, sheet, header_rows, filters, mode='memory')
+    return results
+
+
+def main():
+    """
+    主函数 - 命令行使用
+    """
+    args = sys.argv[1:]
+    options = {}
+    for option in ('--header-rows', '--mode') + tuple(f'--{field}' for field in FILTER_FIELDS):
+        if option in args:
+            index = args.index(option)
+            options[option[2:]] = args[index + 1]
+            del args[index:index + 2]
+    header_rows = int(options['header-rows']) if 'header-rows' in options else None
+    filters = parse_filters(*(options.get(field) for field in FILTER_FIELDS))
+
+    if not args:
+        print("使用方法: python transpose_engine.py <输入文件> [输出文件] [--header-rows N] [--mode 写出方式] [筛选条件]")
+        print("示例: python transpose_engine.py 数据文件.xlsx")
+        print("三行表头（品牌/AI平台/指标）: python transpose_engine.py 数据文件.xlsx --header-rows 3")
+        print("筛选（逗号分隔）: --brands 品牌A,竞品B --keywords 关键词1 --platforms DeepSeek --metrics 可见概率,Top1占比")
+        print(f"写出方式: --mode {'|'.join(WRITE_MODES)}（默认auto，超过内存预算时落盘）")
+        return
+
+    input_file = args[0]
+    if len(args) > 1:
+        output_file = args[1]
+    else:
+        base_name = os.path.splitext(os.path.basename(input_file))[0]
+        current_date = datetime.now().strftime("%Y%m%d")
+        output_file = f"{base_name}_{current_date}_完整转置完成.xlsx"
+
+    if not os.path.exists(input_file):
+        print(f"找不到输入文件: {input_file}")
+        return
+
+    results = process_workbook(input_file, output_file, header_rows=header_rows, filters=filters,
+                               mode=options.get('mode', 'auto'))
+    print(f"\n文件已保存: {output_file}")
+    summary_path = brand_summary.summary_path_for(output_file)
+    if os.path.exists(summary_path):
+        print(f"品牌汇总: {summary_path}")
+    for sheet_name, df in results.items():
+        print(f"{sheet_name}: {df.shape}")
+
+
+if __name__ == "__main__":
+    main()
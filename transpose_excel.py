@@ -2,15 +2,17 @@ import pandas as pd
 import os
 from datetime import datetime
 
+import readers
+
 def read_excel_file(file_path):
     """读取Excel文件"""
     try:
         # 尝试读取Excel文件的所有工作表
-        excel_file = pd.ExcelFile(file_path)
-        print(f"工作表名称: {excel_file.sheet_names}")
+        with readers.open_workbook(file_path) as reader:
+            print(f"工作表名称: {reader.sheetnames}")
         
         # 读取第一个工作表
-        df = pd.read_excel(file_path, sheet_name=0, header=None)
+        df = readers.read_dataframe(file_path, sheet_name=0, header=None)
         print(f"原始数据形状: {df.shape}")
         print("原始数据预览:")
         print(df.head(10))
@@ -1,7 +1,8 @@
-import pandas as pd
 import os
 from openpyxl import load_workbook
 
+import readers
+
 def verify_no_merged_cells(file_path):
     """验证Excel文件中没有合并单元格"""
     try:
@@ -25,11 +26,11 @@ def compare_dimensions(original_file, transposed_file):
     """比较原始文件和转置文件的维度"""
     try:
         # 读取原始文件
-        original_df = pd.read_excel(original_file, header=None)
+        original_df = readers.read_dataframe(original_file, header=None)
         original_cleaned = original_df.dropna(how='all').dropna(axis=1, how='all')
         
         # 读取转置文件
-        transposed_df = pd.read_excel(transposed_file, header=None)
+        transposed_df = readers.read_dataframe(transposed_file, header=None)
         
         print(f"\n📊 维度对比:")
         print(f"原始文件: {original_cleaned.shape[0]}行 × {original_cleaned.shape[1]}列")
@@ -51,7 +52,7 @@ def compare_dimensions(original_file, transposed_file):
 def display_file_preview(file_path, title):
     """显示文件预览"""
     try:
-        df = pd.read_excel(file_path, header=None)
+        df = readers.read_dataframe(file_path, header=None)
         print(f"\n{title} (前5行5列):")
         preview = df.iloc[:5, :5]
         print(preview.to_string())
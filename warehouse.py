@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+转置结果的本地数据仓库
+每期报告的信源数据分析、关键词数据分析转置结果追加写入一个SQLite数据库文件，
+按自然键去重（同一日期的同一关键词/平台/品牌重复导入时以最新一次为准），
+并在 (日期, 关键词名称, 品牌, AI平台) 上建立索引，跨期查询无需再打开历史Excel
+
+表名与工作表名称相同，列名与转置输出相同，另外增加：
+    日期       报告日期 YYYY-MM-DD，默认取文件名中的日期，没有时为导入当天
+    来源文件   原始文件名
+    导入时间   最近一次写入该行的时间
+各布局的AI平台列（AI平台 / AI平台名称）在仓库中统一为 AI平台
+
+写入时同时更新该报告日期的分组汇总表（见 AGGREGATES），常用查询（见 QUERIES）
+直接读汇总表，不需要扫描明细行
+
+用法:
+    python warehouse.py <报告或转置结果.xlsx> [...] [--db 数据库文件] [--date YYYY-MM-DD]
+    python warehouse.py --rebuild-aggregates [--db 数据库文件]
+
+环境变量:
+    WAREHOUSE_PATH   网页上传的转置结果同时写入该数据库（默认不写入）
+"""
+
+import datetime
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import readers
+import transpose_engine
+
+WAREHOUSE_PATH = os.environ.get('WAREHOUSE_PATH', '')
+DEFAULT_DB = 'warehouse.db'
+# 每批写入的行数
+INSERT_BATCH_ROWS = 5000
+# 并发写入时等待数据库锁的时间（秒）
+BUSY_TIMEOUT_SECONDS = 60
+
+PLATFORM_COLUMN = 'AI平台'
+# 除日期、品牌和表头中间各层外，决定一行身份的基础信息列；
+# 选用信源文章总数等数值型基础信息随每期报告变化，不属于自然键
+NATURAL_KEYS = {
+    '信源数据分析': ['关键词名称', PLATFORM_COLUMN, '信源平台名称'],
+    '关键词数据分析': ['关键词名称', PLATFORM_COLUMN],
+}
+# 自然键的唯一索引以这几列开头，同时满足按日期、关键词、品牌、平台的查询
+INDEX_PREFIX = ['日期', '关键词名称', '品牌', PLATFORM_COLUMN]
+
+# 分组汇总表：每个 (分组, 指标) 保存数值个数和合计，平均值在查询时由 合计/行数 得出，
+# 因此可以跨日期、跨平台再次合并
+AGGREGATES = {
+    '汇总_品牌平台': {'source': '关键词数据分析', 'group': ['日期', '品牌', '品牌类型', PLATFORM_COLUMN]},
+    '汇总_关键词品牌': {'source': '信源数据分析', 'group': ['日期', '关键词名称', '品牌', '品牌类型']},
+}
+
+_DATE_PATTERNS = (
+    re.compile(r'(20\d{2})[-_.年]?(0[1-9]|1[0-2])[-_.月]?(0[1-9]|[12]\d|3[01])'),
+    re.compile(r'(20\d{2})[-_.年](1[0-2]|0?[1-9])[-_.月](3[01]|[12]\d|0?[1-9])日?'),
+    re.compile(r'(20\d{2})[-_.年](1[0-2]|0?[1-9])月?'),
+)
+
+
+class WarehouseError(Exception):
+    """数据仓库查询错误，附带HTTP状态码"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def date_in_name(filename):
+    """
+    文件名中的报告日期（20250927、2025-09-27、2025年9月27日、2025年9月 等），
+    只有年月时取当月1日，找不到时返回None
+
+    返回:
+    str: YYYY-MM-DD
+    """
+    name = os.path.basename(filename or '')
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(name)
+        if not match:
+            continue
+        parts = [int(part) for part in match.groups()] + [1]
+        try:
+            return datetime.date(parts[0], parts[1], parts[2]).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def report_date_from_name(filename, default=None):
+    """文件名中的报告日期，找不到时返回 default，default 为空时返回当天"""
+    return date_in_name(filename) or default or datetime.date.today().isoformat()
+
+
+def normalize_date(value):
+    """校验并规范化 YYYY-MM-DD 日期字符串，无效时抛出 ValueError"""
+    return datetime.date.fromisoformat(str(value).strip()).isoformat()
+
+
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _db_value(value):
+    """转换为SQLite可以保存的值，空值为None"""
+    if value is None:
+        return None
+    if isinstance(value, (np.integer, np.bool_)):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, float) and value != value:
+        return None
+    if isinstance(value, (datetime.date, pd.Timestamp)):
+        return value.isoformat()
+    return value
+
+
+def connect(db_path=None):
+    """打开数据库，WAL模式允许查询与写入同时进行"""
+    db_path = db_path or WAREHOUSE_PATH or DEFAULT_DB
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def warehouse_columns(columns):
+    """转置输出的列名对应的仓库列名"""
+    return [PLATFORM_COLUMN if column in transpose_engine.PLATFORM_COLUMNS else column
+            for column in columns]
+
+
+def natural_key(table_name, columns):
+    """表的自然键列，以 INDEX_PREFIX 开头，其后为其余基础信息列和表头中间各层"""
+    layout = transpose_engine.LAYOUTS.get(table_name, {})
+    metrics = set(layout.get('metric_columns', ()))
+    base = NATURAL_KEYS.get(table_name) or warehouse_columns(layout.get('id_columns', ()))
+    # 表头中间各层（如三行表头中的AI平台分组）位于品牌类型和指标之间
+    levels = [column for column in columns
+              if column not in base and column not in metrics
+              and column not in ('品牌', '品牌类型', '日期', '来源文件', '导入时间')
+              and column not in warehouse_columns(layout.get('id_columns', ()))]
+    key = [column for column in INDEX_PREFIX if column == '日期' or column in columns]
+    key.extend(column for column in base + levels if column not in key and column in columns)
+    return key
+
+
+def ensure_table(conn, table_name, columns):
+    """
+    创建表和索引，已有的表缺少列时追加（如新报告增加了指标或表头层级）
+
+    返回:
+    list: 自然键列
+    """
+    columns = ['日期'] + [column for column in columns if column != '日期'] + ['来源文件', '导入时间']
+    existing = [row[1] for row in conn.execute(f'PRAGMA table_info({_quote(table_name)})')]
+    if not existing:
+        conn.execute(f'CREATE TABLE {_quote(table_name)} ({", ".join(_quote(c) for c in columns)})')
+    else:
+        for column in columns:
+            if column not in existing:
+                conn.execute(f'ALTER TABLE {_quote(table_name)} ADD COLUMN {_quote(column)}')
+        existing += [column for column in columns if column not in existing]
+    # 自然键按表中的全部列确定，只增不减：缺少某一层表头的报告在该列写入空串
+    key = natural_key(table_name, existing or columns)
+    key_index = f"{table_name}_key"
+    indexed = [row[2] for row in conn.execute(f'PRAGMA index_info({_quote(key_index)})')]
+    if indexed != key:
+        # 新增了表头层级时自然键变长，原有的行在更长的键上仍然唯一，直接重建索引
+        conn.execute(f'DROP INDEX IF EXISTS {_quote(key_index)}')
+        for column in key:
+            conn.execute(f'UPDATE {_quote(table_name)} SET {_quote(column)} = \'\' '
+                         f'WHERE {_quote(column)} IS NULL')
+        conn.execute(f'CREATE UNIQUE INDEX {_quote(key_index)} '
+                     f'ON {_quote(table_name)} ({", ".join(_quote(c) for c in key)})')
+    if '品牌' in columns and PLATFORM_COLUMN in columns:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {_quote(f"{table_name}_brand")} '
+                     f'ON {_quote(table_name)} ("品牌", {_quote(PLATFORM_COLUMN)}, "日期")')
+    return key
+
+
+def upsert_rows(conn, table_name, columns, rows, report_date, source_name=None):
+    """
+    写入转置结果的行，自然键相同的行更新为新值
+
+    参数:
+    columns: 转置输出的列名
+    rows: 值元组的可迭代对象（transpose_engine.iter_result_rows 的返回值）
+    report_date: 报告日期 YYYY-MM-DD
+
+    返回:
+    int: 写入的行数
+    """
+    columns = warehouse_columns(columns)
+    key = ensure_table(conn, table_name, columns)
+    all_columns = ['日期'] + columns + ['来源文件', '导入时间']
+    missing_key = [column for column in key if column not in all_columns]
+    all_columns += missing_key
+    updates = [column for column in all_columns if column not in key]
+    sql = (f'INSERT INTO {_quote(table_name)} ({", ".join(_quote(c) for c in all_columns)}) '
+           f'VALUES ({", ".join("?" for _ in all_columns)}) '
+           f'ON CONFLICT ({", ".join(_quote(c) for c in key)}) DO UPDATE SET '
+           + ', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in updates))
+    # 唯一索引中NULL互不相等，自然键中的空值保存为空串才能去重
+    key_positions = [i for i, column in enumerate(all_columns) if column in key]
+    imported_at = datetime.datetime.now().isoformat(timespec='seconds')
+
+    count = 0
+    batch = []
+    for row in rows:
+        values = ([report_date] + [_db_value(value) for value in row] + [source_name, imported_at]
+                  + [''] * len(missing_key))
+        for i in key_positions:
+            if values[i] is None:
+                values[i] = ''
+        batch.append(values)
+        if len(batch) >= INSERT_BATCH_ROWS:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+def _metric_columns(conn, table_name):
+    """表中存在的指标列"""
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({_quote(table_name)})')}
+    metrics = transpose_engine.LAYOUTS.get(table_name, {}).get('metric_columns', ())
+    return [column for column in metrics if column in existing]
+
+
+def refresh_aggregates(conn, dates=None, sources=None):
+    """
+    重新计算汇总表中指定日期的行，dates 为空时重算全部日期
+
+    参数:
+    sources: 只重算来源为这些明细表的汇总表，缺省为全部
+    """
+    for name, spec in AGGREGATES.items():
+        source = spec['source']
+        if sources is not None and source not in sources:
+            continue
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (source,)).fetchone():
+            continue
+        group = spec['group']
+        columns = group + ['指标', '行数', '合计']
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {_quote(name)} ({", ".join(_quote(c) for c in columns)})')
+        conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {_quote(f"{name}_key")} ON {_quote(name)} '
+                     f'("指标", {", ".join(_quote(c) for c in group)})')
+
+        where, params = '', []
+        if dates is not None:
+            where = f'WHERE "日期" IN ({", ".join("?" for _ in dates)})'
+            params = list(dates)
+            conn.execute(f'DELETE FROM {_quote(name)} {where}', params)
+        else:
+            conn.execute(f'DELETE FROM {_quote(name)}')
+
+        group_sql = ', '.join(_quote(c) for c in group)
+        for metric in _metric_columns(conn, source):
+            # 只统计数值，文本（如 "-"）不计入行数
+            value = (f'CASE WHEN typeof({_quote(metric)}) IN (\'integer\', \'real\') '
+                     f'THEN {_quote(metric)} END')
+            conn.execute(
+                f'INSERT INTO {_quote(name)} ({", ".join(_quote(c) for c in columns)}) '
+                f'SELECT {group_sql}, ?, COUNT({value}), TOTAL({value}) FROM {_quote(source)} {where} '
+                f'GROUP BY {group_sql} HAVING COUNT({value}) > 0',
+                [metric] + params)
+
+
+def store_results(results, report_date, source_name=None, db_path=None):
+    """
+    把 process_workbook 的转置结果写入仓库并更新该日期的汇总表，所有工作表在一个事务中提交
+
+    返回:
+    dict: {工作表名称: 写入行数}
+    """
+    report_date = normalize_date(report_date)
+    start_time = time.perf_counter()
+    conn = connect(db_path)
+    counts = {}
+    try:
+        with conn:
+            for table_name, result in results.items():
+                if result is None:
+                    continue
+                counts[table_name] = upsert_rows(
+                    conn, table_name, list(result.columns), transpose_engine.iter_result_rows(result),
+                    report_date, source_name)
+            refresh_aggregates(conn, [report_date], set(counts))
+    finally:
+        conn.close()
+    print(f"写入数据仓库: {counts}，报告日期 {report_date}，耗时 {time.perf_counter() - start_time:.2f} 秒")
+    return counts
+
+
+# 常用查询：读取的汇总表、默认指标、结果的分组列；share 为计算占比的分区列
+QUERIES = {
+    # 各品牌在各AI平台上的平均值（默认可见概率）
+    'platform_average': {'table': '汇总_品牌平台', 'metric': '可见概率',
+                         'group': ['品牌', '品牌类型', PLATFORM_COLUMN]},
+    # 各品牌按报告日期的走势（默认Top1占比）
+    'trend': {'table': '汇总_品牌平台', 'metric': 'Top1占比', 'group': ['日期', '品牌', '品牌类型']},
+    # 每个关键词下各品牌的份额（默认按选用信源文章数）
+    'keyword_share': {'table': '汇总_关键词品牌', 'metric': '选用信源文章数',
+                      'group': ['关键词名称', '品牌', '品牌类型'], 'share': '关键词名称'},
+}
+# 查询参数中的筛选条件对应的列
+QUERY_FILTERS = {'brands': '品牌', 'platforms': PLATFORM_COLUMN, 'keywords': '关键词名称'}
+
+
+def query(name, params=None, db_path=None):
+    """
+    执行一个常用查询
+
+    参数:
+    name: QUERIES 中的查询名称
+    params: 可选参数 metric（指标）、start/end（报告日期范围 YYYY-MM-DD）、
+            brands/platforms/keywords（逗号分隔的筛选值）
+
+    返回:
+    dict: query、metric、columns、rows；出错时抛出 WarehouseError
+    """
+    params = params or {}
+    spec = QUERIES.get(name)
+    if spec is None:
+        raise WarehouseError(f'不支持的查询: {name}，可用查询: {", ".join(QUERIES)}')
+    table = spec['table']
+    source = AGGREGATES[table]['source']
+    metric = params.get('metric') or spec['metric']
+    if metric not in transpose_engine.LAYOUTS[source]['metric_columns']:
+        raise WarehouseError(f'查询 {name} 不支持指标 {metric}')
+
+    conditions, values = ['"指标" = ?'], [metric]
+    for field, bound in (('start', '>='), ('end', '<=')):
+        if params.get(field):
+            try:
+                values.append(normalize_date(params[field]))
+            except ValueError:
+                raise WarehouseError(f'{field} 日期格式应为 YYYY-MM-DD')
+            conditions.append(f'"日期" {bound} ?')
+    # 品牌筛选在计算占比之后进行，占比的分母始终是全部品牌
+    outer_conditions, outer_values = [], []
+    for field, items in (transpose_engine.parse_filters(
+            params.get('brands'), params.get('keywords'), params.get('platforms')) or {}).items():
+        column = QUERY_FILTERS[field]
+        if column not in AGGREGATES[table]['group']:
+            raise WarehouseError(f'查询 {name} 不支持按 {column} 筛选')
+        target, target_values = ((outer_conditions, outer_values) if field == 'brands'
+                                 else (conditions, values))
+        target.append(f'{_quote(column)} IN ({", ".join("?" for _ in items)})')
+        target_values.extend(sorted(items))
+
+    group_sql = ', '.join(_quote(c) for c in spec['group'])
+    columns = spec['group'] + ['行数', '合计', '平均值']
+    share_sql = ''
+    if spec.get('share'):
+        columns.append('占比')
+        share_sql = f', SUM("合计") / SUM(SUM("合计")) OVER (PARTITION BY {_quote(spec["share"])})'
+    sql = (f'SELECT * FROM (SELECT {group_sql}, SUM("行数"), SUM("合计"), SUM("合计") / SUM("行数"){share_sql} '
+           f'FROM {_quote(table)} WHERE {" AND ".join(conditions)} GROUP BY {group_sql})')
+    if outer_conditions:
+        sql += f' WHERE {" AND ".join(outer_conditions)}'
+    sql += f' ORDER BY {group_sql}'
+
+    db_path = db_path or WAREHOUSE_PATH
+    if not db_path:
+        raise WarehouseError('未启用数据仓库，请设置 WAREHOUSE_PATH', 404)
+    if not os.path.exists(db_path):
+        raise WarehouseError('数据仓库中还没有数据', 404)
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_SECONDS)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (table,)).fetchone():
+            rows = []
+        else:
+            rows = conn.execute(sql, values + outer_values).fetchall()
+    finally:
+        conn.close()
+    return {'query': name, 'metric': metric, 'columns': columns, 'rows': [list(row) for row in rows]}
+
+
+class WarehouseSink:
+    """
+    process_workbook 的结果输出：转置完成后把结果写入仓库
+    可以被pickle，随任务参数传给转置子进程
+    """
+
+    def __init__(self, report_date, source_name=None, db_path=None):
+        self.report_date = normalize_date(report_date)
+        self.source_name = source_name
+        self.db_path = db_path or WAREHOUSE_PATH or DEFAULT_DB
+
+    def write(self, results):
+        return store_results(results, self.report_date, self.source_name, self.db_path)
+
+
+def is_transposed(reader, sheet_name):
+    """工作表是否已经是转置后的长格式（第1行为列名，含品牌和品牌类型）"""
+    header = next(iter(reader.iter_rows(sheet_name, max_row=1)), ())
+    return '品牌' in header and '品牌类型' in header
+
+
+def read_results(path, header_rows=None):
+    """
+    读取一个文件中各布局的长表：原始报告先转置，已转置的结果（本工具的输出文件）直接读取
+
+    返回:
+    dict: {工作表名称: DataFrame}
+    """
+    results = {}
+    with readers.open_workbook(path) as reader:
+        for sheet_name in transpose_engine.LAYOUTS:
+            if sheet_name not in reader.sheetnames:
+                continue
+            if is_transposed(reader, sheet_name):
+                rows = list(reader.iter_rows(sheet_name))
+                results[sheet_name] = pd.DataFrame(rows[1:], columns=list(rows[0])).dropna(how='all')
+            else:
+                layout = transpose_engine.resolve_layout(sheet_name, header_rows)
+                sheet = transpose_engine.load_sheet(reader, sheet_name, layout)
+                results[sheet_name] = transpose_engine.transpose_sheet(
+                    sheet_name, sheet, header_rows, mode='memory')
+    return results
+
+
+def load_file(path, report_date=None, db_path=None, header_rows=None):
+    """
+    导入一个文件（见 read_results）
+
+    返回:
+    dict: {工作表名称: 写入行数}
+    """
+    report_date = normalize_date(report_date) if report_date else report_date_from_name(path)
+    return store_results(read_results(path, header_rows), report_date, os.path.basename(path), db_path)
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    rebuild = '--rebuild-aggregates' in args
+    if rebuild:
+        args.remove('--rebuild-aggregates')
+    for option in ('--db', '--date', '--header-rows'):
+        if option in args:
+            index = args.index(option)
+            options[option[2:]] = args[index + 1]
+            del args[index:index + 2]
+
+    if rebuild:
+        conn = connect(options.get('db'))
+        try:
+            with conn:
+                refresh_aggregates(conn)
+        finally:
+            conn.close()
+        print("汇总表已重新计算")
+        return
+
+    if not args:
+        print("使用方法: python warehouse.py <报告或转置结果.xlsx> [...] [--db 数据库文件] [--date YYYY-MM-DD]")
+        print("重新计算全部汇总表: python warehouse.py --rebuild-aggregates [--db 数据库文件]")
+        print(f"默认数据库: {WAREHOUSE_PATH or DEFAULT_DB}，报告日期默认取文件名中的日期")
+        return
+
+    header_rows = int(options['header-rows']) if 'header-rows' in options else None
+    for path in args:
+        print(f"导入 {path}")
+        load_file(path, options.get('date'), options.get('db'), header_rows)
+
+
+if __name__ == "__main__":
+    main()
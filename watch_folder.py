@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监视目录自动转置
+常驻运行，监视待处理目录（默认 待处理文件）中新放入或被修改的报告：
+1. Linux下用inotify等待文件写完或移入，其他系统或inotify不可用时定期扫描目录
+2. 文件大小和修改时间在 WATCH_SETTLE_SECONDS 秒内不再变化才处理，避免读到复制了一半的文件
+3. 按各布局工作表的列名行自动识别表头行数（品牌/指标两行，或品牌/AI平台/指标三行），
+   已经转置过的长表和不含布局工作表的文件跳过（不记为已处理，重启或文件被修改后重新识别）
+4. 交给工作线程池，每个文件在独立子进程中转置（见 job_process），
+   输出 <原文件名>_<日期>_完整转置完成.xlsx、品牌汇总 .summary.json 和验证摘要 .validation.json，
+   都写在原文件旁边
+已处理文件的大小和修改时间记录在目录下的 .watch_state.json，重启后不会重复处理；
+文件再次被修改后重新转置。设置了 WAREHOUSE_PATH 时结果同时写入数据仓库
+
+环境变量:
+    WATCH_DIR              监视的目录（默认 待处理文件）
+    WATCH_WORKERS          同时转置的文件数（默认2）
+    WATCH_SETTLE_SECONDS   文件停止变化多少秒后开始处理（默认5）
+
+用法:
+    python watch_folder.py [目录] [--workers N] [--settle 秒] [--once]
+    --once: 处理目录中现有的文件后退出，适合定时任务
+"""
+
+import ctypes
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import job_process
+import preflight
+import readers
+import transpose_engine
+import warehouse
+
+WATCH_DIR = os.environ.get('WATCH_DIR', '待处理文件')
+WATCH_WORKERS = int(os.environ.get('WATCH_WORKERS', '2'))
+WATCH_SETTLE_SECONDS = float(os.environ.get('WATCH_SETTLE_SECONDS', '5'))
+# 没有inotify时扫描目录的间隔，也是等待事件的最长时间（秒）
+POLL_INTERVAL_SECONDS = 2
+
+INPUT_EXTENSIONS = ('.xlsx', '.xls')
+OUTPUT_MARK = '_完整转置完成'
+STATE_FILE = '.watch_state.json'
+
+# inotify 常量，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """通过ctypes调用的最小inotify封装，只用于唤醒扫描，不解析具体事件"""
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 失败')
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch 失败: {path}')
+
+    def wait(self, timeout):
+        """等待事件或超时，返回收到的事件数"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return 0
+        count = 0
+        try:
+            while True:
+                data = os.read(self.fd, 65536)
+                offset = 0
+                while offset < len(data):
+                    _, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size + name_length
+                    count += 1
+        except BlockingIOError:
+            pass
+        return count
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_inotify(path):
+    """尝试创建inotify监视，不可用时返回None（改为定期扫描）"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        return Inotify(path)
+    except (OSError, AttributeError) as e:
+        print(f"inotify不可用，改为每 {POLL_INTERVAL_SECONDS} 秒扫描一次: {str(e)}")
+        return None
+
+
+def is_candidate(name):
+    """是否为待处理的原始报告：排除Office临时文件、隐藏文件和本工具的输出"""
+    return (name.lower().endswith(INPUT_EXTENSIONS)
+            and not name.startswith(('~', '.'))
+            and OUTPUT_MARK not in name)
+
+
+def output_path_for(input_path):
+    base_name, ext = os.path.splitext(input_path)
+    # 同名的.xls和.xlsx输出不能相互覆盖
+    if ext.lower() != '.xlsx':
+        base_name = f"{base_name}_{ext.lstrip('.').lower()}"
+    return f"{base_name}_{datetime.now().strftime('%Y%m%d')}{OUTPUT_MARK}.xlsx"
+
+
+def validation_path_for(output_path):
+    return f"{os.path.splitext(output_path)[0]}.validation.json"
+
+
+def detect_workbook_header_rows(input_path):
+    """
+    识别整个文件的表头行数
+
+    返回:
+    tuple: (表头行数, 跳过原因)，可以转置时跳过原因为None
+    """
+    with readers.open_workbook(input_path) as reader:
+        layout_sheets = [name for name in reader.sheetnames if name in transpose_engine.LAYOUTS]
+        # 与数据仓库导入相同：第1行含 品牌、品牌类型 列的是转置结果
+        if any(warehouse.is_transposed(reader, name) for name in layout_sheets):
+            return None, '已经是转置后的长表'
+        detected = {name: preflight.detect_header_rows(reader, name) for name in layout_sheets}
+    if not detected:
+        return None, '不含可转置的工作表'
+    missing = [name for name, rows in detected.items() if rows is None or rows < 2]
+    if missing:
+        return None, f"{', '.join(missing)} 在前 {preflight.MAX_HEADER_ROWS} 行中找不到品牌和指标表头"
+    if len(set(detected.values())) > 1:
+        return None, f"各工作表的表头行数不一致: {detected}"
+    return next(iter(detected.values())), None
+
+
+def validate(estimate, shapes):
+    """
+    根据预检估计检查转置结果的行数
+
+    返回:
+    list: 每个布局工作表一项，含输入行数、品牌数、输出行数和各项检查结果
+    """
+    sheets = []
+    for sheet in estimate['sheets']:
+        if not sheet['layout']:
+            continue
+        output_rows = shapes.get(sheet['sheet'], (0, 0))[0]
+        checks = {
+            '已转置': sheet['sheet'] in shapes,
+            '有输出数据': output_rows > 0 or sheet['output_rows_max'] == 0,
+            '不超过最大行数': output_rows <= sheet['output_rows_max'],
+        }
+        sheets.append({
+            'sheet': sheet['sheet'],
+            'input_rows': sheet['rows'],
+            'brands': sheet['brands'],
+            'output_rows': output_rows,
+            'output_rows_max': sheet['output_rows_max'],
+            'checks': checks,
+            'passed': all(checks.values()),
+        })
+    return sheets
+
+
+class FolderWatcher:
+    """
+    扫描目录、判断文件是否写完并派发到线程池
+    processed 记录已处理文件的 (修改时间, 大小)，observed 记录上一次扫描时看到的值；
+    skipped 记录本次运行中跳过的文件，只保存在内存中，重启或文件被修改后重新识别
+    """
+
+    def __init__(self, folder, workers=WATCH_WORKERS, settle_seconds=WATCH_SETTLE_SECONDS):
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.state_path = os.path.join(folder, STATE_FILE)
+        self.processed = self._load_state()
+        self.observed = {}
+        self.skipped = {}
+        self.running = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='watch')
+        self.futures = []
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return {name: tuple(signature) for name, signature in json.load(f).items()}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.processed, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.state_path)
+
+    def scan(self, now=None):
+        """
+        扫描一次目录，派发已经写完的文件
+
+        返回:
+        float: 距离下一个未写完文件可能写完的秒数，没有这样的文件时返回None
+        """
+        now = time.time() if now is None else now
+        next_wait = None
+        with os.scandir(self.folder) as entries:
+            names = [(entry.name, entry.stat()) for entry in entries
+                     if entry.is_file() and is_candidate(entry.name)]
+        with self.lock:
+            for name, stat in names:
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if (name in self.running or self.processed.get(name) == signature
+                        or self.skipped.get(name) == signature):
+                    continue
+                previous = self.observed.get(name)
+                self.observed[name] = signature
+                remaining = self.settle_seconds - (now - stat.st_mtime)
+                # 两次扫描之间没有变化、且停止修改超过等待时间才认为已经写完
+                if previous == signature and remaining <= 0:
+                    self.running.add(name)
+                    del self.observed[name]
+                    self.futures.append(self.executor.submit(self._process, name, signature))
+                else:
+                    wait = max(remaining, POLL_INTERVAL_SECONDS / 2)
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+        self.futures = [future for future in self.futures if not future.done()]
+        return next_wait
+
+    def _process(self, name, signature):
+        """工作线程：转置一个文件并写出验证摘要"""
+        input_path = os.path.join(self.folder, name)
+        output_path = output_path_for(input_path)
+        started_at = datetime.now()
+        start_time = time.perf_counter()
+        report = {
+            'input': name,
+            'output': os.path.basename(output_path),
+            'started_at': started_at.isoformat(timespec='seconds'),
+            'header_rows': None,
+            'status': 'error',
+            'error': None,
+            'sheets': [],
+        }
+        try:
+            header_rows, skip_reason = detect_workbook_header_rows(input_path)
+            if skip_reason:
+                print(f"跳过 {name}: {skip_reason}")
+                with self.lock:
+                    self.running.discard(name)
+                    self.skipped[name] = signature
+                return
+            report['header_rows'] = header_rows
+            estimate = preflight.preflight(input_path, header_rows)
+            if estimate['rejected']:
+                raise ValueError(estimate['reason'])
+            print(f"开始转置 {name}（{header_rows} 行表头，预计 {estimate['seconds']} 秒）")
+            sinks = None
+            if warehouse.WAREHOUSE_PATH:
+                sinks = [warehouse.WarehouseSink(warehouse.report_date_from_name(name), name)]
+            shapes, _ = job_process.run_transpose(
+                input_path, output_path, mode=estimate['mode'], should_cancel=self.stop_event.is_set,
+                sinks=sinks, header_rows=header_rows)
+            if shapes is None:
+                raise RuntimeError('转置失败，详见日志')
+            report['sheets'] = validate(estimate, shapes)
+            report['status'] = 'passed' if all(sheet['passed'] for sheet in report['sheets']) else 'failed'
+        except job_process.JobAborted as e:
+            # 停止监视时中止的任务不记为已处理，下次启动时重新转置
+            print(f"{name} 已中止: {str(e)}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            with self.lock:
+                self.running.discard(name)
+            return
+        except Exception as e:
+            report['error'] = str(e)
+        report['seconds'] = round(time.perf_counter() - start_time, 2)
+
+        with open(validation_path_for(output_path), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        if report['status'] == 'error':
+            print(f"❌ {name} 处理失败: {report['error']}")
+        else:
+            mark = '✅' if report['status'] == 'passed' else '⚠️ '
+            rows = ', '.join(f"{sheet['sheet']} {sheet['output_rows']} 行" for sheet in report['sheets'])
+            print(f"{mark} {name} -> {report['output']}（{rows}，耗时 {report['seconds']} 秒）")
+        self._finish(name, signature)
+
+    def _finish(self, name, signature):
+        """记录为已处理；失败的文件同样记录，文件被再次修改后才重新处理"""
+        with self.lock:
+            self.running.discard(name)
+            self.processed[name] = signature
+            self._save_state()
+
+    def run(self, once=False):
+        """
+        监视目录直到收到停止信号；once 为True时只处理当前已写完的文件，等待完成后返回
+        """
+        if once:
+            self.scan()
+            # 第二次扫描确认文件没有变化
+            self.scan()
+            self.wait()
+            self.executor.shutdown(wait=True)
+            return
+        inotify = open_inotify(self.folder)
+        print(f"开始监视 {os.path.abspath(self.folder)}"
+              f"（{'inotify' if inotify else '定期扫描'}，文件停止变化 {self.settle_seconds} 秒后处理）")
+        try:
+            while not self.stop_event.is_set():
+                next_wait = self.scan()
+                timeout = POLL_INTERVAL_SECONDS if next_wait is None else min(next_wait, POLL_INTERVAL_SECONDS)
+                if inotify is not None:
+                    inotify.wait(timeout)
+                else:
+                    self.stop_event.wait(timeout)
+        finally:
+            if inotify is not None:
+                inotify.close()
+            self.stop()
+
+    def wait(self):
+        """等待已派发的文件处理完成"""
+        for future in list(self.futures):
+            future.result()
+        self.futures = []
+
+    def stop(self):
+        """停止派发并中止正在运行的转置子进程"""
+        self.stop_event.set()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+def main():
+    args = sys.argv[1:]
+    options = {}
+    once = '--once' in args
+    if once:
+        args.remove('--once')
+    for option in ('--workers', '--settle'):
+        if option in args:
+            index = args.index(option)
+            options[option[2:]] = args[index + 1]
+            del args[index:index + 2]
+
+    folder = args[0] if args else WATCH_DIR
+    if not os.path.isdir(folder):
+        print(f"找不到监视目录: {folder}")
+        print("使用方法: python watch_folder.py [目录] [--workers N] [--settle 秒] [--once]")
+        return
+
+    watcher = FolderWatcher(folder, workers=int(options.get('workers', WATCH_WORKERS)),
+                            settle_seconds=float(options.get('settle', WATCH_SETTLE_SECONDS)))
+
+    def handle_signal(signum, frame):
+        print("收到停止信号，正在退出...")
+        watcher.stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    watcher.run(once=once)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+生产环境WSGI入口
+gunicorn -c gunicorn.conf.py wsgi:application
+
+在主进程中预先导入pandas、openpyxl及其Excel读写子模块，
+配合 preload_app 由各工作进程通过fork共享，
+工作进程启动和首个请求都不再承担导入耗时
+"""
+
+import openpyxl
+import openpyxl.reader.excel
+import openpyxl.writer.excel
+import pandas as pd
+import pandas.io.excel._openpyxl
+
+from app import app
+
+application = app
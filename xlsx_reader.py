@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+轻量级XLSX读取器
+转置只需要单元格的原始值，openpyxl即使在只读模式下也要为每个单元格创建对象、解析样式，
+这里直接打开xlsx压缩包：
+1. sharedStrings.xml 只解析一次，字符串驻留后放入列表
+2. 工作表XML用事件解析器逐行解析，直接产出值元组
+3. 合并单元格和 <dimension ref> 通过扫描原始字节获得，不需要解析单元格
+
+取值规则与 openpyxl.load_workbook(data_only=True) 保持一致：
+数字按是否含小数点/指数转为int或float，日期格式的数字转为datetime，布尔值转为bool，
+公式单元格取缓存的计算结果
+"""
+
+import posixpath
+import re
+import sys
+import zipfile
+from xml.etree.ElementTree import iterparse
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel, from_ISO8601
+
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PKG_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+_ROW_TAG = f'{{{MAIN_NS}}}row'
+_CELL_TAG = f'{{{MAIN_NS}}}c'
+_VALUE_TAG = f'{{{MAIN_NS}}}v'
+_INLINE_TAG = f'{{{MAIN_NS}}}is'
+_TEXT_TAG = f'{{{MAIN_NS}}}t'
+_RUN_TAG = f'{{{MAIN_NS}}}r'
+_SI_TAG = f'{{{MAIN_NS}}}si'
+_SHEET_DATA_TAG = f'{{{MAIN_NS}}}sheetData'
+
+_MERGE_PATTERN = re.compile(rb'<(?:\w+:)?mergeCell\s[^>]*?ref="([^"]+)"')
+_DIMENSION_PATTERN = re.compile(rb'<(?:\w+:)?dimension\s[^>]*?ref="([^"]+)"')
+_SCAN_CHUNK_SIZE = 1024 * 1024
+
+# 列字母到列号的缓存，报表列数有限，缓存命中率接近100%
+_column_cache = {}
+
+
+def column_index(letters):
+    """列字母转列号（从1开始），如 'A' -> 1, 'BN' -> 66"""
+    index = _column_cache.get(letters)
+    if index is None:
+        index = 0
+        for char in letters:
+            index = index * 26 + ord(char) - 64
+        _column_cache[letters] = index
+    return index
+
+
+def split_reference(ref):
+    """单元格坐标拆分为 (行号, 列号)，如 'BN12' -> (12, 66)"""
+    digits_at = len(ref.rstrip('0123456789'))
+    return int(ref[digits_at:]), column_index(ref[:digits_at])
+
+
+def parse_range(ref):
+    """区域坐标转为 (min_row, min_col, max_row, max_col)"""
+    if ':' in ref:
+        start, end = ref.split(':', 1)
+    else:
+        start = end = ref
+    min_row, min_col = split_reference(start.replace('$', ''))
+    max_row, max_col = split_reference(end.replace('$', ''))
+    return min_row, min_col, max_row, max_col
+
+
+def _text_content(element):
+    """<si>/<is> 中的文本，富文本各段拼接，忽略拼音注释 <rPh>"""
+    parts = []
+    for child in element:
+        if child.tag == _TEXT_TAG:
+            parts.append(child.text or '')
+        elif child.tag == _RUN_TAG:
+            text = child.find(_TEXT_TAG)
+            if text is not None:
+                parts.append(text.text or '')
+    return ''.join(parts)
+
+
+def _cast_number(value):
+    if '.' in value or 'E' in value or 'e' in value:
+        return float(value)
+    return int(value)
+
+
+class XlsxReader:
+    """
+    直接读取xlsx压缩包的只读工作簿
+
+    用法:
+    with XlsxReader(path) as reader:
+        for row in reader.iter_rows('信源数据分析'):
+            ...
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path)
+        self._names = set(self._zip.namelist())
+        self._sheet_paths = {}
+        self.sheetnames = []
+        self.epoch = WINDOWS_EPOCH
+        self._shared_strings = None
+        self._date_styles = None
+        self._timedelta_styles = None
+        self._shared_strings_path = None
+        self._styles_path = None
+        self._load_workbook()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._zip.close()
+
+    # ------------------------------------------------------------------
+    # 工作簿结构
+    # ------------------------------------------------------------------
+    def _read_rels(self, rels_path):
+        """读取关系文件，返回 {Id: (Type, Target)}"""
+        rels = {}
+        if rels_path not in self._names:
+            return rels
+        with self._zip.open(rels_path) as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{{{PKG_REL_NS}}}Relationship':
+                    rels[element.get('Id')] = (element.get('Type', ''), element.get('Target', ''))
+        return rels
+
+    @staticmethod
+    def _resolve(base_dir, target):
+        if target.startswith('/'):
+            return target.lstrip('/')
+        return posixpath.normpath(posixpath.join(base_dir, target))
+
+    def _load_workbook(self):
+        workbook_path = 'xl/workbook.xml'
+        for rel_type, target in self._read_rels('_rels/.rels').values():
+            if rel_type.endswith('/officeDocument'):
+                workbook_path = self._resolve('', target)
+                break
+        base_dir = posixpath.dirname(workbook_path)
+        rels_path = posixpath.join(base_dir, '_rels', posixpath.basename(workbook_path) + '.rels')
+        rels = self._read_rels(rels_path)
+
+        for rel_type, target in rels.values():
+            if rel_type.endswith('/sharedStrings'):
+                self._shared_strings_path = self._resolve(base_dir, target)
+            elif rel_type.endswith('/styles'):
+                self._styles_path = self._resolve(base_dir, target)
+
+        with self._zip.open(workbook_path) as f:
+            for _, element in iterparse(f):
+                if element.tag == f'{{{MAIN_NS}}}workbookPr':
+                    if element.get('date1904') in ('1', 'true'):
+                        self.epoch = MAC_EPOCH
+                elif element.tag == f'{{{MAIN_NS}}}sheet':
+                    rel = rels.get(element.get(f'{{{REL_NS}}}id'))
+                    if rel is None:
+                        continue
+                    name = element.get('name')
+                    self.sheetnames.append(name)
+                    self._sheet_paths[name] = self._resolve(base_dir, rel[1])
+
+    @property
+    def shared_strings(self):
+        """共享字符串表，首次访问时解析一次"""
+        if self._shared_strings is None:
+            strings = []
+            if self._shared_strings_path in self._names:
+                intern = sys.intern
+                with self._zip.open(self._shared_strings_path) as f:
+                    for _, element in iterparse(f):
+                        if element.tag == _SI_TAG:
+                            strings.append(intern(_text_content(element).replace('x005F_', '')))
+                            element.clear()
+            self._shared_strings = strings
+        return self._shared_strings
+
+    def _load_styles(self):
+        """找出日期/时长格式的样式编号，这些数字单元格需要转为日期"""
+        date_styles = set()
+        timedelta_styles = set()
+        if self._styles_path in self._names:
+            custom_formats = {}
+            in_cell_xfs = False
+            index = 0
+            with self._zip.open(self._styles_path) as f:
+                for event, element in iterparse(f, events=('start', 'end')):
+                    tag = element.tag
+                    if tag == f'{{{MAIN_NS}}}numFmt' and event == 'end':
+                        custom_formats[int(element.get('numFmtId'))] = element.get('formatCode', '')
+                    elif tag == f'{{{MAIN_NS}}}cellXfs':
+                        in_cell_xfs = event == 'start'
+                    elif tag == f'{{{MAIN_NS}}}xf' and in_cell_xfs and event == 'start':
+                        fmt_id = int(element.get('numFmtId', 0))
+                        fmt = custom_formats.get(fmt_id, BUILTIN_FORMATS.get(fmt_id, 'General'))
+                        if is_date_format(fmt):
+                            date_styles.add(index)
+                        if is_timedelta_format(fmt):
+                            timedelta_styles.add(index)
+                        index += 1
+        self._date_styles = date_styles
+        self._timedelta_styles = timedelta_styles
+
+    def _sheet_path(self, sheet_name):
+        if sheet_name not in self._sheet_paths:
+            raise KeyError(f"工作表不存在: {sheet_name}")
+        return self._sheet_paths[sheet_name]
+
+    # ------------------------------------------------------------------
+    # 不解析单元格的结构信息
+    # ------------------------------------------------------------------
+    def _scan_sheet(self, sheet_name, pattern, stop_after_first=False):
+        """流式扫描工作表XML的原始字节，返回匹配到的ref列表"""
+        results = []
+        tail = b''
+        with self._zip.open(self._sheet_path(sheet_name)) as f:
+            while True:
+                chunk = f.read(_SCAN_CHUNK_SIZE)
+                if not chunk:
+                    break
+                data = tail + chunk
+                last_end = 0
+                for match in pattern.finditer(data):
+                    results.append(match.group(1).decode('ascii'))
+                    last_end = match.end()
+                    if stop_after_first:
+                        return results
+                # 保留末尾一小段，避免标签被分块边界截断；已匹配的部分不再保留
+                tail = data[max(last_end, len(data) - 256):]
+        return results
+
+    def merged_ranges(self, sheet_name):
+        """合并单元格区域列表，每项为 (min_row, min_col, max_row, max_col)"""
+        return [parse_range(ref) for ref in self._scan_sheet(sheet_name, _MERGE_PATTERN)]
+
+    def dimension(self, sheet_name):
+        """
+        工作表声明的使用区域 (min_row, min_col, max_row, max_col)，
+        只读取XML开头部分；文件未声明时返回None
+        """
+        refs = self._scan_sheet(sheet_name, _DIMENSION_PATTERN, stop_after_first=True)
+        return parse_range(refs[0]) if refs else None
+
+    # ------------------------------------------------------------------
+    # 单元格值
+    # ------------------------------------------------------------------
+    def iter_rows(self, sheet_name, max_row=None, columns=None):
+        """
+        逐行产出值元组，行号从1开始连续，缺失的行产出空元组
+        每个元组的长度为该行最后一个单元格的列号，空单元格为None
+
+        参数:
+        max_row: 只读取到该行为止（可选），读到后立即停止解析
+        columns: 只读取这些列（1开始的列号集合，可选），其他列的单元格不解析、取值为None
+        """
+        if self._date_styles is None:
+            self._load_styles()
+        shared_strings = self.shared_strings
+        date_styles = self._date_styles
+        timedelta_styles = self._timedelta_styles
+        epoch = self.epoch
+        empty = ()
+
+        expected_row = 1
+        with self._zip.open(self._sheet_path(sheet_name)) as f:
+            sheet_data = None
+            for event, element in iterparse(f, events=('start', 'end')):
+                if event == 'start':
+                    if element.tag == _SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if element.tag != _ROW_TAG:
+                    continue
+
+                row_ref = element.get('r')
+                row_number = int(row_ref) if row_ref else expected_row
+                if max_row is not None and row_number > max_row:
+                    break
+                while expected_row < row_number:
+                    yield empty
+                    expected_row += 1
+
+                values = []
+                column = 0
+                for cell in element:
+                    if cell.tag != _CELL_TAG:
+                        continue
+                    ref = cell.get('r')
+                    if ref:
+                        column = column_index(ref.rstrip('0123456789'))
+                    else:
+                        column += 1
+                    if columns is not None and column not in columns:
+                        continue
+                    data_type = cell.get('t', 'n')
+                    if data_type == 'inlineStr':
+                        inline = cell.find(_INLINE_TAG)
+                        value = _text_content(inline) if inline is not None else None
+                    else:
+                        value = cell.findtext(_VALUE_TAG) or None
+                        if value is not None:
+                            if data_type == 'n':
+                                value = _cast_number(value)
+                                style = cell.get('s')
+                                if style and int(style) in date_styles:
+                                    try:
+                                        value = from_excel(value, epoch,
+                                                           timedelta=int(style) in timedelta_styles)
+                                    except (OverflowError, ValueError):
+                                        value = '#VALUE!'
+                            elif data_type == 's':
+                                value = shared_strings[int(value)]
+                            elif data_type == 'b':
+                                value = bool(int(value))
+                            elif data_type == 'd':
+                                value = from_ISO8601(value)
+                    if column > len(values):
+                        values.extend([None] * (column - len(values)))
+                    values[column - 1] = value
+
+                yield tuple(values)
+                expected_row = row_number + 1
+                # 已处理的行立即释放，内存占用与工作表大小无关
+                element.clear()
+                if sheet_data is not None:
+                    sheet_data.clear()
+                if max_row is not None and row_number >= max_row:
+                    break
+
+    def read_sheet(self, sheet_name, columns=None):
+        """
+        读取整个工作表，columns 含义同 iter_rows
+
+        返回:
+        tuple: (rows, merged_ranges, max_row, max_column)
+        max_row/max_column 与openpyxl一致，包含合并区域覆盖到的范围
+        """
+        rows = list(self.iter_rows(sheet_name, columns=columns))
+        merged = self.merged_ranges(sheet_name)
+        max_row = len(rows)
+        max_column = max((len(row) for row in rows), default=0)
+        for min_row, min_col, end_row, end_col in merged:
+            max_row = max(max_row, end_row)
+            max_column = max(max_column, end_col)
+        return rows, merged, max_row, max_column